@@ -0,0 +1,69 @@
+"""
+Probabilistic scoring: a per-entity log-posterior over answers.
+
+Each (entity, question) cell carries a learned P(entity's answer is yes),
+quantized to a uint8 code: 0 means no evidence, 1..255 map linearly onto
+[0, 1]. A stored yes/no answer starts at STORED_CONFIDENCE and every
+later piece of feedback moves the estimate by LEARNING_RATE towards what
+the player said.
+
+Players make mistakes, so an observed answer is modelled as the entity's
+true answer flipped with probability NOISE. With the likelihood of every
+code precomputed in a 256-entry table, folding one answer into the
+posterior is a single gather-and-add over the rows.
+"""
+import numpy as np
+
+from scoring import binary_entropy
+
+NO_EVIDENCE = 0
+NOISE = 0.05
+STORED_CONFIDENCE = 0.95
+LEARNING_RATE = 0.2
+
+# P(yes) for every code; cells without evidence count as a coin flip
+PROBABILITY = np.concatenate([[0.5], np.linspace(0.0, 1.0, 255)])
+# P(the player says yes | code) under the noise model
+SAYS_YES = (1 - NOISE) * PROBABILITY + NOISE * (1 - PROBABILITY)
+# Entropy of the player's answer for every code, in bits
+ANSWER_ENTROPY = binary_entropy(SAYS_YES)
+
+def encode(p: np.ndarray) -> np.ndarray:
+    return (np.rint(np.clip(p, 0.0, 1.0) * 254) + 1).astype(np.uint8)
+
+def from_answers(matrix: np.ndarray) -> np.ndarray:
+    """Codes for a block of stored yes/no/UNKNOWN answers"""
+    codes = np.full(matrix.shape, NO_EVIDENCE, dtype=np.uint8)
+    codes[matrix == 1] = encode(STORED_CONFIDENCE)
+    codes[matrix == 0] = encode(1 - STORED_CONFIDENCE)
+    return codes
+
+def learn(codes: np.ndarray, qids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """An entity's codes after feedback that gave hard answers (qids, values)"""
+    codes = codes.copy()
+    current = codes[qids]
+    observed = values.astype(np.float64)
+    first = current == NO_EVIDENCE
+    p = PROBABILITY[current]
+    p = np.where(first, np.where(observed == 1, STORED_CONFIDENCE, 1 - STORED_CONFIDENCE),
+                 p + LEARNING_RATE * (observed - p))
+    codes[qids] = encode(p)
+    return codes
+
+def log_likelihood(codes: np.ndarray, answer: float) -> np.ndarray:
+    """
+    log P(answer | entity) for a column of codes. Soft answers (the
+    player's P(yes)) mix the yes and no likelihoods.
+    """
+    table = np.log(answer * SAYS_YES + (1 - answer) * (1 - SAYS_YES))
+    return table[codes]
+
+def information_gain(posterior: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    Expected information gain, in bits, of every question for a weighted
+    set of entities: H(answer) - E[H(answer | entity)], where `posterior`
+    weights the rows of the (entities, questions) `codes` block.
+    """
+    posterior = posterior.astype(np.float32)
+    p_yes = posterior @ SAYS_YES.astype(np.float32)[codes]
+    return binary_entropy(p_yes) - posterior @ ANSWER_ENTROPY.astype(np.float32)[codes]
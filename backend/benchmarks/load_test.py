@@ -0,0 +1,285 @@
+"""
+Load test: replay full games against the backend and record latency and throughput.
+
+Games are played the way the frontend plays them: answer questions from a
+synthetic entity's ground truth until the backend guesses or gives up,
+then report the entity through /feedback. The same games run against
+AkinatorRL in-process and, through a FastAPI TestClient, against the app,
+with `--concurrency` games in flight at once. A few questions are added
+at the end to time /add-question.
+
+Besides the solve rate, "+tied" counts wrong guesses the backend could
+not have avoided: by the stored answers, the target matched the game as
+well as the guessed entity. Synthetic entities know only some of their
+answers, so many of them tie for the best match after a few turns.
+
+Results are printed and, with --output, written as JSON for comparing
+revisions.
+
+    python -m benchmarks.load_test --preset builtin --output before.json
+    python -m benchmarks.load_test --entities 200000 --questions 1000 --clients http --concurrency 8
+
+The large preset (1M entities x 10k questions) needs roughly 30 GB of memory.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from knowledge_base import KnowledgeBase
+from rl_model import AkinatorRL
+from sessions import SessionStore
+from benchmarks.synthetic import generate
+
+# (entities, questions)
+PRESETS = {
+    "builtin": (5000, 140),
+    "medium": (100_000, 1000),
+    "large": (1_000_000, 10_000),
+}
+CLIENTS = ("in-process", "http")
+
+class InProcessClient:
+    """Calls the model the way the /predict, /feedback and /add-question handlers do, minus HTTP"""
+
+    def __init__(self, model: AkinatorRL):
+        self.model = model
+        self.sessions = SessionStore()
+
+    def predict(self, answers: Dict[str, int], session_id: Optional[str]) -> dict:
+        state = self.sessions.take(session_id)
+        if state is None:
+            session_id = None
+        result, state = self.model.respond(answers, state)
+        if state is not None:
+            session_id = self.sessions.put(session_id, state)
+        return {"prediction": result.prediction, "next_question": result.next_question, "session_id": session_id}
+
+    def feedback(self, entity: str, answers: Dict[str, int]):
+        self.model.update_from_feedback(entity, answers, True)
+
+    def add_question(self, question: str):
+        self.model.add_question(question)
+
+    def close(self):
+        pass
+
+class HttpClient:
+    """Drives the FastAPI app through a TestClient, serving `model` instead of the app's own"""
+
+    def __init__(self, model: AkinatorRL):
+        from fastapi.testclient import TestClient
+        # Importing main opens (and creates) its default store; keep it out of the working directory
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as scratch:
+            os.chdir(scratch)
+            try:
+                import main
+            finally:
+                os.chdir(cwd)
+        from feedback_queue import FeedbackQueue
+        from game_log import GameLog
+        from imputation import BackgroundImputer
+        from replication import ModelSync
+        main.rl_model = model
+        main.sessions = SessionStore()
+        main.feedback_queue = FeedbackQueue(model)
+        main.model_sync = ModelSync(model)
+        main.imputer = BackgroundImputer(model)
+        # Synthetic games must not reach the log that retrain.py learns from
+        self._game_log_dir = tempfile.TemporaryDirectory()
+        main.game_log = GameLog(self._game_log_dir.name)
+        self.client = TestClient(main.app)
+        self.client.__enter__()
+        while self.client.get("/ready").status_code != 200:
+            time.sleep(0.01)
+
+    def predict(self, answers: Dict[str, int], session_id: Optional[str]) -> dict:
+        response = self.client.post("/predict", json={"answers": answers, "session_id": session_id})
+        response.raise_for_status()
+        return response.json()
+
+    def feedback(self, entity: str, answers: Dict[str, int]):
+        self.client.post("/feedback", json={"entity": entity, "correct": True, "answers": answers}).raise_for_status()
+
+    def add_question(self, question: str):
+        self.client.post("/add-question", params={"question": question}).raise_for_status()
+
+    def close(self):
+        # Drains the feedback queue before returning
+        self.client.__exit__(None, None, None)
+        self._game_log_dir.cleanup()
+
+def match_score(stored_row: np.ndarray, qids: List[int], values: List[int]) -> float:
+    """The match score /predict gives an entity with these stored answers: agreeing share of the known ones"""
+    known = stored_row[qids] >= 0
+    return float((stored_row[qids][known] == np.array(values)[known]).mean()) if known.any() else -1.0
+
+def play(client, truth_row: np.ndarray, truth_ids: Dict[str, int], target: str, max_turns: int,
+         timings: Dict[str, List[float]], stored: np.ndarray, rows: Dict[str, int]):
+    """
+    Play one game and report it; returns (solved, tied, questions answered).
+    A wrong guess is tied when, by the answers stored before the run, the
+    target matches the game's answers as well as the guess did: the
+    backend could not tell the two apart, which sparse synthetic entities
+    make common.
+    """
+    answers: Dict[str, int] = {}
+    session_id = None
+    prediction = None
+    for _ in range(max_turns):
+        start = time.perf_counter()
+        response = client.predict(answers, session_id)
+        timings["predict"].append(time.perf_counter() - start)
+        session_id = response.get("session_id")
+        question = response.get("next_question")
+        if question is None:
+            prediction = response.get("prediction")
+            break
+        # Questions the load test added itself have no ground truth
+        qid = truth_ids.get(question)
+        answers[question] = int(truth_row[qid]) if qid is not None else hash((target, question)) & 1
+
+    tied = False
+    if prediction is not None and prediction != target and prediction in rows:
+        qids = [truth_ids[q] for q in answers if q in truth_ids]
+        values = [answers[q] for q in answers if q in truth_ids]
+        tied = match_score(stored[rows[target]], qids, values) >= match_score(stored[rows[prediction]], qids, values)
+
+    start = time.perf_counter()
+    client.feedback(target, answers)
+    timings["feedback"].append(time.perf_counter() - start)
+    return prediction == target, tied, len(answers)
+
+def percentiles(seconds: List[float]) -> dict:
+    if not seconds:
+        return {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0}
+    ms = np.array(seconds) * 1000
+    return {"count": len(ms), "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def run_client(name: str, kb: KnowledgeBase, truth: np.ndarray, targets: np.ndarray, stored: np.ndarray, args) -> dict:
+    # Feedback rewrites entities, so every client starts from its own copy
+    model = AkinatorRL(kb=kb.compacted(), question_scorer=args.scorer)
+    client = InProcessClient(model) if name == "in-process" else HttpClient(model)
+    truth_ids = {q: i for i, q in enumerate(kb.questions)}
+    names = kb.entity_names
+    rows = kb.entity_ids
+    timings: Dict[str, List[float]] = {"predict": [], "feedback": [], "add_question": []}
+    lock = threading.Lock()
+    outcomes = []
+
+    def game(eid: int):
+        local = {"predict": [], "feedback": []}
+        outcome = play(client, truth[eid], truth_ids, names[eid], args.max_turns, local, stored, rows)
+        with lock:
+            outcomes.append(outcome)
+            for key, values in local.items():
+                timings[key].extend(values)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(game, targets.tolist()))
+        elapsed = time.perf_counter() - start
+        for i in range(args.add_questions):
+            started = time.perf_counter()
+            client.add_question(f"Load test question {i}?")
+            timings["add_question"].append(time.perf_counter() - started)
+    finally:
+        client.close()
+
+    solved = np.array([ok for ok, _, _ in outcomes], dtype=bool)
+    tied = np.array([tie for _, tie, _ in outcomes], dtype=bool)
+    turns = np.array([asked for _, _, asked in outcomes])
+    return {
+        "games": len(outcomes),
+        "games_per_sec": len(outcomes) / elapsed,
+        "solve_rate": float(solved.mean()),
+        # Solved, or guessed an entity the target was tied with
+        "solved_or_tied_rate": float((solved | tied).mean()),
+        "mean_turns": float(turns.mean()),
+        "mean_turns_solved": float(turns[solved].mean()) if solved.any() else None,
+        "predict": percentiles(timings["predict"]),
+        "feedback": percentiles(timings["feedback"]),
+        "add_question": percentiles(timings["add_question"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args) -> dict:
+    start = time.perf_counter()
+    kb, truth = generate(args.entities, args.questions, args.density, seed=args.seed)
+    build_seconds = time.perf_counter() - start
+    snapshot = kb.publish()
+    targets = np.random.default_rng(args.seed + 1).integers(0, kb.num_entities, size=args.games)
+
+    return {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "knowledge_base": {
+            "entities": kb.num_entities,
+            "questions": kb.num_questions,
+            "build_seconds": build_seconds,
+            "matrix_mb": snapshot.matrix.nbytes / (1 << 20),
+            "probabilities_mb": snapshot.probabilities.nbytes / (1 << 20),
+        },
+        "clients": {name: run_client(name, kb, truth, targets, snapshot.matrix, args) for name in args.clients},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--preset", choices=list(PRESETS), default="builtin")
+    parser.add_argument("--entities", type=int, help="overrides the preset")
+    parser.add_argument("--questions", type=int, help="overrides the preset")
+    parser.add_argument("--density", type=float, default=0.6)
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--max-turns", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--add-questions", type=int, default=5)
+    parser.add_argument("--scorer", default="entropy")
+    parser.add_argument("--clients", nargs="+", default=list(CLIENTS), choices=list(CLIENTS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    entities, questions = PRESETS[args.preset]
+    args.entities = args.entities or entities
+    args.questions = args.questions or questions
+
+    results = run(args)
+    kb = results["knowledge_base"]
+    print(f"{kb['entities']} entities x {kb['questions']} questions, built in {kb['build_seconds']:.1f}s, "
+          f"{kb['matrix_mb'] + kb['probabilities_mb']:.1f} MB")
+    print(f"{'client':<12} {'games/s':>8} {'solved':>8} {'+tied':>8} {'turns':>6} {'predict p50/p99 ms':>20} "
+          f"{'feedback p50/p99 ms':>20} {'rss MB':>8}")
+    for name, r in results["clients"].items():
+        print(f"{name:<12} {r['games_per_sec']:>8.1f} {r['solve_rate']:>8.1%} {r['solved_or_tied_rate']:>8.1%} {r['mean_turns']:>6.1f} "
+              f"{r['predict']['p50_ms']:>9.2f} / {r['predict']['p99_ms']:<8.2f} "
+              f"{r['feedback']['p50_ms']:>9.2f} / {r['feedback']['p99_ms']:<8.2f} {r['peak_rss_mb']:>8.0f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare question scorers on simulated games.
+
+Plays the same games against a synthetic knowledge base once per scorer
+and reports turns-to-solve, solve rate and next-question latency.
+
+    python -m benchmarks.question_selection --entities 20000 --questions 500
+"""
+import argparse
+import time
+import numpy as np
+
+from rl_model import AkinatorRL
+from scoring import QUESTION_SCORERS
+from benchmarks.synthetic import generate
+
+def play(model: AkinatorRL, truth_row: np.ndarray, target: str, max_turns: int):
+    """
+    Play one game; returns (solved, questions asked, per-call scoring latencies).
+    A wrong guess is rejected and the game keeps going, as it does for players.
+    """
+    answers = {}
+    state = None
+    latencies = []
+    for _ in range(max_turns):
+        state = model.advance_state(answers, state)
+        prediction, _ = model.predict_for_state(state)
+        if prediction == target:
+            return True, len(answers), latencies
+        start = time.perf_counter()
+        question = model.next_question_for_state(state)
+        latencies.append(time.perf_counter() - start)
+        if question is None:
+            break
+        answers[question] = int(truth_row[model.snapshot.question_ids[question]])
+    return False, len(answers), latencies
+
+def run(args) -> dict:
+    kb, truth = generate(args.entities, args.questions, args.density, seed=args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    targets = rng.integers(0, kb.num_entities, size=args.games)
+
+    results = {}
+    for scorer in args.scorers:
+        model = AkinatorRL(question_scorer=scorer, kb=kb)
+        solved, turns, latencies = 0, [], []
+        for eid in targets:
+            ok, asked, lat = play(model, truth[eid], kb.entity_names[eid], args.max_turns)
+            solved += ok
+            turns.append(asked)
+            latencies.extend(lat)
+        lat_ms = np.array(latencies) * 1000
+        results[scorer] = {
+            "solve_rate": solved / len(targets),
+            "mean_turns": float(np.mean(turns)),
+            "scoring_p50_ms": float(np.percentile(lat_ms, 50)) if len(lat_ms) else 0.0,
+            "scoring_p99_ms": float(np.percentile(lat_ms, 99)) if len(lat_ms) else 0.0,
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entities", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=140)
+    parser.add_argument("--density", type=float, default=0.6)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--max-turns", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scorers", nargs="+", default=list(QUESTION_SCORERS), choices=list(QUESTION_SCORERS))
+    args = parser.parse_args()
+
+    print(f"{'scorer':<10} {'solved':>8} {'turns':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for scorer, r in run(args).items():
+        print(f"{scorer:<10} {r['solve_rate']:>8.1%} {r['mean_turns']:>8.1f} "
+              f"{r['scoring_p50_ms']:>8.2f} {r['scoring_p99_ms']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare match scoring with Bayesian scoring on replayed noisy games.
+
+Simulated players answer from the ground truth but flip each answer with
+probability --noise. Both modes play the same games against the same
+knowledge base; with --train-games the knowledge base first learns from
+that many noisy games reported through /feedback, as a live one would.
+
+    python -m benchmarks.scoring_modes --entities 20000 --noise 0.05
+"""
+import argparse
+import time
+import numpy as np
+
+from rl_model import AkinatorRL, SCORING_MODES
+from benchmarks.synthetic import generate
+
+def play(model: AkinatorRL, truth_row: np.ndarray, target: str, scoring: str,
+         noise: float, rng: np.random.Generator, max_turns: int):
+    """
+    Play one game; returns (solved, answers given, answers, per-turn
+    latencies). A wrong guess is rejected and the game keeps going, as it
+    does for players.
+    """
+    bayesian = scoring == "bayesian"
+    answers = {}
+    state = None
+    latencies = []
+    for _ in range(max_turns):
+        start = time.perf_counter()
+        state = model.advance_state(answers, state, posterior=bayesian)
+        prediction, _ = model.predict_posterior(state) if bayesian else model.predict_for_state(state)
+        if prediction == target:
+            latencies.append(time.perf_counter() - start)
+            return True, len(answers), answers, latencies
+        qid = model.rank_posterior_question(state) if bayesian else model.rank_next_question(state)[0]
+        latencies.append(time.perf_counter() - start)
+        if qid is None:
+            break
+        question = state.snapshot.questions[qid]
+        answers[question] = int(truth_row[qid]) ^ int(rng.random() < noise)
+    return False, len(answers), answers, latencies
+
+def run(args) -> dict:
+    kb, truth = generate(args.entities, args.questions, args.density, seed=args.seed)
+    model = AkinatorRL(kb=kb)
+    rng = np.random.default_rng(args.seed + 1)
+    names = list(kb.entity_names)
+
+    for eid in rng.integers(0, len(names), size=args.train_games):
+        _, _, answers, _ = play(model, truth[eid], names[eid], "match", args.noise, rng, args.max_turns)
+        model.update_from_feedback(names[eid], answers, True)
+
+    targets = rng.integers(0, len(names), size=args.games)
+    results = {}
+    for scoring in args.modes:
+        # Same player mistakes in every mode
+        game_rng = np.random.default_rng(args.seed + 2)
+        solved, turns, latencies = 0, [], []
+        for eid in targets:
+            ok, asked, _, lat = play(model, truth[eid], names[eid], scoring, args.noise, game_rng, args.max_turns)
+            solved += ok
+            turns.append(asked)
+            latencies.extend(lat)
+        lat_ms = np.array(latencies) * 1000
+        results[scoring] = {
+            "solve_rate": solved / len(targets),
+            "mean_turns": float(np.mean(turns)),
+            "turn_p50_ms": float(np.percentile(lat_ms, 50)) if len(lat_ms) else 0.0,
+            "turn_p99_ms": float(np.percentile(lat_ms, 99)) if len(lat_ms) else 0.0,
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entities", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=140)
+    parser.add_argument("--density", type=float, default=0.6)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--train-games", type=int, default=0)
+    parser.add_argument("--max-turns", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", default=list(SCORING_MODES), choices=list(SCORING_MODES))
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'solved':>8} {'turns':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for scoring, r in run(args).items():
+        print(f"{scoring:<10} {r['solve_rate']:>8.1%} {r['mean_turns']:>8.1f} "
+              f"{r['turn_p50_ms']:>8.2f} {r['turn_p99_ms']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
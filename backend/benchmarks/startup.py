@@ -0,0 +1,178 @@
+"""
+Startup benchmark: import time of the app and time until it serves games.
+
+Each run starts a fresh interpreter, so nothing is cached between runs.
+The import run times `import main` and, with -X importtime, lists the
+modules main imports that cost the most. The server run starts uvicorn
+and polls it, recording when /health (the process serves requests) and
+/ready (the model has loaded) first answer 200. It also times the first
+/predict call. The server works on a copy of `--store`, or on a new store
+seeded with the built-in data, so the original is never modified.
+
+Results are printed and, with --output, written as JSON for comparing
+revisions. --max-import-seconds and --max-ready-seconds turn the run into
+a regression check that exits non-zero when the median is over the limit.
+
+    python -m benchmarks.startup --output before.json
+    python -m benchmarks.startup --store model_store --runs 5 --max-ready-seconds 2
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+_IMPORT_MAIN = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+def _env(store: Path) -> Dict[str, str]:
+    env = dict(os.environ, MODEL_STORE=str(store), LOG_LEVEL="WARNING")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(BACKEND), env.get("PYTHONPATH")]))
+    return env
+
+def time_import(scratch: Path) -> float:
+    """Seconds to import main in a new interpreter"""
+    # Importing main opens (and so creates) its store
+    done = subprocess.run([sys.executable, "-c", _IMPORT_MAIN], cwd=scratch, env=_env(scratch / "import_store"),
+                          capture_output=True, text=True, check=True)
+    return float(done.stdout.strip().splitlines()[-1])
+
+def import_profile(scratch: Path, top: int) -> List[Tuple[str, float]]:
+    """main's direct imports that take longest, with their cumulative seconds, from -X importtime"""
+    done = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=scratch,
+                          env=_env(scratch / "model_store"), capture_output=True, text=True, check=True)
+    # "import time: self [us] | cumulative | imported package"; a module's imports are
+    # listed before it, indented two spaces deeper
+    children, direct = [], []
+    for line in done.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append((name.strip(), int(parts[1]) / 1e6))
+        elif depth == 0:
+            if name == "main":
+                direct = children
+            children = []
+    return sorted(direct, key=lambda item: -item[1])[:top]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _get(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+def _post(url: str, body: dict) -> dict:
+    request = urllib.request.Request(url, json.dumps(body).encode(), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.load(response)
+
+def time_server(store: Path, timeout: float) -> Dict[str, float]:
+    """Seconds from launching uvicorn until /health and /ready answer, and the first /predict latency"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=store.parent, env=_env(store))
+    times: Dict[str, float] = {}
+    try:
+        while "ready_seconds" not in times:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"not ready after {timeout:.0f}s")
+            if "health_seconds" not in times and _get(base + "/health") == 200:
+                times["health_seconds"] = time.perf_counter() - start
+            if "health_seconds" in times and _get(base + "/ready") == 200:
+                times["ready_seconds"] = time.perf_counter() - start
+            else:
+                time.sleep(0.005)
+        for name in ("first_predict_ms", "second_predict_ms"):
+            began = time.perf_counter()
+            _post(base + "/predict", {"answers": {}, "stateless": True})
+            times[name] = (time.perf_counter() - began) * 1000
+    finally:
+        # Shutdown is not measured, and a graceful one waits for background work such as imputation
+        server.kill()
+        server.wait()
+    return times
+
+def _median(runs: List[Dict[str, float]], key: str) -> float:
+    return statistics.median(run[key] for run in runs)
+
+def run(args) -> dict:
+    import_runs, server_runs = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as scratch:
+            scratch = Path(scratch)
+            import_runs.append(time_import(scratch))
+            store = scratch / "model_store"
+            if args.store:
+                shutil.copytree(args.store, store)
+            server_runs.append(time_server(store, args.timeout))
+    with tempfile.TemporaryDirectory() as scratch:
+        profile = import_profile(Path(scratch), args.top)
+    return {
+        "python": platform.python_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "import_seconds": statistics.median(import_runs),
+        "import_runs": import_runs,
+        "slowest_imports": [{"module": name, "seconds": seconds} for name, seconds in profile],
+        **{key: _median(server_runs, key) for key in server_runs[0]},
+        "server_runs": server_runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--store", help="model store to start from (copied); default: a new seeded store")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per measurement; the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for /ready")
+    parser.add_argument("--max-import-seconds", type=float, help="fail when importing main takes longer")
+    parser.add_argument("--max-ready-seconds", type=float, help="fail when /ready takes longer")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"import main      {results['import_seconds'] * 1000:8.0f} ms")
+    for entry in results["slowest_imports"]:
+        print(f"  {entry['module']:<28} {entry['seconds'] * 1000:8.0f} ms")
+    print(f"/health          {results['health_seconds'] * 1000:8.0f} ms")
+    print(f"/ready           {results['ready_seconds'] * 1000:8.0f} ms")
+    print(f"first /predict   {results['first_predict_ms']:8.1f} ms (then {results['second_predict_ms']:.1f} ms)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if args.max_import_seconds is not None and results["import_seconds"] > args.max_import_seconds:
+        failures.append(f"import took {results['import_seconds']:.2f}s, limit {args.max_import_seconds:.2f}s")
+    if args.max_ready_seconds is not None and results["ready_seconds"] > args.max_ready_seconds:
+        failures.append(f"/ready took {results['ready_seconds']:.2f}s, limit {args.max_ready_seconds:.2f}s")
+    if failures:
+        sys.exit("; ".join(failures))
+
+if __name__ == "__main__":
+    main()
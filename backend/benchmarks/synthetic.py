@@ -0,0 +1,42 @@
+"""
+Synthetic knowledge bases for benchmarking.
+
+Entities are drawn from latent clusters so answers are correlated the way
+real categories are, and every entity has a complete ground-truth answer
+row that simulated players answer from. Only a `density` fraction of each
+row is revealed to the knowledge base.
+"""
+import numpy as np
+from typing import Tuple
+
+from knowledge_base import KnowledgeBase, UNKNOWN
+from rl_model import DEFAULT_QUESTIONS
+
+def synthetic_questions(num_questions: int):
+    """The built-in questions first, padded with numbered synthetic ones"""
+    questions = list(dict.fromkeys(DEFAULT_QUESTIONS))[:num_questions]
+    questions += [f"Synthetic question {i}?" for i in range(num_questions - len(questions))]
+    return questions
+
+def generate(num_entities: int, num_questions: int, density: float = 0.3,
+             num_clusters: int = 32, seed: int = 0) -> Tuple[KnowledgeBase, np.ndarray]:
+    """Return (knowledge base, ground-truth 0/1 answer matrix)"""
+    rng = np.random.default_rng(seed)
+    questions = synthetic_questions(num_questions)
+
+    # Polarized per-cluster answer rates make most questions near-deterministic within a cluster
+    rates = rng.beta(0.3, 0.3, size=(num_clusters, num_questions)).astype(np.float32)
+    clusters = rng.integers(0, num_clusters, size=num_entities)
+    truth = np.empty((num_entities, num_questions), dtype=np.int8)
+    matrix = np.empty_like(truth)
+    chunk = 65536
+    for start in range(0, num_entities, chunk):
+        stop = min(start + chunk, num_entities)
+        block = rng.random((stop - start, num_questions), dtype=np.float32)
+        truth[start:stop] = block < rates[clusters[start:stop]]
+        known = rng.random((stop - start, num_questions), dtype=np.float32) < density
+        matrix[start:stop] = np.where(known, truth[start:stop], UNKNOWN)
+
+    names = [f"entity-{i}" for i in range(num_entities)]
+    kb = KnowledgeBase.from_arrays(questions, np.ones(num_questions), names, matrix)
+    return kb, truth
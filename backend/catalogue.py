@@ -0,0 +1,255 @@
+"""
+Bulk import and export of the question and entity catalogue.
+
+Three formats are read and written:
+
+    csv      one row per entity: an "entity" column, then one column per
+             question holding 1/0 (or yes/no, true/false); blank is unknown
+    parquet  the same wide layout, read one row group batch at a time
+    ndjson   one object per line, either {"entity": ..., "answers": {...}}
+             or {"question": ..., "weight": ...}
+
+Only an ndjson question record with a "weight" sets a question's weight
+(a finite number above 0). Questions named anywhere else keep the weight
+they have, and new ones start at the default.
+
+Files are read in chunks of `chunk_size` entities, so memory stays flat
+however large the file. import_file reads a file twice: a first pass
+checks every record, so a malformed line rejects the import before
+anything changes. The second pass hands the chunks to
+AkinatorRL.import_catalogue, which journals and applies them a bounded
+group at a time.
+
+    python -m catalogue import entities.csv --store model_store
+    python -m catalogue export catalogue.ndjson --store model_store
+"""
+import argparse
+import csv
+import json
+import math
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from deferred import import_module
+from knowledge_base import ModelSnapshot
+from question_index import normalize_question
+
+FORMATS = ("csv", "ndjson", "parquet")
+ENTITY_COLUMN = "entity"
+CHUNK_SIZE = 1000
+
+_ANSWERS = {"1": 1, "0": 0, "yes": 1, "no": 0, "true": 1, "false": 0, "y": 1, "n": 0}
+
+# {"questions": {question: weight or None}, "entities": {entity: {question: answer}}}
+Chunk = Dict[str, Dict]
+
+def guess_format(path) -> str:
+    suffix = Path(path).suffix.lower().lstrip(".")
+    fmt = {"jsonl": "ndjson", "json": "ndjson", "pq": "parquet"}.get(suffix, suffix)
+    if fmt not in FORMATS:
+        raise ValueError(f"Cannot tell the format of {path}; pass one of {', '.join(FORMATS)}")
+    return fmt
+
+def parse_answer(value) -> Optional[int]:
+    """1 or 0 for a yes/no cell, None for a blank one"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return int(value)
+    if isinstance(value, str) and value.strip().lower() in _ANSWERS:
+        return _ANSWERS[value.strip().lower()]
+    raise ValueError(f"{value!r} is not a yes/no answer")
+
+def _check_question(question, where: Optional[str] = None):
+    if not isinstance(question, str) or not normalize_question(question):
+        raise ValueError(f"{where + ': ' if where else ''}{question!r} is not a question")
+
+class _Chunker:
+    """Accumulates records into chunks of at most `size` entities"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.chunk: Chunk = {"questions": {}, "entities": {}}
+
+    def question(self, question: str, weight: Optional[float] = None):
+        _check_question(question)
+        self.chunk["questions"][question] = weight
+
+    def entity(self, name: str, answers: Dict[str, int]) -> Optional[Chunk]:
+        """Add an entity's answers; returns the finished chunk once it is full"""
+        self.chunk["entities"].setdefault(name, {}).update(answers)
+        if len(self.chunk["entities"]) >= self.size:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[Chunk]:
+        chunk, self.chunk = self.chunk, {"questions": {}, "entities": {}}
+        return chunk if chunk["questions"] or chunk["entities"] else None
+
+def _wide_row(chunker: _Chunker, questions: List[str], name, cells, where: str) -> Optional[Chunk]:
+    if name is None or str(name).strip() == "":
+        raise ValueError(f"{where}: missing entity name")
+    answers = {}
+    for question, cell in zip(questions, cells):
+        try:
+            answer = parse_answer(cell)
+        except ValueError as e:
+            raise ValueError(f"{where}, {question!r}: {e}") from None
+        if answer is not None:
+            answers[question] = answer
+    return chunker.entity(str(name).strip(), answers)
+
+def _read_csv(path, chunker: _Chunker) -> Iterator[Chunk]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header or header[0].strip().lower() != ENTITY_COLUMN:
+            raise ValueError(f"the first column must be {ENTITY_COLUMN!r}")
+        questions = [question.strip() for question in header[1:]]
+        for question in questions:
+            chunker.question(question)
+        for line, row in enumerate(reader, start=2):
+            if not row:
+                continue
+            chunk = _wide_row(chunker, questions, row[0], row[1:], f"line {line}")
+            if chunk is not None:
+                yield chunk
+
+def _read_parquet(path, chunker: _Chunker) -> Iterator[Chunk]:
+    parquet = import_module("pyarrow.parquet")
+    source = parquet.ParquetFile(path)
+    columns = source.schema_arrow.names
+    if ENTITY_COLUMN not in columns:
+        raise ValueError(f"no {ENTITY_COLUMN!r} column")
+    questions = [column for column in columns if column != ENTITY_COLUMN]
+    for question in questions:
+        chunker.question(question)
+    row = 0
+    for batch in source.iter_batches(batch_size=chunker.size):
+        data = batch.to_pydict()
+        for name, *cells in zip(data[ENTITY_COLUMN], *(data[question] for question in questions)):
+            row += 1
+            chunk = _wide_row(chunker, questions, name, cells, f"row {row}")
+            if chunk is not None:
+                yield chunk
+
+def _read_ndjson(path, chunker: _Chunker) -> Iterator[Chunk]:
+    with open(path, encoding="utf-8") as f:
+        for line, text in enumerate(f, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {line}: {e}") from None
+            if not isinstance(record, dict):
+                raise ValueError(f"line {line}: expected a JSON object")
+            if "question" in record:
+                weight = record.get("weight")
+                if not isinstance(record["question"], str):
+                    raise ValueError(f"line {line}: a question needs a string text")
+                if weight is not None:
+                    if isinstance(weight, bool) or not isinstance(weight, (int, float)) \
+                            or not math.isfinite(weight) or weight <= 0:
+                        raise ValueError(f"line {line}: {weight!r} is not a weight; it must be a finite number above 0")
+                    weight = float(weight)
+                chunker.question(record["question"], weight)
+            elif "entity" in record:
+                answers = record.get("answers", {})
+                if not isinstance(answers, dict):
+                    raise ValueError(f"line {line}: answers must be an object")
+                for question in answers:
+                    _check_question(question, f"line {line}")
+                chunk = _wide_row(chunker, list(answers), record["entity"], list(answers.values()), f"line {line}")
+                if chunk is not None:
+                    yield chunk
+            else:
+                raise ValueError(f"line {line}: expected an 'entity' or a 'question' record")
+
+_READERS = {"csv": _read_csv, "parquet": _read_parquet, "ndjson": _read_ndjson}
+
+def read_catalogue(path, fmt: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Chunk]:
+    """Chunks of the catalogue file at `path`; raises ValueError on the first bad record"""
+    chunker = _Chunker(chunk_size)
+    yield from _READERS[fmt or guess_format(path)](path, chunker)
+    chunk = chunker.flush()
+    if chunk is not None:
+        yield chunk
+
+def import_file(model, path, fmt: Optional[str] = None, replace: bool = False,
+                chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+    """Check the whole file, then import it into `model`; returns what was imported"""
+    fmt = fmt or guess_format(path)
+    for _ in read_catalogue(path, fmt, chunk_size):
+        pass
+    return model.import_catalogue(read_catalogue(path, fmt, chunk_size), replace)
+
+def export_catalogue(snapshot: ModelSnapshot, fmt: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """`snapshot`'s catalogue as csv or ndjson text, one chunk of entities at a time"""
+    if fmt == "ndjson":
+        yield "".join(json.dumps({"question": question, "weight": float(weight)}) + "\n"
+                      for question, weight in zip(snapshot.questions, snapshot.weights))
+    elif fmt == "csv":
+        yield _csv_line([ENTITY_COLUMN, *snapshot.questions])
+    else:
+        raise ValueError(f"Cannot stream {fmt!r}; use csv or ndjson")
+    rows = snapshot.live_rows()
+    for start in range(0, len(rows), chunk_size):
+        block = rows[start:start + chunk_size]
+        if fmt == "ndjson":
+            yield "".join(json.dumps({"entity": snapshot.entity_names[row], "answers": snapshot.entity_attributes(row)}) + "\n"
+                          for row in block)
+        else:
+            cells = snapshot.matrix[block].tolist()
+            yield "".join(_csv_line([snapshot.entity_names[row], *("" if v < 0 else str(v) for v in values)])
+                          for row, values in zip(block, cells))
+
+def _csv_line(cells: Iterable[str]) -> str:
+    return ",".join('"' + cell.replace('"', '""') + '"' if any(c in cell for c in ',"\n\r') else cell
+                    for cell in cells) + "\n"
+
+def export_parquet(snapshot: ModelSnapshot, path, chunk_size: int = 65536):
+    """Write `snapshot`'s catalogue to a Parquet file in the wide layout, one row group per chunk"""
+    pa = import_module("pyarrow")
+    parquet = import_module("pyarrow.parquet")
+    schema = pa.schema([(ENTITY_COLUMN, pa.string())] + [(question, pa.int8()) for question in snapshot.questions])
+    rows = snapshot.live_rows()
+    with parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        for start in range(0, len(rows), chunk_size):
+            block = rows[start:start + chunk_size]
+            answers = snapshot.matrix[block]
+            columns = [pa.array([snapshot.entity_names[row] for row in block], pa.string())]
+            columns += [pa.array(answers[:, qid], pa.int8(), mask=answers[:, qid] < 0) for qid in range(snapshot.num_questions)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="file format (default: from the file name)")
+    parser.add_argument("--store", default="model_store", help="model store directory")
+    parser.add_argument("--replace", action="store_true",
+                        help="replace imported entities' answers instead of merging them into the existing ones")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from rl_model import AkinatorRL
+    model = AkinatorRL(store_dir=args.store, opening_depth=0)
+    try:
+        fmt = args.format or guess_format(args.path)
+        if args.command == "import":
+            print(json.dumps(import_file(model, args.path, fmt, args.replace, args.chunk_size)))
+            model.save()
+        elif fmt == "parquet":
+            export_parquet(model.snapshot, args.path)
+        else:
+            with open(args.path, "w", encoding="utf-8", newline="") as f:
+                for text in export_catalogue(model.snapshot, fmt, args.chunk_size):
+                    f.write(text)
+    finally:
+        model.store.close()
+
+if __name__ == "__main__":
+    main()
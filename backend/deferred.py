@@ -0,0 +1,19 @@
+"""
+Deferred imports of heavy optional modules (scikit-learn, scipy).
+
+Importing on first use keeps them off the startup path, but background
+threads and request threads may then import the same package at once,
+and scikit-learn's package initialisation is circular: a second thread
+can be handed the half-initialised module and fail. import_module runs
+every deferred import under one lock.
+"""
+import importlib
+import threading
+from types import ModuleType
+
+_lock = threading.RLock()
+
+def import_module(name: str) -> ModuleType:
+    """importlib.import_module, serialized with every other deferred import"""
+    with _lock:
+        return importlib.import_module(name)
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FeedbackItem = Tuple[str, Dict[str, int], bool]
+
+class FeedbackQueue:
+    """
+    Bounded in-process queue between /feedback and the model.
+
+    A background task drains the queue in micro-batches (up to `max_batch`
+    items, waiting at most `max_delay` seconds to fill one) and applies each
+    batch with AkinatorRL.update_from_feedback_batch in a worker thread, so
+    the event loop never blocks on weight updates or disk writes. When the
+    queue is full, producers wait up to `enqueue_timeout` seconds before the
+    item is rejected.
+    """
+
+    def __init__(self, model, maxsize: int = 10000, max_batch: int = 256,
+                 max_delay: float = 0.05, enqueue_timeout: float = 1.0):
+        self.model = model
+        self.maxsize = maxsize
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {"enqueued": 0, "rejected": 0, "applied": 0, "batches": 0, "failed": 0}
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._worker = asyncio.create_task(self._run())
+
+    async def put(self, entity: str, answers: Dict[str, int], correct: bool) -> bool:
+        """Enqueue one feedback item; False when the queue stayed full (backpressure)"""
+        try:
+            await asyncio.wait_for(self._queue.put((entity, answers, correct)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _next_batch(self) -> Tuple[List[FeedbackItem], bool]:
+        """Collect one micro-batch; the flag is True once the stop sentinel was seen"""
+        batch = []
+        item = await self._queue.get()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.max_batch:
+                return batch, False
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return batch, False
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return batch, False
+        return batch, True
+
+    async def _apply(self, batch: List[FeedbackItem]):
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self.model.update_from_feedback_batch, batch)
+        except Exception:
+            self.stats["failed"] += len(batch)
+            logger.exception("Failed to apply a batch of %d feedback items", len(batch))
+        else:
+            self.stats["applied"] += len(batch)
+            self.stats["batches"] += 1
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            await self._apply(batch)
+
+    async def stop(self):
+        """Apply everything queued so far, then stop the worker"""
+        if self._worker is None:
+            return
+        # Items queued before the sentinel are applied before the worker exits
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
@@ -0,0 +1,111 @@
+"""
+Append-only log of finished games, kept for offline retraining (see retrain.py).
+
+Every game reported through /feedback is stored one answer per row, as
+(game, time, entity, correct, question, answer), in Parquet part files
+with dictionary-encoded strings and zstd compression, so entity and
+question names cost a few bits per row. Rows are buffered in memory and
+written in the background once `flush_rows` have accumulated or
+`flush_seconds` have passed; each part is written to a temporary name
+and renamed, so readers never see a partial file; a failed write puts its
+rows back in the buffer for the next flush. Every worker process writes
+its own parts.
+
+Writing needs pandas and pyarrow; both are only imported on the first
+flush or read.
+"""
+import os
+import random
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+COLUMNS = ("game", "time", "entity", "correct", "question", "answer")
+
+def part_files(directory) -> List[Path]:
+    """The log's finished part files, oldest first"""
+    return sorted(Path(directory).glob("games-*.parquet"))
+
+def read_part(path):
+    """One part file as a DataFrame with the COLUMNS"""
+    import pandas as pd
+    return pd.read_parquet(path, columns=list(COLUMNS))
+
+class GameLog:
+    def __init__(self, directory="game_log", flush_rows: int = 10000, flush_seconds: float = 60.0):
+        self.directory = Path(directory)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._rows: Dict[str, list] = {column: [] for column in COLUMNS}
+        self._last_flush = time.monotonic()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._parts = 0
+        self.stats = {"games": 0, "rows": 0, "parts": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        """Rows waiting to be written"""
+        return len(self._rows["game"])
+
+    def record(self, entity: str, answers: Dict[str, int], correct: bool):
+        """Buffer one finished game; may start a background flush"""
+        game = random.getrandbits(63)
+        now = time.time_ns()
+        with self._lock:
+            rows = self._rows
+            for question, answer in answers.items():
+                rows["game"].append(game)
+                rows["time"].append(now)
+                rows["entity"].append(entity)
+                rows["correct"].append(correct)
+                rows["question"].append(question)
+                rows["answer"].append(answer)
+            self.stats["games"] += 1
+            due = len(rows["game"]) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds
+            if due and not (self._flush_thread and self._flush_thread.is_alive()):
+                self._flush_thread = threading.Thread(target=self.flush, name="game-log-flush", daemon=True)
+                self._flush_thread.start()
+
+    def flush(self) -> Optional[Path]:
+        """Write everything buffered so far to a new part file and return its path"""
+        with self._lock:
+            rows, self._rows = self._rows, {column: [] for column in COLUMNS}
+            self._last_flush = time.monotonic()
+            self._parts += 1
+            part = self._parts
+        if not rows["game"]:
+            return None
+        path = self.directory / f"games-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{part}.parquet"
+        tmp = path.with_name(f".{path.name}.tmp")
+        try:
+            import pandas as pd
+            frame = pd.DataFrame({
+                "game": np.array(rows["game"], dtype=np.int64),
+                "time": pd.to_datetime(np.array(rows["time"], dtype=np.int64), unit="ns", utc=True),
+                "entity": pd.Categorical(rows["entity"]),
+                "correct": np.array(rows["correct"], dtype=bool),
+                "question": pd.Categorical(rows["question"]),
+                "answer": np.array(rows["answer"], dtype=np.int8),
+            })
+            self.directory.mkdir(parents=True, exist_ok=True)
+            frame.to_parquet(tmp, index=False, compression="zstd")
+            os.replace(tmp, path)
+        except Exception:
+            # Put the games back ahead of any recorded since, so the next flush retries them in order
+            with self._lock:
+                for column in COLUMNS:
+                    self._rows[column][:0] = rows[column]
+                self.stats["errors"] += 1
+            tmp.unlink(missing_ok=True)
+            raise
+        self.stats["rows"] += len(frame)
+        self.stats["parts"] += 1
+        return path
+
+    def close(self):
+        """Wait for a running flush, then write whatever is left"""
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+        self.flush()
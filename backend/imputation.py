@@ -0,0 +1,195 @@
+"""
+Fill in entities' unknown answers from similar entities.
+
+Most entities answer only a handful of questions, and every unknown cell
+weakens question splits. Each sparse entity is compared with the others
+on its known answers: the rows are +1/-1 sparse vectors (see
+ModelSnapshot.sparse_answers) and neighbours come from scikit-learn's
+cosine NearestNeighbors. Each neighbour votes on the query's unknown
+cells with its similarity as weight. A cell is filled when the smoothed
+share of the winning side, which is also its confidence, reaches
+`min_confidence`.
+
+Imputed answers become ordinary answers, so they sharpen match scoring.
+Their confidence is stored as the cell's learned probability for
+Bayesian scoring, so a wrong imputation costs less there than a wrong
+stored answer. BackgroundImputer runs all of this off the request path
+whenever enough has changed, and only for entities whose answers changed
+since it last looked at them, at most `batch` of them per run. Neighbours
+are searched among at most `max_candidates` entities, a fixed sample of
+the live ones, so a run costs O(batch x max_candidates) however large the
+knowledge base grows.
+"""
+import logging
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from deferred import import_module
+from knowledge_base import ModelSnapshot, UNKNOWN
+
+logger = logging.getLogger(__name__)
+
+# question -> (answer, confidence)
+Imputed = Dict[str, Tuple[int, float]]
+
+def sparse_rows(snapshot: ModelSnapshot, rows: np.ndarray, max_density: float = 0.5) -> np.ndarray:
+    """The rows among `rows` that know some but at most `max_density` of the questions"""
+    known = np.count_nonzero(snapshot.matrix[rows] != UNKNOWN, axis=1)
+    return rows[(known > 0) & (known <= max_density * snapshot.num_questions)]
+
+def fingerprints(matrix: np.ndarray, rows: np.ndarray, block: int = 16384) -> np.ndarray:
+    """
+    A 64-bit hash of each row's answers. Unknown cells hash as zero and the
+    column weights do not depend on the number of questions, so adding a
+    question leaves every fingerprint unchanged.
+    """
+    weights = np.random.default_rng(0).integers(1, 1 << 63, size=matrix.shape[1], dtype=np.uint64)
+    out = np.empty(len(rows), dtype=np.uint64)
+    for start in range(0, len(rows), block):
+        # Wrapping uint64 arithmetic is the hash
+        out[start:start + block] = (matrix[rows[start:start + block]].astype(np.uint64) + np.uint64(1)) @ weights
+    return out
+
+def impute(snapshot: ModelSnapshot, neighbours: int = 20, min_confidence: float = 0.8,
+           max_density: float = 0.5, rows: Optional[np.ndarray] = None,
+           max_candidates: int = 50000) -> Dict[str, Imputed]:
+    """
+    Answers to fill for every live entity (or every one of `rows`) that
+    knows at most `max_density` of the questions, keyed by entity name.
+    Neighbours come from at most `max_candidates` live entities.
+    """
+    sparse = import_module("scipy.sparse")
+    NearestNeighbors = import_module("sklearn.neighbors").NearestNeighbors
+
+    live = snapshot.live_rows()
+    queries = sparse_rows(snapshot, live if rows is None else rows, max_density)
+    candidates = live[np.count_nonzero(snapshot.matrix[live] != UNKNOWN, axis=1) > 0]
+    if len(candidates) > max_candidates:
+        # A fixed sample, so consecutive runs see the same neighbourhoods; queries search it too
+        sample = np.random.default_rng(0).choice(len(candidates), max_candidates, replace=False)
+        candidates = np.union1d(candidates[sample], queries)
+    if not len(queries) or len(candidates) < 2:
+        return {}
+
+    vectors = snapshot.sparse_answers(candidates)
+    # Each candidate's yes and no answers as separate 0/1 sparse matrices
+    says_yes = (vectors > 0).astype(np.float32)
+    says_no = (vectors < 0).astype(np.float32)
+    index = NearestNeighbors(n_neighbors=min(neighbours + 1, len(candidates)), metric="cosine", algorithm="brute")
+    # Sparse products only pay off on sparse data; small dense-ish knowledge bases search faster dense
+    dense = vectors.nnz > 0.1 * vectors.shape[0] * vectors.shape[1] and vectors.shape[0] * vectors.shape[1] <= 1 << 26
+    searched = vectors.toarray().astype(np.float32) if dense else vectors
+    index.fit(searched)
+    position = {row: i for i, row in enumerate(candidates.tolist())}
+    imputed: Dict[str, Imputed] = {}
+    for start in range(0, len(queries), 4096):
+        rows = queries[start:start + 4096]
+        distances, found = index.kneighbors(searched[[position[row] for row in rows.tolist()]])
+        # Drop each entity from its own neighbours; zero or negative similarity gets no vote
+        similarity = np.where(candidates[found] == rows[:, None], 0.0, np.clip(1.0 - distances, 0.0, None))
+        votes = sparse.csr_matrix((similarity.ravel().astype(np.float32), found.ravel(),
+                                   np.arange(0, found.size + 1, found.shape[1])), shape=(len(rows), len(candidates)))
+        yes = (votes @ says_yes).toarray()
+        no = (votes @ says_no).toarray()
+        # Laplace-smoothed share of the winning side, so one close neighbour is not certainty
+        confidence = (np.maximum(yes, no) + 1.0) / (yes + no + 2.0)
+        fill = (snapshot.matrix[rows] == UNKNOWN) & (confidence >= min_confidence)
+        for i, qid in zip(*np.nonzero(fill)):
+            imputed.setdefault(snapshot.entity_names[rows[i]], {})[snapshot.questions[qid]] = (
+                int(yes[i, qid] >= no[i, qid]), float(confidence[i, qid]))
+    return imputed
+
+class BackgroundImputer:
+    """
+    Thread that re-runs imputation on the writer once at least
+    `min_changes` model versions have been published since the last run,
+    or while changed entities are still waiting, checking every `interval`
+    seconds. Readers receive the result through the journal like any other
+    change.
+    """
+
+    def __init__(self, model, interval: float = 300.0, min_changes: int = 100, batch: int = 5000, **options):
+        self.model = model
+        self.interval = interval
+        self.min_changes = min_changes
+        self.batch = batch
+        self.options = options
+        self._last_version: Optional[int] = None
+        # Fingerprint of each entity's answers when it was last imputed or found dense
+        self._seen: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"runs": 0, "entities": 0, "cells": 0, "backlog": 0, "errors": 0}
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="imputer", daemon=True)
+        self._thread.start()
+
+    def run_once(self) -> int:
+        """
+        Impute the entities whose answers changed since they were last
+        looked at, up to `batch` of them, and apply the result; returns the
+        number of cells filled
+        """
+        snapshot = self.model.snapshot
+        live = snapshot.live_rows()
+        names = [snapshot.entity_names[row] for row in live.tolist()]
+        prints = fingerprints(snapshot.matrix, live).tolist()
+        # Entities that were removed since are forgotten
+        seen = {name: self._seen[name] for name in names if name in self._seen}
+        changed = np.array([i for i, (name, value) in enumerate(zip(names, prints)) if seen.get(name) != value], dtype=np.intp)
+        queued = sparse_rows(snapshot, live[changed], self.options.get("max_density", 0.5))
+        batch = queued[:self.batch]
+        # Changed entities that are not sparse, and this batch, are done with until they change again
+        done = np.setdiff1d(live[changed], queued[self.batch:])
+        for i in np.searchsorted(live, done).tolist():
+            seen[names[i]] = prints[i]
+
+        imputed = impute(snapshot, rows=batch, **self.options) if len(batch) else {}
+        cells = sum(len(answers) for answers in imputed.values())
+        if imputed:
+            self.model.apply_imputation(imputed)
+            # The imputed entities' new rows are the old ones with the fills, so our own change counts as seen
+            position = {name: i for i, name in enumerate(names)}
+            rows = np.array([live[position[name]] for name in imputed], dtype=np.intp)
+            filled = snapshot.matrix[rows]
+            for i, answers in enumerate(imputed.values()):
+                for question, (answer, _) in answers.items():
+                    filled[i, snapshot.question_ids[question]] = answer
+            for name, value in zip(imputed, fingerprints(filled, np.arange(len(rows))).tolist()):
+                seen[name] = value
+        self._seen = seen
+        self._last_version = self.model.snapshot.version
+        self.stats["runs"] += 1
+        self.stats["entities"] += len(imputed)
+        self.stats["cells"] += cells
+        self.stats["backlog"] = len(queued) - len(batch)
+        return cells
+
+    def _due(self) -> bool:
+        if not self.model.is_writer:
+            return False
+        version = self.model.snapshot.version
+        return (self._last_version is None or self.stats["backlog"] > 0
+                or version - self._last_version >= self.min_changes)
+
+    def _run(self):
+        # First pass right away, then whenever enough has changed
+        while not self._stop.is_set():
+            try:
+                if self._due():
+                    cells = self.run_once()
+                    logger.info("Imputed %d answers", cells)
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Imputation failed")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,557 @@
+from contextlib import contextmanager
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import bayes
+from deferred import import_module
+from postings import PostingIndex
+from question_index import normalize_question
+from shards import ShardIndex, group_rows
+
+# Sentinel stored in the answer matrix when an entity has no answer for a question
+UNKNOWN = -1
+
+class StringTable:
+    """
+    Append-only sequence of strings.
+
+    The base part can be a UTF-8 blob plus an int64 offsets array (e.g. views
+    into a memory-mapped snapshot) that is decoded one entry at a time on
+    access; strings appended later are kept in a plain list.
+    """
+
+    def __init__(self, strings: Iterable[str] = (), offsets: Optional[np.ndarray] = None, blob: Optional[np.ndarray] = None):
+        self._offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self._blob = blob if blob is not None else np.empty(0, dtype=np.uint8)
+        self._base_len = len(self._offsets) - 1
+        self._extra: List[str] = list(strings)
+
+    def __len__(self) -> int:
+        return self._base_len + len(self._extra)
+
+    def _get(self, i: int) -> str:
+        if i < self._base_len:
+            return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+        return self._extra[i - self._base_len]
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            return [self._get(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string table index out of range")
+        return self._get(i)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def append(self, value: str):
+        self._extra.append(value)
+
+class KnowledgeBase:
+    """
+    Writer-side store of entities and questions.
+
+    Questions and entity rows get dense integer ids in insertion order.
+    Answers live in an int8 matrix of shape (rows, questions) holding 1
+    (yes), 0 (no) or UNKNOWN. A parallel uint8 matrix holds the learned
+    answer probabilities used by Bayesian scoring (see bayes.py). Both axes
+    are over-allocated so adding an entity or a question is amortized O(1)
+    instead of a full reallocation.
+
+    Rows are append-only: replacing an entity tombstones its old row and
+    appends a new one, and a new question's column is already UNKNOWN. Rows
+    and columns that a published ModelSnapshot can see are therefore never
+    written again, which is what lets readers use snapshots without locks.
+    Only one thread may mutate a KnowledgeBase at a time.
+    """
+
+    def __init__(self, questions: Iterable[str] = (), weights: Optional[Mapping[str, float]] = None):
+        self.questions: List[str] = []
+        self.question_ids: Dict[str, int] = {}
+        # normalize_question(question) -> id, so spelling variants resolve to one question
+        self.question_keys: Dict[str, int] = {}
+        self.entity_names = StringTable()
+        self._entity_ids: Optional[Dict[str, int]] = {}
+        self._matrix = np.full((16, 16), UNKNOWN, dtype=np.int8)
+        self._probabilities = np.zeros((16, 16), dtype=np.uint8)
+        self._live = np.zeros(16, dtype=bool)
+        self._weights = np.ones(16, dtype=np.float64)
+        self.version = 0
+        # Bumped whenever row ids are renumbered (compaction)
+        self.epoch = 0
+        self._published_questions: Optional[Tuple[Tuple[str, ...], Dict[str, int], Dict[str, int]]] = None
+        # (question, answer) -> rows index, built on first publish and then kept up to date
+        self._postings: Optional[PostingIndex] = None
+        # Live entities answering yes (row 0) and no (row 1) per question, maintained the same way
+        self._answer_counts: Optional[np.ndarray] = None
+        # Shard index read along with a snapshot file, whose row layout it describes; see snapshot.py
+        self.shards: Optional[ShardIndex] = None
+
+        weights = weights or {}
+        for question in questions:
+            self.add_question(question, weights.get(question, 1.0))
+
+    @classmethod
+    def from_arrays(cls, questions: List[str], weights: np.ndarray, entity_names: Sequence[str], matrix: np.ndarray,
+                    probabilities: Optional[np.ndarray] = None) -> "KnowledgeBase":
+        """
+        Build a knowledge base directly from a prepared answer matrix with one
+        live row per entity. The matrix may be larger than (entities,
+        questions); the extra rows and columns must hold UNKNOWN and are used
+        as spare capacity. Arrays are used as-is, so a copy-on-write memmap
+        stays shared until written. Without a probability matrix of the same
+        shape, one is derived from the stored answers.
+        """
+        kb = cls()
+        kb.questions = list(questions)
+        kb.question_ids = {q: i for i, q in enumerate(kb.questions)}
+        # Duplicates from before questions were normalized keep the first id; see duplicate_questions
+        for qid, question in enumerate(kb.questions):
+            kb.question_keys.setdefault(normalize_question(question), qid)
+        kb.entity_names = entity_names if isinstance(entity_names, StringTable) else StringTable(entity_names)
+        kb._entity_ids = None
+        kb._matrix = matrix if matrix.dtype == np.int8 else np.ascontiguousarray(matrix, dtype=np.int8)
+        kb._probabilities = probabilities if probabilities is not None else bayes.from_answers(kb._matrix)
+        kb._live = np.zeros(matrix.shape[0], dtype=bool)
+        kb._live[:len(kb.entity_names)] = True
+        kb._weights = np.array(weights, dtype=np.float64)
+        return kb
+
+    @property
+    def entity_ids(self) -> Dict[str, int]:
+        """Entity name -> live row id, built on first use so opening a large snapshot stays cheap"""
+        if self._entity_ids is None:
+            live = self._live[:self.num_rows]
+            self._entity_ids = {name: i for i, name in enumerate(self.entity_names) if live[i]}
+        return self._entity_ids
+
+    @property
+    def postings(self) -> PostingIndex:
+        if self._postings is None:
+            self._postings = PostingIndex.build(self._matrix, self.num_rows, self.num_questions)
+        return self._postings
+
+    def restore_indexes(self, postings: PostingIndex, answer_counts: np.ndarray):
+        """Install the posting index and answer counts saved with the rows, instead of building them from the matrix"""
+        self._postings = postings
+        self._answer_counts = answer_counts
+
+    @property
+    def answer_counts(self) -> np.ndarray:
+        """(2, questions) counts of live entities answering yes and no"""
+        if self._answer_counts is None:
+            counts = np.zeros((2, self._matrix.shape[1]), dtype=np.int64)
+            live = self._live[:self.num_rows]
+            for start in range(0, self.num_rows, 65536):
+                block = self._matrix[start:min(start + 65536, self.num_rows)][live[start:start + 65536]]
+                counts[0] += np.count_nonzero(block == 1, axis=0)
+                counts[1] += np.count_nonzero(block == 0, axis=0)
+            self._answer_counts = counts
+        return self._answer_counts
+
+    @property
+    def num_questions(self) -> int:
+        return len(self.questions)
+
+    @property
+    def num_rows(self) -> int:
+        """Rows ever written, including tombstoned ones"""
+        return len(self.entity_names)
+
+    @property
+    def num_entities(self) -> int:
+        return int(np.count_nonzero(self._live[:self.num_rows]))
+
+    @property
+    def num_dead_rows(self) -> int:
+        return self.num_rows - self.num_entities
+
+    @property
+    def weights(self) -> np.ndarray:
+        """View of the per-question weight vector, indexed by question id"""
+        return self._weights[:self.num_questions]
+
+    def _reserve(self, rows: int, cols: int):
+        """
+        Grow the backing arrays geometrically so they hold at least rows x cols.
+        Growing allocates new arrays, so published snapshots keep the old ones.
+        """
+        cur_rows, cur_cols = self._matrix.shape
+        if rows > cur_rows or cols > cur_cols:
+            new_rows = max(rows, cur_rows * 2) if rows > cur_rows else cur_rows
+            new_cols = max(cols, cur_cols * 2) if cols > cur_cols else cur_cols
+            grown = np.full((new_rows, new_cols), UNKNOWN, dtype=np.int8)
+            grown[:cur_rows, :cur_cols] = self._matrix
+            self._matrix = grown
+            grown_probabilities = np.zeros((new_rows, new_cols), dtype=np.uint8)
+            grown_probabilities[:cur_rows, :cur_cols] = self._probabilities
+            self._probabilities = grown_probabilities
+            grown_live = np.zeros(new_rows, dtype=bool)
+            grown_live[:cur_rows] = self._live
+            self._live = grown_live
+            if self._answer_counts is not None and new_cols > cur_cols:
+                self._answer_counts = np.pad(self._answer_counts, ((0, 0), (0, new_cols - cur_cols)))
+        if cols > len(self._weights):
+            grown_weights = np.ones(self._matrix.shape[1], dtype=np.float64)
+            grown_weights[:len(self._weights)] = self._weights
+            self._weights = grown_weights
+
+    def add_question(self, question: str, weight: float = 1.0) -> int:
+        """
+        Register a question and return its id. A question that normalizes
+        like an existing one is that question and gets its id.
+        """
+        if question in self.question_ids:
+            return self.question_ids[question]
+        key = normalize_question(question)
+        if key in self.question_keys:
+            return self.question_keys[key]
+        qid = self.num_questions
+        self._reserve(self.num_rows, qid + 1)
+        self._weights[qid] = weight
+        self.questions.append(question)
+        self.question_ids[question] = qid
+        self.question_keys[key] = qid
+        self._published_questions = None
+        if self._postings is not None:
+            self._postings.add_question()
+        self.version += 1
+        return qid
+
+    def set_entity(self, name: str, attributes: Mapping[str, int]) -> int:
+        """
+        Create or replace an entity's answers and return its new row id.
+        Answers to questions that are not registered are ignored.
+        """
+        qids, values = self.encode(attributes)
+        return self._append_row(name, qids, values, qids, values)
+
+    def update_entity(self, name: str, attributes: Mapping[str, int]) -> int:
+        """
+        Set some of an entity's answers, keeping the others, and return its
+        new row id; an entity that does not exist yet is created
+        """
+        qids, values = self.encode(attributes)
+        previous = self.entity_ids.get(name)
+        if previous is None:
+            return self._append_row(name, qids, values, qids, values)
+        answers = self._matrix[previous, :self.num_questions].copy()
+        answers[qids] = values
+        known = np.flatnonzero(answers != UNKNOWN)
+        return self._append_row(name, known, answers[known], qids, values)
+
+    def update_entities(self, entities: Mapping[str, Mapping[str, int]], replace: bool = False):
+        """
+        update_entity, or set_entity with `replace`, for many entities at
+        once; their rows are added to the posting index in one pass
+        instead of one answer at a time
+        """
+        update = self.set_entity if replace else self.update_entity
+        with self._bulk_postings():
+            for name, attributes in entities.items():
+                update(name, attributes)
+
+    @contextmanager
+    def _bulk_postings(self):
+        """Index the rows appended inside the block in one pass when it exits"""
+        postings, self._postings = self._postings, None
+        first = self.num_rows
+        try:
+            yield
+        finally:
+            self._postings = postings
+            if postings is not None:
+                postings.add_rows(first, self._matrix[first:self.num_rows, :self.num_questions])
+
+    def fill_entity(self, name: str, attributes: Mapping[str, int],
+                    confidence: Optional[Mapping[str, float]] = None) -> Optional[int]:
+        """
+        Answer the questions an existing entity has no answer for, keeping
+        its other answers. A `confidence` per question (the probability the
+        answer is right) becomes the cell's learned probability instead of
+        the usual first-observation estimate. Returns the entity's new row
+        id, or None when it does not exist or nothing was unknown.
+        """
+        previous = self.entity_ids.get(name)
+        if previous is None:
+            return None
+        qids, values = self.encode(attributes)
+        unknown = self._matrix[previous, qids] == UNKNOWN
+        if not unknown.any():
+            return None
+        known = np.flatnonzero(self._matrix[previous, :self.num_questions] != UNKNOWN)
+        fill_qids, fill_values = qids[unknown], values[unknown]
+        row = self._append_row(name, np.concatenate([known, fill_qids]),
+                               np.concatenate([self._matrix[previous, known], fill_values]), fill_qids, fill_values)
+        if confidence:
+            # The row is not published yet, so its probabilities can still be written
+            for qid, value in zip(fill_qids, fill_values):
+                p = confidence.get(self.questions[qid])
+                if p is not None:
+                    self._probabilities[row, qid] = bayes.encode(p if value == 1 else 1.0 - p)
+        return row
+
+    def fill_entities(self, entities: Mapping[str, Mapping[str, int]],
+                      confidence: Optional[Mapping[str, Mapping[str, float]]] = None):
+        """fill_entity for many entities at once, indexing their rows in one pass"""
+        with self._bulk_postings():
+            for name, attributes in entities.items():
+                self.fill_entity(name, attributes, confidence.get(name) if confidence else None)
+
+    def _append_row(self, name: str, qids: np.ndarray, values: np.ndarray,
+                    observed_qids: np.ndarray, observed_values: np.ndarray) -> int:
+        """Append `name`'s new row with answers (qids, values), tombstoning its previous one"""
+        previous = self.entity_ids.get(name)
+        row = self.num_rows
+        self._reserve(row + 1, self.num_questions)
+        self._matrix[row, qids] = values
+        # Learned probabilities carry over from the entity's previous row and learn from what was observed
+        learned = self._probabilities[previous] if previous is not None else np.zeros(self._matrix.shape[1], dtype=np.uint8)
+        self._probabilities[row] = bayes.learn(learned, observed_qids, observed_values)
+        self._live[row] = True
+        if self._postings is not None:
+            self._postings.add_row(row, qids, values)
+        if self._answer_counts is not None:
+            np.add.at(self._answer_counts, (1 - values, qids), 1)
+            if previous is not None:
+                old = self._matrix[previous, :self.num_questions]
+                self._answer_counts[0, :self.num_questions] -= old == 1
+                self._answer_counts[1, :self.num_questions] -= old == 0
+        self.entity_names.append(name)
+        if previous is not None:
+            self._live[previous] = False
+        self.entity_ids[name] = row
+        self.version += 1
+        return row
+
+    def scale_weights(self, qids: np.ndarray, factors: np.ndarray):
+        """Multiply question weights in place; repeated ids compound"""
+        np.multiply.at(self.weights, qids, factors)
+        self.version += 1
+
+    def set_weights(self, weights: np.ndarray):
+        """Replace every question weight at once"""
+        self.weights[:] = weights
+        self.version += 1
+
+    def compacted(self, shard_gates: Optional[np.ndarray] = None) -> "KnowledgeBase":
+        """
+        Copy holding only live rows, renumbered and, given the category gate
+        question ids, grouped by shard (see shards.py); bumps the epoch
+        """
+        rows = np.flatnonzero(self._live[:self.num_rows])
+        if shard_gates is not None:
+            rows = group_rows(self._matrix, rows, shard_gates)
+        matrix = np.full((max(len(rows), 16), self._matrix.shape[1]), UNKNOWN, dtype=np.int8)
+        matrix[:len(rows)] = self._matrix[rows]
+        probabilities = np.zeros(matrix.shape, dtype=np.uint8)
+        probabilities[:len(rows)] = self._probabilities[rows]
+        kb = KnowledgeBase.from_arrays(
+            self.questions, self._weights.copy(), [self.entity_names[r] for r in rows], matrix, probabilities
+        )
+        kb.version = self.version + 1
+        kb.epoch = self.epoch + 1
+        return kb
+
+    def duplicate_questions(self) -> Dict[int, int]:
+        """Ids of questions that normalize like an earlier question, mapped to that question's id"""
+        if len(self.question_keys) == self.num_questions:
+            return {}
+        duplicates = {}
+        for qid, question in enumerate(self.questions):
+            first = self.question_keys[normalize_question(question)]
+            if first != qid:
+                duplicates[qid] = first
+        return duplicates
+
+    def folded(self) -> "KnowledgeBase":
+        """
+        Compacted copy with every duplicate question folded into the first
+        question it duplicates: that question keeps its id's answers and
+        weight and takes the duplicate's answers where it has none. Bumps
+        the epoch.
+        """
+        duplicates = self.duplicate_questions()
+        rows = np.flatnonzero(self._live[:self.num_rows])
+        matrix = self._matrix[rows, :self.num_questions]
+        probabilities = self._probabilities[rows, :self.num_questions]
+        for drop, keep in duplicates.items():
+            fill = (matrix[:, keep] == UNKNOWN) & (matrix[:, drop] != UNKNOWN)
+            matrix[fill, keep] = matrix[fill, drop]
+            probabilities[fill, keep] = probabilities[fill, drop]
+        kept = np.array([qid for qid in range(self.num_questions) if qid not in duplicates], dtype=np.intp)
+        shape = (max(len(rows), 16), max(len(kept), 16))
+        folded_matrix = np.full(shape, UNKNOWN, dtype=np.int8)
+        folded_matrix[:len(rows), :len(kept)] = matrix[:, kept]
+        folded_probabilities = np.zeros(shape, dtype=np.uint8)
+        folded_probabilities[:len(rows), :len(kept)] = probabilities[:, kept]
+        weights = np.ones(shape[1], dtype=np.float64)
+        weights[:len(kept)] = self.weights[kept]
+        kb = KnowledgeBase.from_arrays(
+            [self.questions[qid] for qid in kept], weights, [self.entity_names[r] for r in rows],
+            folded_matrix, folded_probabilities
+        )
+        kb.version = self.version + 1
+        kb.epoch = self.epoch + 1
+        return kb
+
+    def question_id(self, question: str) -> Optional[int]:
+        """Id of the registered question `question` is, or normalizes like, if any"""
+        return lookup_question(self.question_ids, self.question_keys, question)
+
+    def encode(self, answers: Mapping[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Translate a {question: answer} dict into parallel (question ids, values) arrays"""
+        return encode_answers(self.question_ids, answers, self.question_keys)
+
+    def publish(self, **extra) -> "ModelSnapshot":
+        """Immutable view of the current state for lock-free readers"""
+        if self._published_questions is None:
+            self._published_questions = (tuple(self.questions), dict(self.question_ids), dict(self.question_keys))
+        questions, question_ids, question_keys = self._published_questions
+        n = self.num_rows
+        return ModelSnapshot(
+            version=self.version,
+            epoch=self.epoch,
+            questions=questions,
+            question_ids=question_ids,
+            question_keys=question_keys,
+            matrix=self._matrix[:n, :len(questions)],
+            probabilities=self._probabilities[:n, :len(questions)],
+            live=self._live[:n].copy(),
+            weights=self.weights.copy(),
+            entity_names=self.entity_names,
+            postings=self.postings,
+            answer_counts=self.answer_counts[:, :len(questions)].copy(),
+            **extra,
+        )
+
+def lookup_question(question_ids: Mapping[str, int], question_keys: Mapping[str, int], question: str) -> Optional[int]:
+    """Id of `question` by its exact text, else by its normalized form (another spelling of a registered question)"""
+    qid = question_ids.get(question)
+    if qid is None:
+        qid = question_keys.get(normalize_question(question))
+    return qid
+
+def encode_answers(question_ids: Mapping[str, int], answers: Mapping[str, int],
+                   question_keys: Optional[Mapping[str, int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parallel (question ids, values) arrays for the answers to registered
+    questions; with `question_keys`, other spellings of them count too (the
+    last of several spellings of one question wins)
+    """
+    encoded: Dict[int, int] = {}
+    for question, answer in answers.items():
+        qid = question_ids.get(question)
+        if qid is None and question_keys is not None:
+            qid = question_keys.get(normalize_question(question))
+        if qid is not None:
+            encoded[qid] = 1 if answer == 1 else 0
+    return np.array(list(encoded), dtype=np.intp), np.array(list(encoded.values()), dtype=np.int8)
+
+class ModelSnapshot:
+    """
+    Read-only, versioned view of a KnowledgeBase.
+
+    Readers grab one snapshot and use it for a whole request. The matrix is
+    a view of rows and columns the writer never touches again, the live mask
+    and weights are private copies and the question tables are shared only
+    between snapshots with the same question set, so no lock is needed.
+    Row ids are stable for a given epoch. The posting index is shared with
+    the writer, which only ever adds rows past this snapshot's, so it is
+    read clipped to num_rows.
+    """
+
+    def __init__(self, version: int, epoch: int, questions: Tuple[str, ...], question_ids: Dict[str, int],
+                 question_keys: Dict[str, int], matrix: np.ndarray, probabilities: np.ndarray, live: np.ndarray, weights: np.ndarray,
+                 entity_names: StringTable, postings: PostingIndex, answer_counts: np.ndarray, **extra):
+        self.version = version
+        self.epoch = epoch
+        self.questions = questions
+        self.question_ids = question_ids
+        self.question_keys = question_keys
+        self.matrix = matrix
+        self.probabilities = probabilities
+        self.live = live
+        self.weights = weights
+        self.entity_names = entity_names
+        self.postings = postings
+        self.answer_counts = answer_counts
+        self.num_entities = int(np.count_nonzero(live))
+        self._entity_ids: Optional[Dict[str, int]] = None
+        for view in (matrix, probabilities, live, weights, answer_counts):
+            view.flags.writeable = False
+        # Derived structures compiled by the model (e.g. the relevance index)
+        self.__dict__.update(extra)
+
+    @property
+    def num_questions(self) -> int:
+        return len(self.questions)
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.live)
+
+    def question_id(self, question: str) -> Optional[int]:
+        """Id of the registered question `question` is, or normalizes like, if any"""
+        return lookup_question(self.question_ids, self.question_keys, question)
+
+    def find_question(self, question: str) -> Optional[str]:
+        """The registered question `question` is, or normalizes like, if any"""
+        qid = self.question_id(question)
+        return self.questions[qid] if qid is not None else None
+
+    def encode(self, answers: Mapping[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        return encode_answers(self.question_ids, answers, self.question_keys)
+
+    @property
+    def entity_ids(self) -> Dict[str, int]:
+        """Entity name -> live row id, built on first use and kept, as the snapshot never changes"""
+        if self._entity_ids is None:
+            names = self.entity_names
+            self._entity_ids = {names[row]: int(row) for row in self.live_rows()}
+        return self._entity_ids
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.live)
+
+    @property
+    def question_density(self) -> np.ndarray:
+        """Fraction of live entities with a known answer to each question"""
+        return self.answer_counts.sum(axis=0) / max(self.num_entities, 1)
+
+    def sparse_answers(self, rows: Optional[np.ndarray] = None):
+        """
+        CSR matrix of the given rows' answers (every row by default): +1 for
+        yes, -1 for no and no stored entry for unknown, built one block of
+        rows at a time
+        """
+        sparse = import_module("scipy.sparse")
+        rows = np.arange(self.num_rows) if rows is None else np.asarray(rows)
+        blocks = []
+        for start in range(0, len(rows), 65536):
+            block = self.matrix[rows[start:start + 65536]]
+            signed = np.where(block == UNKNOWN, 0, 2 * block.astype(np.int8) - 1).astype(np.int8)
+            blocks.append(sparse.csr_matrix(signed))
+        if not blocks:
+            return sparse.csr_matrix((0, self.num_questions), dtype=np.int8)
+        return sparse.vstack(blocks, format="csr")
+
+    def entity_attributes(self, row: int) -> Dict[str, int]:
+        """Dict view of a single entity's known answers"""
+        values = self.matrix[row]
+        known = np.flatnonzero(values != UNKNOWN)
+        return {self.questions[qid]: int(values[qid]) for qid in known}
+
+    def to_dict(self, rows: Optional[np.ndarray] = None) -> Dict[str, Dict[str, int]]:
+        """Dict-of-dicts view of the given rows (every live entity by default)"""
+        rows = self.live_rows() if rows is None else rows
+        return {self.entity_names[row]: self.entity_attributes(row) for row in rows}
+
+    def sample_entities(self, n: int) -> List[str]:
+        return [self.entity_names[row] for row in self.live_rows()[:n]]
+
+    def weights_dict(self) -> Dict[str, float]:
+        return {question: float(weight) for question, weight in zip(self.questions, self.weights)}
@@ -1,13 +1,68 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Optional, List
-import joblib
-from pathlib import Path
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Annotated, Dict, Optional, List, Literal
+from contextlib import asynccontextmanager
 from rl_model import AkinatorRL
+from sessions import SessionStore
+from feedback_queue import FeedbackQueue
+from catalogue import export_catalogue, import_file
+from game_log import GameLog
+from imputation import BackgroundImputer
+from question_index import FLAG_SIMILARITY
+from replication import ModelSync
+from metrics import REGISTRY, RequestTimer
+from profiler import SamplingProfiler
+import asyncio
+import json
 import logging
+import math
+import os
+import random
+import tempfile
+import numpy as np
 
-app = FastAPI()
+# Why the model failed to load, if it did
+load_error: Optional[str] = None
+
+async def start_model():
+    """Load the model off the event loop, then start its background services"""
+    global load_error
+    try:
+        # A model built from a prepared knowledge base (benchmarks) is ready already
+        if not rl_model.ready.is_set():
+            await asyncio.to_thread(rl_model.load, defer_opening_book=True)
+    except Exception as e:
+        # Fails /health too, so the process is restarted rather than left unready for good
+        logger.exception("Model failed to load")
+        load_error = f"{type(e).__name__}: {e}"
+        return
+    model_sync.start()
+    imputer.start()
+    logger.info("Model ready: %d entities, %d questions", rl_model.snapshot.num_entities, rl_model.snapshot.num_questions)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Started first: /feedback is accepted as soon as the model is ready
+    await feedback_queue.start()
+    # The server accepts connections right away; /ready reports when the model is loaded
+    startup = asyncio.create_task(start_model())
+    yield
+    # A load still in progress finishes first, so the store is not closed under it
+    await startup
+    # Apply any queued feedback and checkpoint before the process exits
+    imputer.stop()
+    await feedback_queue.stop()
+    model_sync.stop()
+    if rl_model.ready.is_set():
+        rl_model.save()
+    game_log.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -18,89 +73,326 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency histograms for /metrics
+app.add_middleware(RequestTimer, routes=lambda: [route.path for route in app.routes])
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    # The default handler echoes the offending input, which fails to render when it is NaN or infinite
+    def safe(value):
+        return repr(value) if isinstance(value, float) and not math.isfinite(value) else value
+    errors = [{**error, "input": safe(error.get("input"))} for error in exc.errors()]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
 # Define data models
+
+# 1 = yes, 0 = no; values in between are soft answers such as 0.75 for "probably".
+# Anything else, NaN and infinities included, is rejected with 422.
+Answer = Annotated[float, Field(ge=0, le=1, allow_inf_nan=False)]
+
 class PredictionRequest(BaseModel):
-    answers: Dict[str, int]
+    answers: Dict[str, Answer]
+    # Echo the session_id from the previous response so only new answers are applied
+    session_id: Optional[str] = None
+    # Skip server-side session state entirely and score from the full answers
+    stateless: bool = False
+    # "match" (default) or "bayesian", see rl_model.SCORING_MODES
+    scoring: Literal["match", "bayesian"] = "match"
+
+class BatchPredictionRequest(BaseModel):
+    # Independent answer states, each scored like a stateless /predict call
+    states: List[Dict[str, Answer]]
+    scoring: Literal["match", "bayesian"] = "match"
 
 class PredictionResponse(BaseModel):
     prediction: Optional[str] = None
     next_question: Optional[str] = None
     confidence: Optional[float] = None
+    session_id: Optional[str] = None
 
 class FeedbackRequest(BaseModel):
     entity: str
     correct: bool
-    answers: Dict[str, int]
+    # The answers as sent to /predict, soft ones included; see quantize_answers
+    answers: Dict[str, Answer]
+
+def quantize_answers(answers: Dict[str, float]) -> Dict[str, int]:
+    """
+    Yes/no answers for the knowledge base, which stores no soft ones: a
+    soft answer counts as its nearer side and 0.5 ("don't know") is dropped
+    """
+    return {question: int(answer > 0.5) for question, answer in answers.items() if answer != 0.5}
+
+# Opens the store only; the lifespan loads the model in the background
+rl_model = AkinatorRL(store_dir=os.environ.get("MODEL_STORE", "model_store"), load=False)
+
+# In-progress games, keyed by the session_id handed out from /predict
+sessions = SessionStore()
+
+# Feedback is applied off the request path in micro-batches
+feedback_queue = FeedbackQueue(rl_model)
+
+# Finished games for offline retraining (retrain.py)
+game_log = GameLog()
 
-# Initialize the RL model
-rl_model = AkinatorRL()
+# Follows (or, in the writer process, feeds) the store shared by all worker processes
+model_sync = ModelSync(rl_model)
+
+# Fills sparse entities' unknown answers from similar entities (writer only)
+imputer = BackgroundImputer(rl_model)
+
+# Off until switched on through /debug/profiler
+profiler = SamplingProfiler()
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(request: PredictionRequest):
+# Fraction of /predict calls logged at INFO; set LOG_LEVEL=DEBUG to log every one
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", "0.01"))
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+def require_model():
+    """Dependency of the routes that need the model: 503 until it has loaded"""
+    if not rl_model.ready.is_set():
+        raise HTTPException(status_code=503, detail="Model is loading, please retry later",
+                            headers={"Retry-After": "1"})
+
+def log_request(message: str, *args):
+    """Log a per-request line lazily: every request at DEBUG, a sample of them at INFO"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, *args)
+    elif random.random() < REQUEST_LOG_SAMPLE_RATE:
+        logger.info(message, *args)
+
+# A plain def runs in the threadpool; the model is read through immutable snapshots, so no locking
+@app.post("/predict", response_model=PredictionResponse, dependencies=[Depends(require_model)])
+def predict(request: PredictionRequest):
     answers = request.answers
     
-    logger.info(f"Received answers: {answers}")
-    
-    # Get prediction based on current answers
-    prediction, confidence = rl_model.predict(answers)
+    # Resume the game's candidate state if the client holds a session
+    session_id = None
+    state = None
+    if not request.stateless:
+        session_id = request.session_id
+        state = sessions.take(session_id)
+        if state is None:
+            session_id = None
+    # Answer paths seen recently come from the result cache without touching the state
+    result, state = rl_model.respond(answers, state, request.scoring)
+    if state is None:
+        session_id = None
+    elif not request.stateless:
+        session_id = sessions.put(session_id, state)
+    prediction, confidence, next_question = result
+    log_request("Answers %s -> prediction %r (confidence %.3f), next question %r",
+                answers, prediction, confidence, next_question)
     
     if prediction:
-        logger.info(f"Made prediction: {prediction} with confidence {confidence}")
-        return {"prediction": prediction, "confidence": confidence}
-    
-    # If no confident prediction, get the next question
-    next_question = rl_model.get_next_question(answers)
+        return {"prediction": prediction, "confidence": confidence, "session_id": session_id}
     
     if not next_question:
         logger.warning("No next question available")
-        return {"prediction": "I don't know what you're thinking of!", "confidence": 0.0}
+        return {"prediction": "I don't know what you're thinking of!", "confidence": 0.0, "session_id": session_id}
     
-    logger.info(f"Next question: {next_question}")
-    return {"next_question": next_question, "confidence": confidence}
+    return {"next_question": next_question, "confidence": confidence, "session_id": session_id}
+
+@app.post("/predict/batch", dependencies=[Depends(require_model)])
+def predict_batch(request: BatchPredictionRequest):
+    """
+    Score many answer states in one call. Results stream back as NDJSON,
+    one line per state in request order, each with the state's `index`
+    and the fields /predict would return.
+    """
+    def lines():
+        results = rl_model.predict_many(request.states, request.scoring)
+        for index, (prediction, confidence, next_question) in enumerate(results):
+            if prediction:
+                line = {"index": index, "prediction": prediction, "confidence": confidence}
+            elif next_question:
+                line = {"index": index, "next_question": next_question, "confidence": confidence}
+            else:
+                line = {"index": index, "prediction": "I don't know what you're thinking of!", "confidence": 0.0}
+            yield json.dumps(line) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-@app.post("/feedback")
+@app.post("/feedback", dependencies=[Depends(require_model)])
 async def feedback(request: FeedbackRequest):
     """
-    Endpoint to receive feedback on predictions to improve the model
+    Endpoint to receive feedback on predictions to improve the model.
+    The update is queued and applied in the background.
     """
-    rl_model.update_from_feedback(
+    answers = quantize_answers(request.answers)
+    accepted = await feedback_queue.put(
         entity=request.entity,
-        answers=request.answers,
+        answers=answers,
         correct=request.correct
     )
+    if not accepted:
+        raise HTTPException(status_code=503, detail="Feedback queue is full, please retry later",
+                            headers={"Retry-After": "1"})
+    game_log.record(request.entity, answers, request.correct)
     
-    return {"status": "Feedback received and model updated"}
+    return {"status": "Feedback received"}
 
-@app.post("/add-question")
-async def add_question(question: str):
-    """Add a new question to the system"""
-    rl_model.add_question(question)
-    return {"status": "Question added"}
+@app.post("/add-question", dependencies=[Depends(require_model)])
+def add_question(question: str, merge_similar: bool = True):
+    """
+    Add a new question unless it duplicates an existing one. Near-duplicates
+    are merged into the existing question when `merge_similar` is set and
+    they are close enough, and reported under "similar" either way.
+    """
+    try:
+        return rl_model.add_question(question, merge_similar)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/similar-questions", dependencies=[Depends(require_model)])
+def similar_questions(threshold: float = FLAG_SIMILARITY):
+    """Pairs of existing questions at least `threshold` similar, for review"""
+    return [
+        {"question": a, "similar_to": b, "similarity": round(score, 3)}
+        for a, b, score in rl_model.question_index.duplicates(threshold)
+    ]
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # More than one worker needs an import string; see replication.py
+    uvicorn.run("main:app", host="127.0.0.1", port=8000, workers=int(os.environ.get("WEB_CONCURRENCY", "1")))
 
-@app.get("/admin/data")
-async def get_admin_data():
-    """Get all questions and entities for the admin interface"""
+@app.get("/admin/data", dependencies=[Depends(require_model)])
+def get_admin_data(after: Optional[int] = Query(None, ge=0), epoch: Optional[int] = None,
+                   limit: int = Query(500, ge=1, le=10000)):
+    """
+    Questions and one page of entities for the admin interface. Request the
+    next page by passing back `next` as `after` together with `epoch` until
+    `next` is null. Pages are keyed by row, which stays put until the
+    catalogue is compacted, so they neither skip nor repeat an entity while
+    it changes; after a compaction the cursor is stale and the request
+    fails with 409, so start again from the first page.
+    """
+    snapshot = rl_model.snapshot
+    if after is not None and epoch != snapshot.epoch:
+        raise HTTPException(status_code=409, detail="The catalogue was compacted; start again from the first page")
+    rows = snapshot.live_rows()
+    start = 0 if after is None else int(np.searchsorted(rows, after, side="right"))
+    page = rows[start:start + limit]
     return {
-        "questions": rl_model.questions,
-        "entities": rl_model.entities
+        "version": snapshot.version,
+        "epoch": snapshot.epoch,
+        "questions": list(snapshot.questions),
+        "entities": snapshot.to_dict(page),
+        "total": len(rows),
+        "next": int(page[-1]) if start + limit < len(rows) else None,
     }
 
-@app.get("/debug")
+@app.get("/admin/export", dependencies=[Depends(require_model)])
+def export_data(format: Literal["csv", "ndjson"] = "ndjson"):
+    """The whole catalogue of the current model version, streamed in the format catalogue.py imports"""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(export_catalogue(rl_model.snapshot, format), media_type=media_type)
+
+@app.post("/admin/import", dependencies=[Depends(require_model)])
+async def import_data(request: Request, format: Literal["csv", "ndjson", "parquet"], replace: bool = False):
+    """
+    Import a catalogue file sent as the request body (see catalogue.py
+    for the formats). The body is spooled to a temporary file, checked
+    whole, then applied as a single change.
+    """
+    with tempfile.NamedTemporaryFile(suffix=f".{format}") as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.flush()
+        try:
+            return await run_in_threadpool(import_file, rl_model, upload.name, format, replace)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@REGISTRY.collector
+def collect_model_metrics():
+    """Gauges and counters read at scrape time"""
+    yield "zoltar_model_ready", "gauge", "1 once the model has loaded", {}, int(rl_model.ready.is_set())
+    snapshot = rl_model.snapshot
+    if snapshot is None:
+        return
+    yield "zoltar_model_version", "gauge", "Version of the published model snapshot", {}, snapshot.version
+    yield "zoltar_entities", "gauge", "Live entities in the knowledge base", {}, snapshot.num_entities
+    yield "zoltar_questions", "gauge", "Questions in the knowledge base", {}, snapshot.num_questions
+    if snapshot.num_questions:
+        yield "zoltar_answer_density", "gauge", "Mean share of entities answering a question", {}, snapshot.question_density.mean()
+    yield "zoltar_imputed_answers_total", "counter", "Answers filled by background imputation", {}, imputer.stats["cells"]
+    yield "zoltar_active_sessions", "gauge", "In-progress games held in memory", {}, len(sessions)
+    yield "zoltar_result_cache_entries", "gauge", "Entries in the /predict result cache", {}, len(rl_model.result_cache)
+    for event, count in rl_model.result_cache.stats.items():
+        yield "zoltar_result_cache_events_total", "counter", "Result cache events by kind", {"event": event}, count
+    yield "zoltar_feedback_queue_pending", "gauge", "Feedback items waiting to be applied", {}, len(feedback_queue)
+    for event, count in feedback_queue.stats.items():
+        yield "zoltar_feedback_queue_events_total", "counter", "Feedback queue events by kind", {"event": event}, count
+    for event, count in model_sync.stats.items():
+        yield "zoltar_model_sync_events_total", "counter", "Model sync events by kind", {"event": event}, count
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving, whether or not the model has loaded yet; 503 if loading failed"""
+    if load_error is not None:
+        return JSONResponse({"status": "failed", "detail": load_error}, status_code=503)
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the model has loaded, 503 before"""
+    if load_error is not None:
+        return JSONResponse({"status": "failed", "detail": load_error}, status_code=503)
+    if not rl_model.ready.is_set():
+        return JSONResponse({"status": "loading"}, status_code=503, headers={"Retry-After": "1"})
+    return {"status": "ready", "model_version": rl_model.snapshot.version}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Span and request latency histograms plus model gauges, in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/debug/profiler")
+async def set_profiler(enabled: bool, interval: float = Query(0.005, ge=0.001)):
+    """Start or stop the sampling profiler; starting discards the previous samples"""
+    if enabled:
+        profiler.start(interval)
+    else:
+        profiler.stop()
+    return {"running": profiler.running, "samples": profiler.samples}
+
+@app.get("/debug/profiler", response_class=PlainTextResponse)
+async def get_profile(limit: Optional[int] = None):
+    """Sampled stacks so far in the collapsed format used by flamegraph tools"""
+    return PlainTextResponse(profiler.collapsed(limit))
+
+@app.get("/debug", dependencies=[Depends(require_model)])
 async def debug():
     """Get debug information about the current state of the system"""
+    snapshot = rl_model.snapshot
+    density = snapshot.question_density
     return {
-        "num_questions": len(rl_model.questions),
-        "num_entities": len(rl_model.entities),
-        "sample_entities": list(rl_model.entities.keys())[:5],
-        "sample_questions": rl_model.questions[:5],
+        "model_version": snapshot.version,
+        "worker": {"role": model_sync.role, "journal_seq": rl_model.journal_seq, **model_sync.stats},
+        "num_questions": snapshot.num_questions,
+        "num_entities": snapshot.num_entities,
+        "opening_book_positions": len(snapshot.opening_book) if snapshot.opening_book is not None else 0,
+        "active_sessions": len(sessions),
+        "result_cache": {"entries": len(rl_model.result_cache), **rl_model.result_cache.stats},
+        "feedback_queue": {"pending": len(feedback_queue), **feedback_queue.stats},
+        "game_log": {"buffered_rows": len(game_log), **game_log.stats},
+        "imputer": imputer.stats,
+        "shards": {
+            **{snapshot.questions[gate]: int(size) for gate, size in zip(snapshot.shards.gates, snapshot.shards.sizes)},
+            "other": int(snapshot.shards.sizes[-1]),
+            "unordered_tail": snapshot.num_rows - int(snapshot.shards.bounds[-1]),
+        },
+        "answer_density": {
+            "mean": float(density.mean()) if len(density) else 0.0,
+            "min": float(density.min()) if len(density) else 0.0,
+        },
+        "sample_entities": snapshot.sample_entities(5),
+        "sample_questions": list(snapshot.questions[:5]),
         "prediction_threshold": {
             "min_questions": 8,
             "min_confidence": 0.8
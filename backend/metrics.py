@@ -0,0 +1,155 @@
+"""
+Process-local timing histograms, rendered in the Prometheus text format.
+
+Hot paths are wrapped in named spans (`@timed("filter")` or
+`with span("filter"):`) that all feed one histogram family,
+zoltar_span_seconds{span="..."}. Recording a span costs two clock reads
+and a bucket increment, so spans stay on in production. Anything else
+worth exporting, such as cache or queue counters, is registered as a
+collector that is only called when /metrics is scraped.
+
+Every uvicorn worker keeps its own metrics; scrape each worker, or sum
+them, for totals.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Upper bounds in seconds, from 50us (a cache hit) to 10s (a snapshot write)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+# (name, type, help, labels, value) as yielded by collectors
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+class Histogram:
+    """Cumulative-on-render histogram of durations in seconds"""
+
+    __slots__ = ("labels", "counts", "sum", "_lock")
+
+    def __init__(self, labels: Dict[str, str]):
+        self.labels = labels
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        bucket = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += seconds
+
+class Registry:
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, Dict[tuple, Histogram]]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str, **labels: str) -> Histogram:
+        """The histogram for `name` with these labels, created on first use"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            _, histograms = self._families.setdefault(name, (help, {}))
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram(labels)
+            return histogram
+
+    def collector(self, collect: Callable[[], Iterable[Sample]]):
+        """Register a function called on every scrape for its samples"""
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            families = [(name, help, list(histograms.values())) for name, (help, histograms) in self._families.items()]
+        for name, help, histograms in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for histogram in histograms:
+                with histogram._lock:
+                    counts, total = list(histogram.counts), histogram.sum
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_labels({**histogram.labels, 'le': le})} {cumulative}")
+                lines.append(f"{name}_sum{_labels(histogram.labels)} {total!r}")
+                lines.append(f"{name}_count{_labels(histogram.labels)} {cumulative}")
+
+        described = set()
+        for collect in self._collectors:
+            for name, kind, help, labels, value in collect():
+                if name not in described:
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                    described.add(name)
+                lines.append(f"{name}{_labels(labels)} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+REGISTRY = Registry()
+
+def span_histogram(name: str) -> Histogram:
+    return REGISTRY.histogram("zoltar_span_seconds", "Time spent in instrumented sections of the backend", span=name)
+
+class span:
+    """Context manager timing a block into the `name` span"""
+
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, name: str):
+        self._histogram = span_histogram(name)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+def timed(name: str):
+    """Decorator timing every call into the `name` span"""
+    def decorate(function):
+        histogram = span_histogram(name)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+class RequestTimer:
+    """
+    ASGI middleware recording each HTTP request's duration by route, in
+    zoltar_request_seconds. Paths that match no route share one label so
+    stray URLs cannot grow the label set.
+    """
+
+    def __init__(self, app, routes: Callable[[], Iterable[str]]):
+        self.app = app
+        self._routes = routes
+        self._paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if self._paths is None:
+                self._paths = set(self._routes())
+            path = scope["path"] if scope["path"] in self._paths else "other"
+            REGISTRY.histogram("zoltar_request_seconds", "HTTP request latency by route",
+                               path=path).observe(time.perf_counter() - start)
@@ -0,0 +1,211 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from knowledge_base import ModelSnapshot, UNKNOWN
+from scoring import QUESTION_SCORERS
+
+# A node's position: the hard (question id, answer) pairs given so far, sorted by question id
+Path = Tuple[Tuple[int, int], ...]
+# Answer cells an update may read before it is left to a full build in the background (see AkinatorRL._publish)
+UPDATE_BUDGET = 1 << 24
+
+class BookNode:
+    """
+    One precomputed position. Keeps the candidates' per-question yes/no
+    counts rather than the candidates themselves, so entity changes are
+    folded in by adding or subtracting single rows.
+    """
+
+    __slots__ = ("path", "qids", "values", "count", "yes", "no", "_excluded")
+
+    def __init__(self, path: Path, count: int, yes: np.ndarray, no: np.ndarray, excluded: Optional[np.ndarray] = None):
+        self.path = path
+        self.qids = np.array([qid for qid, _ in path], dtype=np.intp)
+        self.values = np.array([value for _, value in path], dtype=np.int8)
+        self.count = count
+        self.yes = yes
+        self.no = no
+        self._excluded = excluded
+
+    def excluded(self, snapshot: ModelSnapshot) -> np.ndarray:
+        # Nodes are rebuilt when questions are added, so the mask stays valid for the node's lifetime
+        if self._excluded is None:
+            self._excluded = snapshot.relevance.excluded(self.qids, self.values)
+        return self._excluded
+
+def choose_questions(snapshot: ModelSnapshot, scorer: str, nodes: List[BookNode]) -> np.ndarray:
+    """
+    The question the live scorer would ask from each position, computed for
+    a whole level of the tree with one pass of the scorer
+    """
+    weights = snapshot.weights
+    unanswered = np.ones((len(nodes), snapshot.num_questions), dtype=bool)
+    for i, node in enumerate(nodes):
+        unanswered[i, node.qids] = False
+    candidates = unanswered & ~np.stack([node.excluded(snapshot) for node in nodes])
+    counts = np.array([node.count for node in nodes], dtype=np.float64)[:, None]
+    yes = np.stack([node.yes for node in nodes]) / np.maximum(counts, 1)
+    no = np.stack([node.no for node in nodes]) / np.maximum(counts, 1)
+    gains = np.where(candidates, QUESTION_SCORERS[scorer](yes, no) * weights, -np.inf)
+    # No candidates left (or no relevant question): the most heavily weighted unanswered one
+    fallback = (counts[:, 0] == 0) | ~candidates.any(axis=1)
+    gains[fallback] = np.where(unanswered[fallback], weights, -np.inf)
+    return np.argmax(gains, axis=1)
+
+class OpeningBook:
+    """
+    Precomputed question tree for the first `depth` turns of a game.
+
+    Every game starts from the same empty answer state and the first few
+    turns only branch on yes/no, so the question asked at each of those
+    positions is computed once per model version instead of once per
+    request. A book belongs to one ModelSnapshot and is never modified;
+    `updated` derives the next snapshot's book by patching the counts of
+    the positions a changed entity can reach, re-choosing each position's
+    question under the new weights and building only the positions that
+    became reachable.
+
+    Only games with hard answers that followed the book's questions are
+    answered from it; anything else misses and is scored live.
+    """
+
+    def __init__(self, scorer: str, depth: int):
+        self.scorer = scorer
+        self.depth = depth
+        # Nodes may be shared with the books of other versions; questions are per book
+        self.nodes: Dict[Path, BookNode] = {}
+        self.questions: Dict[Path, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @classmethod
+    def build(cls, snapshot: ModelSnapshot, scorer: str, depth: int) -> "OpeningBook":
+        book = cls(scorer, depth)
+        book._grow(snapshot, {})
+        return book
+
+    def lookup(self, state) -> Optional[int]:
+        """The precomputed question id for an answer state, or None if it is not in the book"""
+        if state.prior is not None or len(state.soft_qids):
+            return None
+        return self.lookup_answers(state.qids, state.values)
+
+    def lookup_answers(self, qids: np.ndarray, values: np.ndarray) -> Optional[int]:
+        """The precomputed question id after the hard answers (qids, values) and no others"""
+        if len(qids) >= self.depth:
+            return None
+        return self.questions.get(tuple(sorted(zip(qids.tolist(), values.tolist()))))
+
+    def updated(self, previous: ModelSnapshot, snapshot: ModelSnapshot,
+                budget: Optional[int] = None) -> Optional["OpeningBook"]:
+        """
+        The book for `snapshot`, a later version of `previous` with the same
+        epoch (row ids unchanged). Rows are append-only within an epoch, so
+        the changed entities are the rows appended since `previous` and the
+        rows it had live that have since been tombstoned. None when that
+        would read more than `budget` answer cells, e.g. after a large
+        import or when new weights move the root question.
+        """
+        old_rows = previous.num_rows
+        removed = snapshot.matrix[np.flatnonzero(previous.live & ~snapshot.live[:old_rows])]
+        added = snapshot.matrix[old_rows + np.flatnonzero(snapshot.live[old_rows:])]
+        grown = snapshot.num_questions - previous.num_questions
+
+        nodes = list(self.nodes.values())
+        spent = (len(added) + len(removed)) * snapshot.num_questions * len(nodes)
+        if budget is not None and spent > budget:
+            return None
+        # One row per node holding its answers so far and UNKNOWN elsewhere
+        constraints = np.full((len(nodes), snapshot.num_questions), UNKNOWN, dtype=np.int8)
+        for i, node in enumerate(nodes):
+            constraints[i, node.qids] = node.values
+        said_yes = (constraints == 1).astype(np.float32)
+        said_no = (constraints == 0).astype(np.float32)
+
+        def counts(rows: np.ndarray):
+            """Per node: how many of `rows` it can reach, and their yes/no counts per question"""
+            conflicts = said_yes @ (rows == 0).T.astype(np.float32) + said_no @ (rows == 1).T.astype(np.float32)
+            reached = (conflicts == 0).astype(np.float32)
+            return (reached.sum(axis=1).astype(np.int64),
+                    np.rint(reached @ (rows == 1).astype(np.float32)).astype(np.int64),
+                    np.rint(reached @ (rows == 0).astype(np.float32)).astype(np.int64))
+
+        num_nodes = len(nodes)
+        delta_count = np.zeros(num_nodes, dtype=np.int64)
+        delta_yes = np.zeros((num_nodes, snapshot.num_questions), dtype=np.int64)
+        delta_no = np.zeros_like(delta_yes)
+        for rows, sign in ((added, 1), (removed, -1)):
+            if len(rows):
+                reached, yes, no = counts(rows)
+                delta_count += sign * reached
+                delta_yes += sign * yes
+                delta_no += sign * no
+
+        patched: Dict[Path, BookNode] = {}
+        changed = (delta_count != 0) | delta_yes.any(axis=1) | delta_no.any(axis=1)
+        for i, node in enumerate(nodes):
+            if not changed[i] and not grown:
+                patched[node.path] = node
+                continue
+            # New question columns are UNKNOWN for every existing row
+            yes = np.concatenate([node.yes, np.zeros(grown, dtype=np.int64)]) + delta_yes[i]
+            no = np.concatenate([node.no, np.zeros(grown, dtype=np.int64)]) + delta_no[i]
+            patched[node.path] = BookNode(node.path, node.count + int(delta_count[i]), yes, no,
+                                          None if grown else node._excluded)
+
+        book = OpeningBook(self.scorer, self.depth)
+        if not book._grow(snapshot, patched, None if budget is None else budget - spent):
+            return None
+        return book
+
+    def _grow(self, snapshot: ModelSnapshot, known: Dict[Path, BookNode], budget: Optional[int] = None) -> bool:
+        """
+        Walk the tree from the root one level at a time, reusing nodes from
+        `known` and building the rest. Questions are re-chosen on every walk
+        since any weight may have changed; positions no longer reachable are
+        dropped. Returns False, leaving the book incomplete, once building
+        new positions would read more than `budget` answer cells.
+        """
+        matrix = snapshot.matrix
+        spent = 0
+
+        def narrow(rows: np.ndarray, steps) -> np.ndarray:
+            """The rows not contradicting any of the (question id, answer) steps; reads only their cells"""
+            for qid, value in steps:
+                column = matrix[rows, qid]
+                rows = rows[(column == value) | (column == UNKNOWN)]
+            return rows
+
+        # (path, parent's candidate rows, answer leading from the parent) per position. The rows are
+        # kept for positions that had to be built, so their new children only read those rows; a new
+        # child of a reused position narrows the live rows along its path instead.
+        level: List[Tuple[Path, Optional[np.ndarray], Optional[Tuple[int, int]]]] = [((), None, None)]
+        while level:
+            nodes, node_rows = [], []
+            for path, parent_rows, step in level:
+                node = known.get(path)
+                rows = None
+                if node is None:
+                    if parent_rows is None:
+                        rows = narrow(np.flatnonzero(snapshot.live), path)
+                    else:
+                        rows = narrow(parent_rows, [step])
+                    spent += len(rows) * snapshot.num_questions
+                    if budget is not None and spent > budget:
+                        return False
+                    answers = matrix[rows]
+                    node = BookNode(path, len(rows), np.count_nonzero(answers == 1, axis=0), np.count_nonzero(answers == 0, axis=0))
+                nodes.append(node)
+                node_rows.append(rows)
+
+            questions = choose_questions(snapshot, self.scorer, nodes)
+            level = []
+            for node, rows, question in zip(nodes, node_rows, questions.tolist()):
+                self.nodes[node.path] = node
+                self.questions[node.path] = question
+                if len(node.path) + 1 >= self.depth:
+                    continue
+                for value in (0, 1):
+                    level.append((tuple(sorted(node.path + ((question, value),))), rows, (question, value)))
+        return True
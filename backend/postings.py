@@ -0,0 +1,221 @@
+"""
+Inverted index from (question, answer) to the rows giving that answer.
+
+Row sets are compressed the way roaring bitmaps are: row ids are split
+into chunks of 65536 and every chunk is stored either as a sorted uint16
+array (up to 4096 rows) or as a 65536-bit bitmap, whichever is smaller.
+Sparse answers cost two bytes per row, dense ones an eighth of a byte.
+
+Only yes and no are stored. The rows with an unknown answer are the
+complement of both, which is all a filter needs, since a hard answer only
+ever rules out the rows that gave the opposite answer.
+"""
+import numpy as np
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+# Past this many rows a chunk's sorted array is larger than its bitmap
+ARRAY_MAX = 4096
+
+def _bitmap(low: np.ndarray) -> np.ndarray:
+    flags = np.zeros(CHUNK_SIZE, dtype=bool)
+    flags[low] = True
+    return np.packbits(flags, bitorder="little").view(np.uint64)
+
+def _container(low: np.ndarray) -> np.ndarray:
+    return low.astype(np.uint16) if len(low) <= ARRAY_MAX else _bitmap(low)
+
+class RowSet:
+    """
+    Compressed set of row ids that only grows at the top end, matching the
+    knowledge base's append-only rows.
+
+    Appending never changes what a reader sees for rows below the number
+    of rows it knows about: array containers are replaced rather than
+    resized and bitmap containers only gain bits for new rows, so readers
+    of older snapshots can share the set and clip results to their rows.
+    """
+
+    __slots__ = ("_keys", "_containers", "_positions", "_count")
+
+    def __init__(self):
+        self._keys: List[int] = []
+        self._containers: List[np.ndarray] = []
+        self._positions: Dict[int, int] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray) -> "RowSet":
+        """Build from sorted, unique row ids"""
+        row_set = cls()
+        row_set.extend(rows)
+        return row_set
+
+    def extend(self, rows: np.ndarray):
+        """Add sorted, unique row ids, all above the current largest one"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        high = rows >> CHUNK_BITS
+        bounds = np.flatnonzero(np.diff(high)) + 1
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(rows)]):
+            key = int(high[start])
+            low = rows[start:stop] & (CHUNK_SIZE - 1)
+            if self._keys and self._keys[-1] == key:
+                self._merge_last(low)
+            else:
+                # Container before key, key before position: readers look them up in the reverse order
+                self._containers.append(_container(low))
+                self._keys.append(key)
+                self._positions[key] = len(self._keys) - 1
+            self._count += len(low)
+
+    def containers(self) -> Iterator[Tuple[int, np.ndarray, int]]:
+        """(chunk key, container, rows in it) for every chunk, in key order"""
+        for key, container in zip(self._keys, self._containers):
+            count = len(container)
+            if container.dtype == np.uint64:
+                count = int(np.count_nonzero(np.unpackbits(container.view(np.uint8))))
+            yield key, container, count
+
+    def append_container(self, key: int, container: np.ndarray, count: int):
+        """Add a whole chunk above every current one, as produced by containers()"""
+        self._containers.append(container)
+        self._keys.append(key)
+        self._positions[key] = len(self._keys) - 1
+        self._count += count
+
+    def _merge_last(self, low: np.ndarray):
+        container = self._containers[-1]
+        if container.dtype == np.uint64:
+            np.bitwise_or.at(container, low >> 6, np.left_shift(np.uint64(1), (low & 63).astype(np.uint64)))
+        elif len(container) + len(low) <= ARRAY_MAX:
+            self._containers[-1] = np.concatenate([container, low.astype(np.uint16)])
+        else:
+            self._containers[-1] = _bitmap(np.concatenate([container.astype(np.int64), low]))
+
+    def contains(self, rows: np.ndarray) -> np.ndarray:
+        """Membership mask for sorted row ids; costs about O(len(rows)), not O(len(self))"""
+        found = np.zeros(len(rows), dtype=bool)
+        if not len(rows) or not self._count:
+            return found
+        high = rows >> CHUNK_BITS
+        bounds = np.flatnonzero(np.diff(high)) + 1
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(rows)]):
+            position = self._positions.get(int(high[start]))
+            if position is None:
+                continue
+            container = self._containers[position]
+            low = rows[start:stop] & (CHUNK_SIZE - 1)
+            if stop - start > ARRAY_MAX:
+                # Many rows in this chunk: expand the container to flags once and look them up
+                if container.dtype == np.uint64:
+                    flags = np.unpackbits(container.view(np.uint8), bitorder="little").view(bool)
+                else:
+                    flags = np.zeros(CHUNK_SIZE, dtype=bool)
+                    flags[container] = True
+                found[start:stop] = flags[low]
+            elif container.dtype == np.uint64:
+                bits = container[low >> 6] >> (low & 63).astype(np.uint64)
+                found[start:stop] = (bits & np.uint64(1)).astype(bool)
+            else:
+                index = np.minimum(np.searchsorted(container, low), len(container) - 1)
+                found[start:stop] = container[index] == low
+        return found
+
+    def to_array(self, limit: int) -> np.ndarray:
+        """Sorted row ids below `limit`"""
+        parts = []
+        for key, container in zip(self._keys, self._containers):
+            base = key << CHUNK_BITS
+            if base >= limit:
+                break
+            if container.dtype == np.uint64:
+                low = np.flatnonzero(np.unpackbits(container.view(np.uint8), bitorder="little"))
+            else:
+                low = container.astype(np.int64)
+            parts.append(low + base)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(parts)
+        return rows[:np.searchsorted(rows, limit)]
+
+class PostingIndex:
+    """
+    Yes and no row sets for every question. Tombstoned rows stay in their
+    postings; callers mask them with the snapshot's live flags.
+    """
+
+    def __init__(self, num_questions: int = 0):
+        self.yes: List[RowSet] = [RowSet() for _ in range(num_questions)]
+        self.no: List[RowSet] = [RowSet() for _ in range(num_questions)]
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, num_rows: int, num_questions: int) -> "PostingIndex":
+        """Index the first num_rows x num_questions of an answer matrix, one chunk of rows at a time"""
+        index = cls(num_questions)
+        for start in range(0, num_rows, CHUNK_SIZE):
+            index.add_rows(start, matrix[start:min(start + CHUNK_SIZE, num_rows), :num_questions])
+        return index
+
+    def add_rows(self, start: int, block: np.ndarray):
+        """Index consecutive rows appended from `start` on, given their (rows, questions) answers"""
+        for postings, value in ((self.yes, 1), (self.no, 0)):
+            # Question-major copy so each question's rows are contiguous
+            flags = np.ascontiguousarray((block == value).T)
+            for qid in range(block.shape[1]):
+                postings[qid].extend(start + np.flatnonzero(flags[qid]))
+
+    def add_question(self):
+        self.yes.append(RowSet())
+        self.no.append(RowSet())
+
+    def add_row(self, row: int, qids: Sequence[int], values: Sequence[int]):
+        """Index a row appended to the matrix with hard answers (qids, values)"""
+        single = np.array([row], dtype=np.int64)
+        for qid, value in zip(qids, values):
+            (self.yes if value == 1 else self.no)[qid].extend(single)
+
+    def postings(self, qid: int, value: int) -> RowSet:
+        """Rows that answered `value` (1 or 0) to question `qid`"""
+        return self.yes[qid] if value == 1 else self.no[qid]
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Flat form for snapshot files: a (containers, 5) int64 directory of
+        (list, chunk key, offset, words, rows), where list is 2 * qid for
+        yes and 2 * qid + 1 for no, and the containers' uint16 words back to
+        back, each starting on a uint64 boundary
+        """
+        directory, parts, offset = [], [], 0
+        for qid in range(len(self.yes)):
+            for side, row_set in enumerate((self.yes[qid], self.no[qid])):
+                for key, container, count in row_set.containers():
+                    words = container.view(np.uint16)
+                    padded = -len(words) % 4
+                    directory.append((2 * qid + side, key, offset, len(words), count))
+                    parts.append(words)
+                    if padded:
+                        parts.append(np.zeros(padded, dtype=np.uint16))
+                    offset += len(words) + padded
+        data = np.concatenate(parts) if parts else np.empty(0, dtype=np.uint16)
+        return np.array(directory, dtype=np.int64).reshape(-1, 5), data
+
+    @classmethod
+    def from_arrays(cls, num_questions: int, directory: np.ndarray, data: np.ndarray) -> "PostingIndex":
+        """
+        Index from to_arrays() output. Containers are views of `data`, so a
+        copy-on-write memmap is read only as rows are looked up; it costs
+        one step per container rather than per row.
+        """
+        index = cls(num_questions)
+        for list_id, key, offset, words, count in directory.tolist():
+            container = data[offset:offset + words]
+            if count > ARRAY_MAX:
+                container = container.view(np.uint64)
+            (index.no if list_id & 1 else index.yes)[list_id >> 1].append_container(key, container, count)
+        return index
@@ -0,0 +1,73 @@
+"""
+Sampling profiler that can be switched on in a running server.
+
+A background thread wakes up every `interval` seconds, reads every other
+thread's current stack from sys._current_frames() and counts it. Nothing
+is hooked into the profiled code, so the only cost while it runs is the
+sampling thread itself, and none at all while it is stopped. Stacks are
+reported in the collapsed format ("outer;inner count") that flamegraph
+tools read.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+class SamplingProfiler:
+    def __init__(self, max_depth: int = 64):
+        self.max_depth = max_depth
+        self.interval = 0.005
+        self.samples = 0
+        self.started: Optional[float] = None
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.005, reset: bool = True):
+        """Start sampling (a no-op when already running); `reset` discards earlier samples"""
+        if self.running:
+            return
+        with self._lock:
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+            self.interval = interval
+            self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        """Sampled stacks, most frequent first, one "frame;frame;frame count" line each"""
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
@@ -0,0 +1,76 @@
+"""
+Duplicate and near-duplicate detection for question text.
+
+Two questions are exact duplicates when their normalized forms match:
+case-folded, punctuation and articles dropped, whitespace collapsed, so
+"Is it a mammal?" and "is it mammal" are one question. KnowledgeBase
+keys its questions by that form and folds columns that share one.
+
+Near-duplicates ("Does it live in water?" / "Does it live under water?")
+are found with TF-IDF vectors of character 2-4-grams and cosine
+similarity. Character n-grams catch typos and inflections but not
+meaning, so "Is it an insect or bug?" scores high against "Is it an
+insect?" as well; only very close matches are merged automatically and
+the rest are reported for a human to judge.
+
+scikit-learn is only imported when a QuestionIndex is built.
+"""
+import re
+import unicodedata
+import numpy as np
+from typing import List, Sequence, Tuple
+
+from deferred import import_module
+
+# Add-question merges into an existing question at or above this similarity
+MERGE_SIMILARITY = 0.9
+# and reports existing questions at or above this one
+FLAG_SIMILARITY = 0.75
+
+# Questions scored per block when listing duplicate pairs
+DUPLICATE_BLOCK = 512
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_ARTICLES = frozenset(("a", "an", "the"))
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question; equal forms are the same question"""
+    text = _PUNCTUATION.sub(" ", unicodedata.normalize("NFKC", question).casefold())
+    return " ".join(word for word in text.split() if word not in _ARTICLES)
+
+class QuestionIndex:
+    """Character n-gram TF-IDF vectors of a fixed question list"""
+
+    def __init__(self, questions: Sequence[str]):
+        TfidfVectorizer = import_module("sklearn.feature_extraction.text").TfidfVectorizer
+        self.questions = tuple(questions)
+        self._vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), preprocessor=normalize_question,
+                                           dtype=np.float32)
+        self._vectors = self._vectorizer.fit_transform(self.questions) if self.questions else None
+
+    def similar(self, question: str, threshold: float = FLAG_SIMILARITY, limit: int = 5) -> List[Tuple[str, float]]:
+        """Up to `limit` indexed questions at least `threshold` similar to `question`, closest first"""
+        if self._vectors is None:
+            return []
+        scores = (self._vectors @ self._vectorizer.transform([question]).T).toarray().ravel()
+        found = np.flatnonzero(scores >= threshold)
+        found = found[np.argsort(-scores[found], kind="stable")][:limit]
+        return [(self.questions[i], float(scores[i])) for i in found]
+
+    def duplicates(self, threshold: float = FLAG_SIMILARITY) -> List[Tuple[str, str, float]]:
+        """Every pair of indexed questions at least `threshold` similar, closest first"""
+        if self._vectors is None:
+            return []
+        # Character n-grams overlap between almost all questions, so the full
+        # product is close to dense; score DUPLICATE_BLOCK questions at a time
+        rows, cols, data = [], [], []
+        for start in range(0, len(self.questions), DUPLICATE_BLOCK):
+            scores = (self._vectors[start:start + DUPLICATE_BLOCK] @ self._vectors.T).toarray()
+            block_rows, block_cols = np.nonzero(scores >= threshold)
+            later = block_cols > block_rows + start
+            rows.append(block_rows[later] + start)
+            cols.append(block_cols[later])
+            data.append(scores[block_rows[later], block_cols[later]])
+        rows, cols, data = np.concatenate(rows), np.concatenate(cols), np.concatenate(data)
+        order = np.argsort(-data, kind="stable")
+        return [(self.questions[a], self.questions[b], float(s)) for a, b, s in zip(rows[order], cols[order], data[order])]
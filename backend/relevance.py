@@ -0,0 +1,59 @@
+import json
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Mapping, Union
+
+# Declarative category -> question dependencies shipped with the backend
+DEFAULT_GRAPH_PATH = Path(__file__).with_name("question_graph.json")
+
+class RelevanceIndex:
+    """
+    Category -> question dependency graph.
+
+    Each category names a gate question and the questions that only make
+    sense when the gate is answered yes. compile() turns the graph into
+    packed bitsets over the current question ids.
+    """
+
+    def __init__(self, graph: Union[dict, str, Path, None] = None):
+        if graph is None or isinstance(graph, (str, Path)):
+            with open(graph or DEFAULT_GRAPH_PATH) as f:
+                graph = json.load(f)
+        self.categories: Dict[str, dict] = graph["categories"]
+
+    def compile(self, question_ids: Mapping[str, int], num_questions: int) -> "CompiledRelevance":
+        """Build the bitsets against a set of question ids"""
+        gates: List[int] = []
+        rows = []
+        for spec in self.categories.values():
+            gate = question_ids.get(spec["gate"])
+            if gate is None:
+                continue
+            mask = np.zeros(num_questions, dtype=bool)
+            dependents = [question_ids[q] for q in spec["questions"] if q in question_ids]
+            mask[dependents] = True
+            gates.append(gate)
+            rows.append(np.packbits(mask))
+        # Sized explicitly: with no gate registered, reshape(0, -1) cannot infer the width
+        bits = np.array(rows, dtype=np.uint8).reshape(len(rows), (num_questions + 7) // 8)
+        return CompiledRelevance(np.array(gates, dtype=np.intp), bits, num_questions)
+
+class CompiledRelevance:
+    """
+    One packed bitset of dependent questions per category gate. The
+    questions ruled out by an answer state are the OR of the bitsets whose
+    gate was answered no.
+    """
+
+    def __init__(self, gate_qids: np.ndarray, bits: np.ndarray, num_questions: int):
+        self.gate_qids = gate_qids
+        self.bits = bits
+        self.num_questions = num_questions
+
+    def excluded(self, qids: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Boolean mask of questions made irrelevant by the hard answers (qids, values)"""
+        active = np.isin(self.gate_qids, qids[values == 0])
+        if not active.any():
+            return np.zeros(self.num_questions, dtype=bool)
+        bits = np.bitwise_or.reduce(self.bits[active], axis=0)
+        return np.unpackbits(bits, count=self.num_questions).astype(bool)
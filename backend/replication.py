@@ -0,0 +1,73 @@
+"""
+Multi-process serving on one model store.
+
+Run the API with several workers, e.g. ``uvicorn main:app --workers 4``.
+Every worker opens the same ModelStore. The first one to take the writer
+lock is the writer: it applies feedback, journals it and writes
+snapshots. The others are readers. They serve /predict from the
+memory-mapped snapshot, whose pages the OS shares between processes, plus
+the journal entries written after it. Feedback and new questions that
+reach a reader are posted to the store's inbox for the writer.
+
+Each worker runs a ModelSync thread. On a reader it polls the journal's
+sequence number (the model version counter) and replays new entries. On
+the writer it drains the inbox. If the writer exits, a reader takes over
+the lock on its next poll.
+
+Game sessions stay local to the worker that created them. A request for a
+session held by another worker rebuilds its state from the full answers.
+"""
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class ModelSync:
+    """Background thread keeping one process's AkinatorRL in step with the shared store"""
+
+    def __init__(self, model, interval: float = 0.05):
+        self.model = model
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"refreshes": 0, "drained": 0, "promotions": 0, "errors": 0}
+
+    @property
+    def role(self) -> str:
+        return "writer" if self.model.is_writer else "reader"
+
+    def start(self):
+        if self.model.store is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-sync", daemon=True)
+        self._thread.start()
+
+    def _tick(self):
+        if not self.model.is_writer:
+            if not self.model.promote():
+                self.stats["refreshes"] += self.model.refresh()
+                return
+            self.stats["promotions"] += 1
+            logger.info("Took over as the model writer")
+        self.stats["drained"] += self.model.drain_inbox()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._tick()
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Model sync failed")
+
+    def stop(self):
+        """Stop the thread; a writer drains the inbox one last time"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self.model.is_writer:
+            while self.model.drain_inbox():
+                pass
@@ -0,0 +1,168 @@
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Mapping, NamedTuple, Optional
+
+from knowledge_base import ModelSnapshot, UNKNOWN
+
+class Result(NamedTuple):
+    prediction: Optional[str]
+    confidence: float
+    next_question: Optional[str]
+
+class _Entry:
+    __slots__ = ("result", "qids", "values", "best_row", "question", "best_score", "runner_up", "created")
+
+    def __init__(self, result: Result, qids: np.ndarray, values: np.ndarray, best_row: Optional[int],
+                 question: Optional[int], best_score: float, runner_up: float):
+        self.result = result
+        self.qids = qids
+        self.values = values
+        self.best_row = best_row
+        self.question = question
+        self.best_score = best_score
+        self.runner_up = runner_up
+        self.created = time.monotonic()
+
+class ResultCache:
+    """
+    Bounded LRU of /predict results keyed by a canonical form of the answers.
+
+    Entries are tagged with the model version they are valid for. Instead of
+    being flushed on every model change, they are revalidated when a new
+    snapshot is published and only those the change can affect are dropped:
+
+    - an added or removed entity drops the entries it is a candidate for
+      (consistent with their hard answers), plus entries it could overtake
+      as best match, plus entries whose best match it was;
+    - a weight change drops an entry only when its chosen question's score
+      may no longer beat the runner-up's, bounding every other question by
+      the largest weight change;
+    - a new question, or rows being renumbered, drops everything.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version: Optional[int] = None
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(snapshot: ModelSnapshot, answers: Mapping[str, float]) -> tuple:
+        """
+        Sorted (question id, answer) pairs, with hard answers normalized as
+        AnswerState reads them, plus the count of answers to unknown
+        questions (they still count towards the prediction threshold)
+        """
+        pairs = []
+        for question, answer in answers.items():
+            qid = snapshot.question_id(question)
+            if qid is not None:
+                pairs.append((qid, float(answer) if 0 < answer < 1 else (1.0 if answer == 1 else 0.0)))
+        return tuple(sorted(pairs)), len(answers) - len(pairs)
+
+    def get(self, key: tuple, version: int) -> Optional[Result]:
+        with self._lock:
+            entry = self._entries.get(key) if version == self.version else None
+            if entry is not None and time.monotonic() - entry.created > self.ttl_seconds:
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry.result
+
+    def put(self, key: tuple, version: int, result: Result, qids: np.ndarray, values: np.ndarray,
+            best_row: Optional[int], question: Optional[int] = None,
+            best_score: float = -np.inf, runner_up: float = -np.inf):
+        """
+        Store a result computed from snapshot `version`. `qids`/`values` are
+        the hard answers, `best_row` the best-matching row and `question`
+        the chosen question with the scores from rank_next_question.
+        """
+        with self._lock:
+            if version != self.version:
+                # Computed against a snapshot that has already been superseded
+                return
+            self._entries[key] = _Entry(result, qids, values, best_row, question, best_score, runner_up)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def revalidate(self, previous: Optional[ModelSnapshot], snapshot: ModelSnapshot):
+        """Move the cache to a newly published snapshot, dropping the entries it invalidates"""
+        with self._lock:
+            self.version = snapshot.version
+            if not self._entries:
+                return
+            if (previous is None or previous.epoch != snapshot.epoch
+                    or previous.num_questions != snapshot.num_questions):
+                self.stats["invalidations"] += len(self._entries)
+                self._entries.clear()
+                return
+
+            keys = list(self._entries)
+            entries = list(self._entries.values())
+            stale = np.zeros(len(entries), dtype=bool)
+
+            old_rows = previous.num_rows
+            removed = np.flatnonzero(previous.live & ~snapshot.live[:old_rows])
+            added = old_rows + np.flatnonzero(snapshot.live[old_rows:])
+            if len(added) or len(removed):
+                stale |= self._touched(entries, snapshot, added, removed)
+
+            # Weights only steer the choice of question; bound each entry's margin
+            factors = snapshot.weights / previous.weights
+            if not np.all(factors == 1.0):
+                largest, smallest = factors.max(), factors.min()
+                for i, entry in enumerate(entries):
+                    if entry.question is None or stale[i]:
+                        continue
+                    best = entry.best_score * factors[entry.question]
+                    runner_up = entry.runner_up * (largest if entry.runner_up >= 0 else smallest)
+                    if best > runner_up:
+                        entry.best_score, entry.runner_up = best, runner_up
+                    else:
+                        stale[i] = True
+
+            for i in np.flatnonzero(stale):
+                del self._entries[keys[i]]
+            self.stats["invalidations"] += int(stale.sum())
+
+    @staticmethod
+    def _touched(entries, snapshot: ModelSnapshot, added: np.ndarray, removed: np.ndarray) -> np.ndarray:
+        """Entries whose result may change because the given rows were added or removed"""
+        constraints = np.full((len(entries), snapshot.num_questions), UNKNOWN, dtype=np.int8)
+        for i, entry in enumerate(entries):
+            constraints[i, entry.qids] = entry.values
+        said_yes = (constraints == 1).astype(np.float32)
+        said_no = (constraints == 0).astype(np.float32)
+        asked = said_yes + said_no
+
+        rows = snapshot.matrix[np.concatenate([added, removed])]
+        yes = (rows == 1).T.astype(np.float32)
+        no = (rows == 0).T.astype(np.float32)
+        # Per (entry, row): answers that disagree, agree, and are known at all
+        conflicts = said_yes @ no + said_no @ yes
+        agreements = said_yes @ yes + said_no @ no
+        known = asked @ (yes + no)
+
+        touched = (conflicts == 0).any(axis=1)
+        # An added row can become the best match when it scores above the current best
+        confidence = np.array([entry.result.confidence for entry in entries])[:, None]
+        scores = agreements[:, :len(added)].astype(np.float64) / np.maximum(known[:, :len(added)], 1)
+        touched |= ((known[:, :len(added)] > 0) & (scores > confidence)).any(axis=1)
+        # A removed row matters when it was the best match
+        best_rows = np.array([-1 if entry.best_row is None else entry.best_row for entry in entries])
+        touched |= np.isin(best_rows, removed)
+        return touched
@@ -0,0 +1,145 @@
+"""
+Offline retraining from the game log.
+
+Online feedback nudges the asked questions' weights by +/-5% per game and
+rescales when the largest passes 10, so the weights depend on the order
+feedback arrived in. This job recomputes them from the whole history
+instead: the same multiplicative rule in closed form, 1.05 ** correct *
+0.95 ** wrong per question, rescaled once at the end. It also fills in
+answers entities are missing wherever enough correct games agree on
+them.
+
+Part files are aggregated in parallel by a process pool, then the partial
+counts are summed. The result is a small JSON payload (new weights plus
+answers to fill). With --apply it is handed to the model store, and the
+running service installs it as a new model version without a restart: a
+writer process applies it directly, otherwise it goes through the
+store's inbox like any other change.
+
+    python -m retrain --log game_log --store model_store --output retrained.json --apply
+"""
+import argparse
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from game_log import part_files, read_part
+from knowledge_base import ModelSnapshot, UNKNOWN
+
+CORRECT_FACTOR = 1.05
+WRONG_FACTOR = 0.95
+# Same bound the online rule enforces: past MAX_WEIGHT, rescale so the largest is RESCALED_MAX
+MAX_WEIGHT = 10.0
+RESCALED_MAX = 5.0
+
+def aggregate_part(path) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Partial counts for one part file: games per question by outcome
+    (question -> correct, wrong) and answers per cell from correct games
+    ((entity, question) -> yes, total)
+    """
+    games = read_part(path)
+    asked = games.groupby(["question", "correct"], observed=True).size().unstack(fill_value=0)
+    asked = asked.reindex(columns=[True, False], fill_value=0)
+    asked.columns = ["correct", "wrong"]
+    solved = games[games["correct"]]
+    votes = solved.groupby(["entity", "question"], observed=True)["answer"].agg(yes="sum", total="count")
+    # Each part has its own categories; plain strings so the parts can be summed
+    asked.index = asked.index.astype(str)
+    votes.index = votes.index.set_levels([level.astype(str) for level in votes.index.levels])
+    return asked, votes
+
+def aggregate(paths: List[Path], workers: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Sum the partial counts of every part file, computed across `workers` processes"""
+    if not paths:
+        empty = pd.DataFrame(columns=["correct", "wrong"])
+        return empty, pd.DataFrame(columns=["yes", "total"])
+    with ProcessPoolExecutor(workers) as pool:
+        parts = list(pool.map(aggregate_part, paths))
+    asked = pd.concat([part[0] for part in parts]).groupby(level=0).sum()
+    votes = pd.concat([part[1] for part in parts]).groupby(level=[0, 1]).sum()
+    return asked, votes
+
+def question_weights(snapshot: ModelSnapshot, asked: pd.DataFrame) -> np.ndarray:
+    """Closed form of the online weight rule over the whole history"""
+    log_weights = np.zeros(snapshot.num_questions)
+    for question, (correct, wrong) in zip(asked.index, asked[["correct", "wrong"]].to_numpy()):
+        qid = snapshot.question_ids.get(question)
+        if qid is not None:
+            log_weights[qid] = correct * np.log(CORRECT_FACTOR) + wrong * np.log(WRONG_FACTOR)
+    # Rescale in log space; the raw product overflows after a few thousand games
+    largest = log_weights.max()
+    if largest > np.log(MAX_WEIGHT):
+        log_weights += np.log(RESCALED_MAX) - largest
+    return np.exp(log_weights)
+
+def imputed_answers(snapshot: ModelSnapshot, votes: pd.DataFrame, min_votes: int = 2,
+                    min_agreement: float = 0.75) -> Dict[str, Dict[str, int]]:
+    """
+    Answers for cells that are UNKNOWN in `snapshot`, taken from correct
+    games when at least `min_votes` of them answered and `min_agreement`
+    of those agree
+    """
+    if votes.empty:
+        return {}
+    votes = votes[votes["total"] >= min_votes]
+    share = votes["yes"] / votes["total"]
+    votes = votes[(share >= min_agreement) | (share <= 1 - min_agreement)]
+    entity_ids = {name: row for row, name in enumerate(snapshot.entity_names) if snapshot.live[row]}
+    answers: Dict[str, Dict[str, int]] = {}
+    for (entity, question), yes, total in zip(votes.index, votes["yes"].to_numpy(), votes["total"].to_numpy()):
+        row = entity_ids.get(entity)
+        qid = snapshot.question_ids.get(question)
+        if row is None or qid is None or snapshot.matrix[row, qid] != UNKNOWN:
+            continue
+        answers.setdefault(entity, {})[question] = int(2 * yes >= total)
+    return answers
+
+def retrain(snapshot: ModelSnapshot, log_directory, workers: Optional[int] = None,
+            min_votes: int = 2, min_agreement: float = 0.75) -> dict:
+    """Payload for AkinatorRL.apply_retraining, plus a summary of what went into it"""
+    paths = part_files(log_directory)
+    asked, votes = aggregate(paths, workers)
+    weights = question_weights(snapshot, asked)
+    answers = imputed_answers(snapshot, votes, min_votes, min_agreement)
+    return {
+        "weights": dict(zip(snapshot.questions, weights.tolist())),
+        "answers": answers,
+        "summary": {
+            "parts": len(paths),
+            "questions_seen": len(asked),
+            "cells_voted": len(votes),
+            "cells_filled": sum(len(filled) for filled in answers.values()),
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log", default="game_log", help="game log directory")
+    parser.add_argument("--store", default="model_store", help="model store directory")
+    parser.add_argument("--workers", type=int, help="processes to aggregate with (default: one per core)")
+    parser.add_argument("--min-votes", type=int, default=2)
+    parser.add_argument("--min-agreement", type=float, default=0.75)
+    parser.add_argument("--output", help="also write the payload to this JSON file")
+    parser.add_argument("--apply", action="store_true", help="install the result in the model store")
+    args = parser.parse_args()
+
+    from rl_model import AkinatorRL
+    model = AkinatorRL(store_dir=args.store, opening_depth=0)
+    try:
+        payload = retrain(model.snapshot, args.log, args.workers, args.min_votes, args.min_agreement)
+        print(json.dumps(payload["summary"]))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(payload, f)
+        if args.apply:
+            model.apply_retraining(payload)
+            model.save()
+    finally:
+        model.store.close()
+
+if __name__ == "__main__":
+    main()
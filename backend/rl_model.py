@@ -1,380 +1,800 @@
 import numpy as np
-import pandas as pd
 import pickle
+import threading
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Mapping, Tuple, Optional
+
+from knowledge_base import KnowledgeBase, ModelSnapshot
+from sessions import AnswerState
+from scoring import QUESTION_SCORERS
+from relevance import RelevanceIndex
+from opening_book import UPDATE_BUDGET, OpeningBook
+from result_cache import Result, ResultCache
+import bayes
+from metrics import timed
+from store import ModelStore
+from question_index import MERGE_SIMILARITY, QuestionIndex, normalize_question
+from shards import ShardIndex
+
+# How /predict ranks entities: "match" counts agreeing stored answers and
+# filters on hard answers, "bayesian" keeps a log-posterior with a noise model
+SCORING_MODES = ("match", "bayesian")
+
+# Bayesian question selection only looks at entities within this posterior
+# ratio of the best one, and at most at POSTERIOR_MAX_ROWS of them
+POSTERIOR_MIN_RATIO = 1e-4
+POSTERIOR_MAX_ROWS = 4096
+
+# predict_many scores this many answer states per chunk, against blocks of
+# rows small enough that each (states, rows) product stays around 16 MB
+BATCH_CHUNK = 256
+BATCH_BLOCK_CELLS = 1 << 22
+
+# import_catalogue journals and applies catalogue chunks this many at a time
+IMPORT_GROUP = 16
+
+# Initial questions
+DEFAULT_QUESTIONS = [
+    # Basic classification
+    "Is it an animal?",
+    "Is it a person?",
+    "Is it a fictional character?",
+    "Is it an object?",
+    "Is it a place?",
+    "Is it a food or drink?",
+    "Is it a plant?",
+    "Is it a vehicle?",
+    "Is it technology-related?",
+    
+    # Animal questions
+    "Does it live in water?",
+    "Is it a mammal?",
+    "Is it a bird?",
+    "Is it a reptile?",
+    "Is it an insect?",
+    "Is it a fish?",
+    "Can it fly?",
+    "Is it a predator?",
+    "Is it a pet?",
+    "Is it a farm animal?",
+    "Is it wild?",
+    "Does it have fur?",
+    "Does it have scales?",
+    "Does it have feathers?",
+    "Is it larger than a human?",
+    "Is it smaller than a cat?",
+    "Is it dangerous to humans?",
+    "Is it nocturnal?",
+    "Does it live in a group/herd?",
+    "Is it endangered?",
+    
+    # Person questions
+    "Is this person alive?",
+    "Is this person male?",
+    "Is this person famous?",
+    "Is this person an actor/actress?",
+    "Is this person a musician?",
+    "Is this person a politician?",
+    "Is this person an athlete?",
+    "Is this person a scientist?",
+    "Is this person a writer?",
+    "Is this person a historical figure?",
+    "Is this person American?",
+    "Is this person European?",
+    "Is this person Asian?",
+    "Is this person older than 50?",
+    "Is this person younger than 30?",
+    
+    # Object questions
+    "Is it electronic?",
+    "Is it used in the kitchen?",
+    "Is it used for transportation?",
+    "Is it furniture?",
+    "Is it a tool?",
+    "Is it a toy?",
+    "Is it clothing?",
+    "Is it made of metal?",
+    "Is it made of wood?",
+    "Is it made of plastic?",
+    "Can you hold it in your hand?",
+    "Is it expensive?",
+    "Is it used daily?",
+    "Is it found in most homes?",
+    
+    # Food/drink questions
+    "Is it a fruit?",
+    "Is it a vegetable?",
+    "Is it a dessert?",
+    "Is it a beverage?",
+    "Is it alcoholic?",
+    "Is it spicy?",
+    "Is it sweet?",
+    "Is it sour?",
+    "Is it eaten raw?",
+    "Is it cooked?",
+    "Is it a main dish?",
+    "Is it a snack?",
+    
+    # Place questions
+    "Is it a country?",
+    "Is it a city?",
+    "Is it a natural landmark?",
+    "Is it a building?",
+    "Is it a tourist destination?",
+    "Is it in Europe?",
+    "Is it in Asia?",
+    "Is it in North America?",
+    "Is it in the Southern Hemisphere?",
+    "Is it near water?",
+    "Is it in a desert?",
+    "Is it in a forest?",
+    "Is it mountainous?",
+    
+    # Technology questions
+    "Is it a computer?",
+    "Is it a mobile device?",
+    "Is it software?",
+    "Is it used for communication?",
+    "Is it used for entertainment?",
+    "Was it invented in the last 20 years?",
+    "Is it connected to the internet?",
+    
+    # Fictional character questions
+    "Is this character from a movie?",
+    "Is this character from a TV show?",
+    "Is this character from a book?",
+    "Is this character from a video game?",
+    "Is this character from a comic/manga?",
+    "Is this character human?",
+    "Is this character a superhero?",
+    "Is this character a villain?",
+    "Is this character animated?",
+    "Is this character from Disney?",
+    "Is this character from Marvel or DC?",
+    "Is this character magical or has superpowers?",
+    
+    # Vehicle questions
+    "Does it travel on land?",
+    "Does it travel on water?",
+    "Does it travel in air?",
+    "Does it have wheels?",
+    "Does it have an engine?",
+    "Is it powered by humans?",
+    "Can it carry multiple people?",
+    "Is it used for public transportation?",
+    "Is it used for transporting goods?",
+    "Is it faster than a car?",
+    
+    # General questions
+    "Is it colorful?",
+    "Is it larger than a microwave?",
+    "Is it smaller than a shoe?",
+    "Is it heavy?",
+    "Is it valuable?",
+    "Is it older than 100 years?",
+    "Is it modern (created in the last 50 years)?",
+    "Is it used for entertainment?",
+    "Is it used for work?",
+    "Is it rare?",
+    "Is it common in households?",
+    "Is it seasonal?",
+    "Is it associated with a specific culture?",
+    "Is it associated with a specific holiday?",
+    "Is it used outdoors?",
+    "Is it used indoors?",
+]
+
+# Initial entities with their attributes
+SEED_ENTITIES = {
+    "dog": {
+        "Is it an animal?": 1, 
+        "Does it live in water?": 0, 
+        "Is it a mammal?": 1, 
+        "Can it fly?": 0, 
+        "Is it a pet?": 1,
+        "Is it a predator?": 0,
+        "Does it have fur?": 1,
+        "Is it larger than a microwave?": 0,
+        "Is it smaller than a shoe?": 0,
+        "Is it dangerous to humans?": 0,
+        "Is it a farm animal?": 0,
+        "Is it wild?": 0,
+        "Is it colorful?": 0,
+        "Is it rare?": 0,
+        "Is it common in households?": 1
+    },
+    "cat": {
+        "Is it an animal?": 1, 
+        "Does it live in water?": 0, 
+        "Is it a mammal?": 1, 
+        "Can it fly?": 0, 
+        "Is it a pet?": 1, 
+        "Is it a predator?": 1,
+        "Does it have fur?": 1,
+        "Is it larger than a microwave?": 0,
+        "Is it smaller than a shoe?": 0,
+        "Is it dangerous to humans?": 0,
+        "Is it a farm animal?": 0,
+        "Is it wild?": 0,
+        "Is it colorful?": 0,
+        "Is it rare?": 0,
+        "Is it common in households?": 1
+    },
+    "fish": {"Is it an animal?": 1, "Does it live in water?": 1, "Is it a mammal?": 0},
+    "bird": {"Is it an animal?": 1, "Does it live in water?": 0, "Can it fly?": 1},
+    "elephant": {"Is it an animal?": 1, "Does it live in water?": 0, "Is it a mammal?": 1, "Can it fly?": 0, "Is it larger than a human?": 1},
+}
 
 class AkinatorRL:
-    def __init__(self, questions_file="questions.pkl", entities_file="entities.pkl"):
+    def __init__(self, questions_file="questions.pkl", entities_file="entities.pkl", question_scorer="entropy",
+                 kb: Optional[KnowledgeBase] = None, store_dir="model_store", snapshot_every=1000, opening_depth=6,
+                 load=True):
+        # Legacy pickle files, only read to seed a new store
         self.questions_path = Path(questions_file)
         self.entities_path = Path(entities_file)
+        # Name of the scoring.QUESTION_SCORERS entry used to rank questions
+        self.question_scorer = question_scorer
+        # Category -> question dependencies used to skip irrelevant questions
+        self.relevance = RelevanceIndex()
+        # Turns answered from the precomputed opening book (0 disables it)
+        self.opening_depth = opening_depth
+        # Recent /predict results, revalidated on every publish
+        self.result_cache = ResultCache()
+        
+        # Journal entries to accumulate before compacting into a new snapshot
+        self.snapshot_every = snapshot_every
+        # Serializes writers; readers never take it and use the published snapshot instead
+        self._write_lock = threading.Lock()
+        # Serializes snapshot writes (checkpoints and explicit saves)
+        self._save_lock = threading.Lock()
+        self._snapshot: Optional[ModelSnapshot] = None
+        self._compiled_relevance = None
+        self._question_index: Optional[QuestionIndex] = None
+        self._checkpoint_thread: Optional[threading.Thread] = None
+        self._book_thread: Optional[threading.Thread] = None
+        self._seq = 0
+        self._pending = 0
+        # Set once the first snapshot is published; with load=False that waits for load()
+        self.ready = threading.Event()
+        
+        # A prepared knowledge base (e.g. for benchmarks) skips loading and persistence entirely
+        if kb is not None:
+            self.store = None
+            self.is_writer = True
+            self.kb = kb
+            self._publish()
+            return
         
+        # When several worker processes share the store, only the one holding the
+        # writer lock learns and persists; the others follow its journal (see refresh)
+        self.store = ModelStore(store_dir)
+        self.is_writer = self.store.acquire_writer()
+        if load:
+            self.load()
+    
+    @timed("model_load")
+    def load(self, defer_opening_book: bool = False):
+        """
+        Read the model from the store: the latest snapshot, then the journal
+        written after it. With `defer_opening_book` the model is published
+        without its opening book, which is built on a background thread and
+        attached when done; until then games rank every question.
+        """
+        # Start from the latest snapshot and replay the journal written after it
+        snapshot, self._seq = self.store.load_snapshot()
+        self.kb = snapshot if snapshot is not None else self._initial_kb()
+        for seq, kind, payload in self.store.events_since(self._seq):
+            self._apply_event(kind, payload)
+            self._seq = seq
+            self._pending += 1
+        # Stores from before questions were normalized may hold one question under several spellings
+        folded = bool(self.kb.duplicate_questions())
+        if folded:
+            self.kb = self.kb.folded()
+            # Journaled so that the save below, which must cover a newer seq, persists the fold
+            if self.is_writer:
+                self._journal("fold", {})
+        if defer_opening_book and self.opening_depth:
+            self._book_thread = threading.Thread(target=self._build_opening_book, name="opening-book", daemon=True)
+        self._publish()
+        if self._book_thread is not None:
+            self._book_thread.start()
+        if snapshot is None or folded:
+            self.save()
+    
+    def _initial_kb(self) -> KnowledgeBase:
+        """Knowledge base for a new store: imported from legacy pickles, else the built-in seed data"""
         # Load or initialize questions and their weights
         if self.questions_path.exists():
             with open(self.questions_path, 'rb') as f:
-                self.questions, self.question_weights = pickle.load(f)
+                questions, question_weights = pickle.load(f)
         else:
-            # Initial questions
-            self.questions = [
-                # Basic classification
-                "Is it an animal?",
-                "Is it a person?",
-                "Is it a fictional character?",
-                "Is it an object?",
-                "Is it a place?",
-                "Is it a food or drink?",
-                "Is it a plant?",
-                "Is it a vehicle?",
-                "Is it technology-related?",
-                
-                # Animal questions
-                "Does it live in water?",
-                "Is it a mammal?",
-                "Is it a bird?",
-                "Is it a reptile?",
-                "Is it an insect?",
-                "Is it a fish?",
-                "Can it fly?",
-                "Is it a predator?",
-                "Is it a pet?",
-                "Is it a farm animal?",
-                "Is it wild?",
-                "Does it have fur?",
-                "Does it have scales?",
-                "Does it have feathers?",
-                "Is it larger than a human?",
-                "Is it smaller than a cat?",
-                "Is it dangerous to humans?",
-                "Is it nocturnal?",
-                "Does it live in a group/herd?",
-                "Is it endangered?",
-                
-                # Person questions
-                "Is this person alive?",
-                "Is this person male?",
-                "Is this person famous?",
-                "Is this person an actor/actress?",
-                "Is this person a musician?",
-                "Is this person a politician?",
-                "Is this person an athlete?",
-                "Is this person a scientist?",
-                "Is this person a writer?",
-                "Is this person a historical figure?",
-                "Is this person American?",
-                "Is this person European?",
-                "Is this person Asian?",
-                "Is this person older than 50?",
-                "Is this person younger than 30?",
-                
-                # Object questions
-                "Is it electronic?",
-                "Is it used in the kitchen?",
-                "Is it used for transportation?",
-                "Is it furniture?",
-                "Is it a tool?",
-                "Is it a toy?",
-                "Is it clothing?",
-                "Is it made of metal?",
-                "Is it made of wood?",
-                "Is it made of plastic?",
-                "Can you hold it in your hand?",
-                "Is it expensive?",
-                "Is it used daily?",
-                "Is it found in most homes?",
-                
-                # Food/drink questions
-                "Is it a fruit?",
-                "Is it a vegetable?",
-                "Is it a dessert?",
-                "Is it a beverage?",
-                "Is it alcoholic?",
-                "Is it spicy?",
-                "Is it sweet?",
-                "Is it sour?",
-                "Is it eaten raw?",
-                "Is it cooked?",
-                "Is it a main dish?",
-                "Is it a snack?",
-                
-                # Place questions
-                "Is it a country?",
-                "Is it a city?",
-                "Is it a natural landmark?",
-                "Is it a building?",
-                "Is it a tourist destination?",
-                "Is it in Europe?",
-                "Is it in Asia?",
-                "Is it in North America?",
-                "Is it in the Southern Hemisphere?",
-                "Is it near water?",
-                "Is it in a desert?",
-                "Is it in a forest?",
-                "Is it mountainous?",
-                
-                # Technology questions
-                "Is it a computer?",
-                "Is it a mobile device?",
-                "Is it software?",
-                "Is it used for communication?",
-                "Is it used for entertainment?",
-                "Was it invented in the last 20 years?",
-                "Is it connected to the internet?",
-                
-                # Fictional character questions
-                "Is this character from a movie?",
-                "Is this character from a TV show?",
-                "Is this character from a book?",
-                "Is this character from a video game?",
-                "Is this character from a comic/manga?",
-                "Is this character human?",
-                "Is this character a superhero?",
-                "Is this character a villain?",
-                "Is this character animated?",
-                "Is this character from Disney?",
-                "Is this character from Marvel or DC?",
-                "Is this character magical or has superpowers?",
-                
-                # Vehicle questions
-                "Does it travel on land?",
-                "Does it travel on water?",
-                "Does it travel in air?",
-                "Does it have wheels?",
-                "Does it have an engine?",
-                "Is it powered by humans?",
-                "Can it carry multiple people?",
-                "Is it used for public transportation?",
-                "Is it used for transporting goods?",
-                "Is it faster than a car?",
-                
-                # General questions
-                "Is it colorful?",
-                "Is it larger than a microwave?",
-                "Is it smaller than a shoe?",
-                "Is it heavy?",
-                "Is it valuable?",
-                "Is it older than 100 years?",
-                "Is it modern (created in the last 50 years)?",
-                "Is it used for entertainment?",
-                "Is it used for work?",
-                "Is it rare?",
-                "Is it common in households?",
-                "Is it seasonal?",
-                "Is it associated with a specific culture?",
-                "Is it associated with a specific holiday?",
-                "Is it used outdoors?",
-                "Is it used indoors?",
-            ]
+            questions = DEFAULT_QUESTIONS
             # Initialize weights (higher = more informative)
-            self.question_weights = {q: 1.0 for q in self.questions}
+            question_weights = {q: 1.0 for q in questions}
+        kb = KnowledgeBase(questions, question_weights)
         
         # Load or initialize entities
         if self.entities_path.exists():
             with open(self.entities_path, 'rb') as f:
-                self.entities = pickle.load(f)
+                entities = pickle.load(f)
+        else:
+            entities = SEED_ENTITIES
+        for entity, attributes in entities.items():
+            kb.set_entity(entity, attributes)
+        return kb
+    
+    @property
+    def snapshot(self) -> ModelSnapshot:
+        """
+        The current immutable model version. Reading the attribute is atomic,
+        so readers need no lock and keep a consistent view for as long as
+        they hold the reference.
+        """
+        return self._snapshot
+    
+    @property
+    def journal_seq(self) -> int:
+        """Sequence number of the last journal entry reflected in the model"""
+        return self._seq
+    
+    @timed("publish")
+    def _publish(self):
+        """Make the writer's current state visible to readers (call with the write lock held)"""
+        if self._compiled_relevance is None or self._compiled_relevance.num_questions != self.kb.num_questions:
+            self._compiled_relevance = self.relevance.compile(self.kb.question_ids, self.kb.num_questions)
+        snapshot = self.kb.publish(relevance=self._compiled_relevance)
+        previous = self._snapshot
+        gates = self._compiled_relevance.gate_qids
+        if previous is not None and previous.epoch == snapshot.epoch and np.array_equal(previous.shards.gates, gates):
+            snapshot.shards = previous.shards
+        elif self.kb.shards is not None and np.array_equal(self.kb.shards.gates, gates):
+            snapshot.shards = self.kb.shards
         else:
-            # Initial entities with their attributes
-            self.entities = {
-                "dog": {
-                    "Is it an animal?": 1, 
-                    "Does it live in water?": 0, 
-                    "Is it a mammal?": 1, 
-                    "Can it fly?": 0, 
-                    "Is it a pet?": 1,
-                    "Is it a predator?": 0,
-                    "Does it have fur?": 1,
-                    "Is it larger than a microwave?": 0,
-                    "Is it smaller than a shoe?": 0,
-                    "Is it dangerous to humans?": 0,
-                    "Is it a farm animal?": 0,
-                    "Is it wild?": 0,
-                    "Is it colorful?": 0,
-                    "Is it rare?": 0,
-                    "Is it common in households?": 1
-                },
-                "cat": {
-                    "Is it an animal?": 1, 
-                    "Does it live in water?": 0, 
-                    "Is it a mammal?": 1, 
-                    "Can it fly?": 0, 
-                    "Is it a pet?": 1, 
-                    "Is it a predator?": 1,
-                    "Does it have fur?": 1,
-                    "Is it larger than a microwave?": 0,
-                    "Is it smaller than a shoe?": 0,
-                    "Is it dangerous to humans?": 0,
-                    "Is it a farm animal?": 0,
-                    "Is it wild?": 0,
-                    "Is it colorful?": 0,
-                    "Is it rare?": 0,
-                    "Is it common in households?": 1
-                },
-                "fish": {"Is it an animal?": 1, "Does it live in water?": 1, "Is it a mammal?": 0},
-                "bird": {"Is it an animal?": 1, "Does it live in water?": 0, "Can it fly?": 1},
-                "elephant": {"Is it an animal?": 1, "Does it live in water?": 0, "Is it a mammal?": 1, "Can it fly?": 0, "Is it larger than a human?": 1},
-            }
+            snapshot.shards = ShardIndex.build(snapshot.matrix, gates)
+        # A deferred book is attached by _build_opening_book; games rank every question meanwhile
+        snapshot.opening_book = None
+        defer = False
+        if not self.opening_depth or self._book_thread is not None:
+            pass
+        elif previous is not None and previous.opening_book is not None and previous.epoch == snapshot.epoch:
+            snapshot.opening_book = previous.opening_book.updated(previous, snapshot, UPDATE_BUDGET)
+            defer = snapshot.opening_book is None
+        elif previous is None or snapshot.num_entities * snapshot.num_questions * self.opening_depth <= UPDATE_BUDGET:
+            snapshot.opening_book = OpeningBook.build(snapshot, self.question_scorer, self.opening_depth)
+        else:
+            defer = True
+        self.result_cache.revalidate(previous, snapshot)
+        self._snapshot = snapshot
+        self.ready.set()
+        if defer:
+            # Too costly to do with the write lock held
+            self._book_thread = threading.Thread(target=self._build_opening_book, name="opening-book", daemon=True)
+            self._book_thread.start()
+    
+    def _build_opening_book(self):
+        """Build the opening book for the published snapshot and attach it to the current one"""
+        try:
+            while True:
+                snapshot = self._snapshot
+                book = OpeningBook.build(snapshot, self.question_scorer, self.opening_depth)
+                with self._write_lock:
+                    current = self._snapshot
+                    # A compaction meanwhile renumbered the rows, so build again for the new epoch
+                    if current.epoch == snapshot.epoch:
+                        if current is not snapshot:
+                            book = book.updated(snapshot, current, UPDATE_BUDGET)
+                        # Past the budget: the model changed a lot meanwhile, so build again from the latest
+                        if book is not None:
+                            current.opening_book = book
+                            self._book_thread = None
+                            return
+        except Exception:
+            # The next publish builds the book in the foreground instead
+            self._book_thread = None
+            raise
     
+    @property
+    def questions(self) -> List[str]:
+        return list(self.snapshot.questions)
+    
+    @property
+    def question_weights(self) -> Dict[str, float]:
+        """Dict view of the question weights, built on demand"""
+        return self.snapshot.weights_dict()
+    
+    @property
+    def entities(self) -> Dict[str, Dict[str, int]]:
+        """Dict-of-dicts view of the answer matrix, built on demand for the admin API"""
+        return self.snapshot.to_dict()
+    
+    @timed("checkpoint")
     def save(self):
-        """Save the current state of questions and entities"""
-        with open(self.questions_path, 'wb') as f:
-            pickle.dump((self.questions, self.question_weights), f)
-        
-        with open(self.entities_path, 'wb') as f:
-            pickle.dump(self.entities, f)
+        """Write a compacted snapshot of the current model and truncate the journal"""
+        if self.store is None or not self.is_writer:
+            return
+        # A background checkpoint still writing finishes first (e.g. the save at shutdown)
+        checkpoint = self._checkpoint_thread
+        if checkpoint is not None and checkpoint is not threading.current_thread():
+            checkpoint.join()
+        # Saves run one at a time, so an older snapshot never lands after a newer one
+        with self._save_lock:
+            with self._write_lock:
+                snapshot = self._snapshot
+                seq = self._seq
+                self._pending = 0
+            # Published snapshots never change, so the slow write needs no write lock
+            self.store.write_snapshot(snapshot, seq)
     
-    def calculate_information_gain(self, question: str, current_entities: List[str]) -> float:
+    @timed("persist")
+    def _journal(self, kind: str, payload: dict, consumed: Optional[int] = None):
+        """Record a change that has already been applied; compacts in the background every so often"""
+        if self.store is None:
+            return
+        self._seq = self.store.append(kind, payload, consumed)
+        self._pending += 1
+        self._checkpoint_if_due()
+    
+    def _checkpoint_if_due(self):
+        if self._pending >= self.snapshot_every and not (self._checkpoint_thread and self._checkpoint_thread.is_alive()):
+            self._checkpoint_thread = threading.Thread(target=self.save, name="model-checkpoint", daemon=True)
+            self._checkpoint_thread.start()
+    
+    def _apply_event(self, kind: str, payload: dict):
+        """Re-apply a journal entry without recording it again"""
+        if kind == "feedback":
+            self._apply_feedback_batch([(payload["entity"], payload["answers"], payload["correct"])])
+        elif kind == "feedback_batch":
+            self._apply_feedback_batch([(item["entity"], item["answers"], item["correct"]) for item in payload["items"]])
+        elif kind == "add_question":
+            self.kb.add_question(payload["question"])
+        elif kind == "retrain":
+            self._apply_retraining(payload)
+        elif kind == "impute":
+            self._apply_imputation(payload["answers"])
+        elif kind == "import":
+            self._apply_import(payload)
+        elif kind == "fold" and self.kb.duplicate_questions():
+            self.kb = self.kb.folded()
+    
+    def _compact_if_needed(self):
+        # Replaced entities leave tombstoned rows behind; renumber once they pile up
+        if self.kb.num_dead_rows > max(1024, self.kb.num_rows // 4):
+            self.kb = self.kb.compacted(self._compiled_relevance.gate_qids)
+    
+    def refresh(self) -> bool:
         """
-        Calculate information gain for a question based on current possible entities
-        Higher gain = better question to ask
+        Catch a read-only process up with the writer's journal and publish the
+        result. A process that fell behind a checkpoint reloads the snapshot,
+        which is a memory map of the file the other processes share. Returns
+        whether a new version was published.
         """
-        if not current_entities or question not in self.question_weights:
-            return 0.0
-        
-        # Count yes/no answers for this question among current entities
-        yes_count = 0
-        no_count = 0
-        unknown_count = 0
-        
-        for entity in current_entities:
-            if entity in self.entities and question in self.entities[entity]:
-                if self.entities[entity][question] == 1:
-                    yes_count += 1
-                else:
-                    no_count += 1
-            else:
-                unknown_count += 1
-        
-        total = yes_count + no_count + unknown_count
-        
-        # Perfect split would be 50/50
-        # The closer to 50/50, the higher the information gain
-        if total == 0:
-            return 0.0
-        
-        yes_ratio = yes_count / total
-        no_ratio = no_count / total
+        if self.store is None or self.is_writer:
+            return False
+        with self._write_lock:
+            snapshot_seq, events = self.store.changes_since(self._seq)
+            if snapshot_seq > self._seq:
+                kb, self._seq = self.store.load_snapshot()
+                # Rows are renumbered, so this counts as a new epoch for session states
+                kb.version = self.kb.version + 1
+                kb.epoch = self.kb.epoch + 1
+                self.kb = kb
+                _, events = self.store.changes_since(self._seq)
+            elif not events:
+                return False
+            for seq, kind, payload in events:
+                self._apply_event(kind, payload)
+                self._seq = seq
+            self._compact_if_needed()
+            self._publish()
+        return True
+    
+    def promote(self) -> bool:
+        """Become the writer if the lock is free (e.g. the previous writer exited)"""
+        if self.is_writer:
+            return True
+        if self.store is None or not self.store.acquire_writer():
+            return False
+        # Nobody else can append now, so one more refresh sees the whole journal
+        self.refresh()
+        with self._write_lock:
+            self.is_writer = True
+        return True
+    
+    def drain_inbox(self, limit: int = 256) -> int:
+        """
+        Apply and journal changes posted by read-only processes, returning
+        how many were taken. Each entry leaves the inbox in the same
+        transaction that journals it.
+        """
+        if self.store is None or not self.is_writer:
+            return 0
+        entries = self.store.inbox(limit)
+        if not entries:
+            return 0
+        with self._write_lock:
+            for entry_id, kind, payload in entries:
+                self._apply_event(kind, payload)
+                self._journal(kind, payload, consumed=entry_id)
+            self._compact_if_needed()
+            self._publish()
+        return len(entries)
+    
+    @timed("filter")
+    def advance_state(self, answers: Dict[str, int], state: Optional[AnswerState] = None,
+                      posterior: bool = False) -> AnswerState:
+        """
+        Bring `state` up to date with `answers`, applying only the answers it has
+        not seen yet. A fresh state is built when there is none or when the
+        answers no longer extend the ones it was built from. `posterior` also
+        tracks the Bayesian log-posterior.
+        """
+        snapshot = self.snapshot
+        if state is None or not state.extends(answers):
+            state = AnswerState(snapshot)
+        else:
+            state.sync(snapshot)
+        if posterior:
+            state.track_posterior()
+        for question, answer in answers.items():
+            if question not in state.answers:
+                state.apply(question, answer)
+        return state
+    
+    def respond(self, answers: Dict[str, float], state: Optional[AnswerState] = None,
+                scoring: str = "match") -> Tuple[Result, Optional[AnswerState]]:
+        """
+        Prediction or next question for `answers` under one of SCORING_MODES.
+        Match scoring is served from the result cache when possible; a cache
+        hit leaves `state` as it was and the next miss brings it up to date.
+        """
+        if scoring == "bayesian":
+            state = self.advance_state(answers, state, posterior=True)
+            return self._posterior_result(state), state
         
-        # Calculate how close the split is to 50/50
-        # 0.5 is perfect, 0 or 1 is worst
-        balance = 1.0 - abs(0.5 - yes_ratio) * 2
+        snapshot = self.snapshot
+        key = self.result_cache.key(snapshot, answers)
+        cached = self.result_cache.get(key, snapshot.version)
+        if cached is not None:
+            return cached, state
         
-        # Penalize questions with many unknowns
-        known_ratio = (yes_count + no_count) / total
+        state = self.advance_state(answers, state)
+        best_row, confidence = self.best_match(state)
+        prediction, confidence = self._confident_prediction(state, best_row, confidence)
+        if prediction:
+            result = Result(prediction, confidence, None)
+            self.result_cache.put(key, state.snapshot.version, result, state.qids, state.values, best_row)
+            return result, state
         
-        # Combine balance and known_ratio with the question's weight
-        return balance * known_ratio * self.question_weights[question]
+        qid, best_score, runner_up = self.rank_next_question(state)
+        result = Result(None, confidence, state.snapshot.questions[qid] if qid is not None else None)
+        self.result_cache.put(key, state.snapshot.version, result, state.qids, state.values, best_row,
+                              qid, best_score, runner_up)
+        return result, state
     
-    def get_next_question(self, answers: Dict[str, int]) -> Optional[str]:
-        """
-        Get the next most informative question to ask
+    def _posterior_result(self, state: AnswerState) -> Result:
+        prediction, confidence = self.predict_posterior(state)
+        if prediction:
+            return Result(prediction, confidence, None)
+        qid = self.rank_posterior_question(state)
+        return Result(None, confidence, state.snapshot.questions[qid] if qid is not None else None)
+    
+    def predict_many(self, answer_states: Iterable[Mapping[str, float]], scoring: str = "match",
+                     chunk_size: int = BATCH_CHUNK) -> Iterator[Result]:
         """
-        # Filter questions not yet answered
-        unanswered = [q for q in self.questions if q not in answers]
-        if not unanswered:
-            return None
+        Results for many independent answer states, in order, as respond
+        would give them. All states are scored against the snapshot that is
+        current when iteration starts, and results are yielded a chunk at a
+        time so memory does not grow with the batch.
         
-        # If we have no answers yet, start with a basic classification question
-        if not answers:
-            basic_questions = [
-                "Is it an animal?",
-                "Is it a person?",
-                "Is it a fictional character?",
-                "Is it an object?",
-                "Is it a place?",
-                "Is it a food or drink?",
-            ]
-            available_basics = [q for q in basic_questions if q in unanswered]
-            if available_basics:
-                return available_basics[0]
+        Match scoring encodes each chunk as dense (states, questions) answer
+        matrices and gets every state's match scores, candidates and
+        per-question answer mass from matrix products over blocks of rows.
+        Bayesian scoring evaluates the states one at a time.
+        """
+        snapshot = self.snapshot
+        chunk = []
+        for answers in answer_states:
+            chunk.append(answers)
+            if len(chunk) == chunk_size:
+                yield from self._predict_chunk(snapshot, chunk, scoring)
+                chunk = []
+        if chunk:
+            yield from self._predict_chunk(snapshot, chunk, scoring)
+    
+    @timed("predict_batch")
+    def _predict_chunk(self, snapshot: ModelSnapshot, chunk: List[Mapping[str, float]], scoring: str) -> List[Result]:
+        if scoring == "bayesian":
+            results = []
+            for answers in chunk:
+                state = AnswerState(snapshot)
+                state.track_posterior()
+                for question, answer in answers.items():
+                    state.apply(question, answer)
+                results.append(self._posterior_result(state))
+            return results
         
-        # Filter entities that match our current answers
-        matching_entities = []
-        for entity, attributes in self.entities.items():
-            matches = True
+        # Answers to known questions, NaN where unanswered
+        said = np.full((len(chunk), snapshot.num_questions), np.nan)
+        for i, answers in enumerate(chunk):
             for question, answer in answers.items():
-                if question in attributes and attributes[question] != answer:
-                    matches = False
-                    break
-            if matches:
-                matching_entities.append(entity)
+                qid = snapshot.question_id(question)
+                if qid is not None:
+                    said[i, qid] = answer
+        answered = ~np.isnan(said)
+        soft = answered & (said > 0) & (said < 1)
+        said_yes = said == 1
+        said_no = answered & ~soft & ~said_yes
         
-        # If no matching entities, just return a random unanswered question
-        if not matching_entities:
-            # Sort by weight (most informative first) and return the top one
-            return sorted(unanswered, key=lambda q: self.question_weights.get(q, 0), reverse=True)[0]
+        best_score, best_row, mass = self._score_rows(snapshot, said_yes, said_no, soft, said)
+        yes_mass, no_mass, candidate_mass = mass
         
-        # Calculate information gain for each unanswered question
-        question_gains = {}
-        for question in unanswered:
-            # Skip questions that are irrelevant based on previous answers
-            if self._is_question_irrelevant(question, answers):
+        results = []
+        for i, answers in enumerate(chunk):
+            best = int(best_row[i]) if best_score[i] >= 0 else None
+            confidence = float(best_score[i]) if best is not None else 0.0
+            prediction, confidence = (None, 0.0) if not answers else self._confident_prediction_for(
+                snapshot, len(answers), best, confidence)
+            if prediction:
+                results.append(Result(prediction, confidence, None))
                 continue
             
-            # Calculate how well this question divides the remaining entities
-            yes_count = 0
-            no_count = 0
-            unknown_count = 0
+            unanswered = ~answered[i]
+            if not unanswered.any():
+                results.append(Result(None, confidence, None))
+                continue
+            qids = np.flatnonzero(said_yes[i] | said_no[i])
+            values = said_yes[i, qids].astype(np.int8)
+            qid = None
+            if snapshot.opening_book is not None and not soft[i].any():
+                qid = snapshot.opening_book.lookup_answers(qids, values)
+            if qid is None:
+                count = candidate_mass[i]
+                question_mass = (yes_mass[i] / count, no_mass[i] / count) if count > 0 else None
+                qid = int(np.argmax(self._question_scores(snapshot, unanswered, qids, values, question_mass)))
+            results.append(Result(None, confidence, snapshot.questions[qid]))
+        return results
+    
+    @staticmethod
+    def _score_rows(snapshot: ModelSnapshot, said_yes: np.ndarray, said_no: np.ndarray, soft: np.ndarray,
+                    answers: np.ndarray):
+        """
+        For a chunk of encoded answer states: each state's best match score
+        and row (-1 when no row is scored), and the yes, no and total mass of
+        its live candidates, weighted by the soft-answer prior.
+        """
+        num_states = len(said_yes)
+        # [yes answers; no answers] stacked so a block needs one product for all four pairings
+        said = np.concatenate([said_yes, said_no]).astype(np.float32)
+        has_soft = soft.any()
+        if has_soft:
+            # Per-row soft-answer likelihoods as in soft_answer_likelihood: a, 1 - a, or 0.5 for unknown
+            with np.errstate(divide="ignore"):
+                log_yes = np.where(soft, np.log(answers), 0.0)
+                log_no = np.where(soft, np.log(1.0 - answers), 0.0)
+            log_unknown = soft * np.log(0.5)
+        
+        best_score = np.full(num_states, -1.0)
+        best_row = np.full(num_states, -1, dtype=np.int64)
+        mass = np.zeros((num_states, 2 * snapshot.num_questions))
+        candidate_mass = np.zeros(num_states)
+        block = max(64, BATCH_BLOCK_CELLS // max(snapshot.num_questions, num_states))
+        for start in range(0, snapshot.num_rows, block):
+            rows = snapshot.matrix[start:start + block]
+            live = snapshot.live[start:start + block]
+            n = len(rows)
+            # (rows, 2 * questions): the rows' yes flags, then their no flags
+            flags = np.concatenate([rows == 1, rows == 0], axis=1).astype(np.float32)
+            yes, no = flags[:, :snapshot.num_questions], flags[:, snapshot.num_questions:]
+            # (2 states, 2 rows): said yes/no against stored yes/no
+            products = said @ np.concatenate([yes, no]).T
+            agree = products[:num_states, :n] + products[num_states:, n:]
+            conflicts = products[:num_states, n:] + products[num_states:, :n]
+            total = agree + conflicts
             
-            for entity in matching_entities:
-                if question in self.entities[entity]:
-                    if self.entities[entity][question] == 1:
-                        yes_count += 1
-                    else:
-                        no_count += 1
-                else:
-                    unknown_count += 1
+            scores = np.where((total > 0) & live, agree.astype(np.float64) / np.maximum(total, 1), -1.0)
+            block_best = np.argmax(scores, axis=1)
+            block_score = scores[np.arange(num_states), block_best]
+            # Strictly better only, so ties keep the lowest row as argmax over all rows would
+            better = block_score > best_score
+            best_score[better] = block_score[better]
+            best_row[better] = start + block_best[better]
             
-            # Perfect question divides the set in half
-            total = yes_count + no_count + unknown_count
-            if total > 0:
-                # Calculate how balanced the split is (closer to 0.5 is better)
-                balance = min(yes_count / total, no_count / total)
-                # Adjust by the question weight
-                question_gains[question] = balance * self.question_weights.get(question, 1.0)
+            weight = ((conflicts == 0) & live).astype(np.float32)
+            if has_soft:
+                unknown = 1.0 - yes - no
+                weight *= np.exp(log_yes @ yes.T + log_no @ no.T + log_unknown @ unknown.T).astype(np.float32)
+            mass += weight @ flags
+            candidate_mass += weight.sum(axis=1, dtype=np.float64)
+        yes_mass, no_mass = mass[:, :snapshot.num_questions], mass[:, snapshot.num_questions:]
+        return best_score, best_row, (yes_mass, no_mass, candidate_mass)
+    
+    def calculate_information_gain(self, question: str, current_entities: List[str]) -> float:
+        """
+        Calculate information gain for a question based on current possible entities
+        Higher gain = better question to ask
+        """
+        snapshot = self.snapshot
+        qid = snapshot.question_id(question)
+        if not current_entities or qid is None:
+            return 0.0
         
-        # If we have gains, return the question with highest gain
-        if question_gains:
-            return max(question_gains, key=question_gains.get)
+        # Entities we know nothing about count as unknown answers
+        rows = [r for r in map(snapshot.entity_ids.get, current_entities) if r is not None]
+        column = snapshot.matrix[rows, qid]
+        yes = np.count_nonzero(column == 1) / len(current_entities)
+        no = np.count_nonzero(column == 0) / len(current_entities)
+        
+        # Same scorer get_next_question uses, scaled by the question's weight
+        score = QUESTION_SCORERS[self.question_scorer]
+        return float(score(np.array([yes]), np.array([no]))[0] * snapshot.weights[qid])
+    
+    def get_next_question(self, answers: Dict[str, int]) -> Optional[str]:
+        """
+        Get the next most informative question to ask
+        """
+        return self.next_question_for_state(self.advance_state(answers))
+    
+    def next_question_for_state(self, state: AnswerState) -> Optional[str]:
+        """
+        Get the next most informative question for an up-to-date answer state
+        """
+        qid, _, _ = self.rank_next_question(state)
+        return state.snapshot.questions[qid] if qid is not None else None
+    
+    @timed("score_question")
+    def rank_next_question(self, state: AnswerState) -> Tuple[Optional[int], float, float]:
+        """
+        Id of the next question for an up-to-date answer state, with its
+        weighted score and the runner-up's. The margin between the two tells
+        the result cache whether a weight change could alter the choice; a
+        choice taken from the opening book reports infinite scores.
+        """
+        snapshot = state.snapshot
         
-        # Fallback to a random question sorted by weight
-        return sorted(unanswered, key=lambda q: self.question_weights.get(q, 0), reverse=True)[0]
-    
-    def _is_question_irrelevant(self, question: str, answers: Dict[str, int]) -> bool:
-        """
-        Determine if a question is irrelevant based on previous answers
-        """
-        # If user said it's not an animal, don't ask animal-specific questions
-        if "Is it an animal?" in answers and answers["Is it an animal?"] == 0:
-            animal_questions = [
-                "Does it live in water?", "Is it a mammal?", "Is it a bird?",
-                "Is it a reptile?", "Is it an insect?", "Is it a fish?",
-                "Can it fly?", "Is it a predator?", "Is it a pet?",
-                "Is it a farm animal?", "Is it wild?", "Does it have fur?",
-                "Does it have scales?", "Does it have feathers?",
-                "Is it smaller than a cat?", "Is it dangerous to humans?",
-                "Is it nocturnal?", "Does it live in a group/herd?",
-                "Is it endangered?"
-            ]
-            if question in animal_questions:
-                return True
+        # Filter questions not yet answered
+        unanswered = np.ones(snapshot.num_questions, dtype=bool)
+        unanswered[state.answered] = False
+        if not unanswered.any():
+            return None, -np.inf, -np.inf
         
-        # If user said it's not a person, don't ask person-specific questions
-        if "Is it a person?" in answers and answers["Is it a person?"] == 0:
-            person_questions = [
-                "Is this person alive?", "Is this person male?",
-                "Is this person famous?", "Is this person an actor/actress?",
-                "Is this person a musician?", "Is this person a politician?",
-                "Is this person an athlete?", "Is this person a scientist?",
-                "Is this person a writer?", "Is this person a historical figure?",
-                "Is this person American?", "Is this person European?",
-                "Is this person Asian?", "Is this person older than 50?",
-                "Is this person younger than 30?"
-            ]
-            if question in person_questions:
-                return True
+        # Early turns that follow the opening book are a dictionary lookup
+        if snapshot.opening_book is not None:
+            qid = snapshot.opening_book.lookup(state)
+            if qid is not None:
+                return qid, np.inf, np.inf
         
-        # Add similar logic for other categories
+        # Entities that match our current answers
+        live_candidates = state.live_candidates
+        mass = None
+        if len(live_candidates) > 0:
+            prior = state.prior[live_candidates] if state.prior is not None else None
+            mass = snapshot.shards.answer_mass(snapshot.matrix, live_candidates, prior)
+        scores = self._question_scores(snapshot, unanswered, state.qids, state.values, mass)
         
-        return False
+        best = int(np.argmax(scores))
+        best_score = float(scores[best])
+        scores[best] = -np.inf
+        return best, best_score, float(scores.max())
+    
+    def _question_scores(self, snapshot: ModelSnapshot, unanswered: np.ndarray, qids: np.ndarray,
+                         values: np.ndarray, mass: Optional[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        """
+        Weighted score of every question given the candidates' (yes, no)
+        answer mass, which is None when no candidates are left
+        """
+        weights = snapshot.weights
+        # Fallback: the most heavily weighted unanswered question
+        scores = np.where(unanswered, weights, -np.inf)
+        if mass is not None:
+            # Skip questions that are irrelevant based on previous answers
+            candidates = unanswered & ~snapshot.relevance.excluded(qids, values)
+            if candidates.any():
+                # Score every question at once from the candidates' yes/no mass,
+                # adjusted by the question weight
+                gains = QUESTION_SCORERS[self.question_scorer](*mass) * weights
+                scores = np.where(candidates, gains, -np.inf)
+        return scores
     
     def predict(self, answers: Dict[str, int]) -> Tuple[Optional[str], float]:
         """
@@ -383,66 +803,292 @@ class AkinatorRL:
         """
         if not answers:
             return None, 0.0
-        
-        # Calculate match scores for each entity
-        scores = {}
-        for entity, attributes in self.entities.items():
-            match_count = 0
-            total_questions = 0
-            
-            for question, answer in answers.items():
-                if question in attributes:
-                    total_questions += 1
-                    if attributes[question] == answer:
-                        match_count += 1
-            
-            if total_questions > 0:
-                scores[entity] = match_count / total_questions
-        
-        if not scores:
+        return self.predict_for_state(self.advance_state(answers))
+    
+    def predict_for_state(self, state: AnswerState) -> Tuple[Optional[str], float]:
+        """
+        Make a prediction from an up-to-date answer state
+        """
+        if not state.answers:
             return None, 0.0
-        
-        # Find the best match
-        best_entity = max(scores, key=scores.get)
-        confidence = scores[best_entity]
+        return self._confident_prediction(state, *self.best_match(state))
+    
+    def _confident_prediction(self, state: AnswerState, best: Optional[int], confidence: float) -> Tuple[Optional[str], float]:
+        return self._confident_prediction_for(state.snapshot, len(state.answers), best, confidence)
+    
+    def _confident_prediction_for(self, snapshot: ModelSnapshot, num_answers: int, best: Optional[int],
+                                  confidence: float) -> Tuple[Optional[str], float]:
+        if best is None:
+            return None, 0.0
+        best_entity = snapshot.entity_names[best]
         
         # Only return a prediction if we're confident enough AND have asked enough questions
         # Increase the minimum questions threshold from 3 to 8
         # Increase the confidence threshold from 0.7 to 0.8
-        if confidence > 0.8 and len(answers) >= 8:
+        if confidence > 0.8 and num_answers >= 8:
             return best_entity, confidence
         return None, confidence
     
+    @timed("predict")
+    def best_match(self, state: AnswerState) -> Tuple[Optional[int], float]:
+        """Row of the best-matching live entity and its match score, (None, 0.0) if nothing is scored"""
+        # Match scores only count questions the entity has an answer for
+        scored = (state.total > 0) & state.snapshot.live
+        if not scored.any():
+            return None, 0.0
+        
+        # Find the best match
+        scores = np.where(scored, state.match / np.maximum(state.total, 1), -1.0)
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+    
+    @timed("predict")
+    def predict_posterior(self, state: AnswerState) -> Tuple[Optional[str], float]:
+        """
+        Bayesian prediction from a state that tracks the posterior: the most
+        probable live entity and its posterior probability, under the same
+        thresholds as predict_for_state
+        """
+        if not state.answers or not state.snapshot.num_entities:
+            return None, 0.0
+        log_posterior = np.where(state.snapshot.live, state.log_posterior, -np.inf)
+        best = int(np.argmax(log_posterior))
+        if log_posterior[best] == -np.inf:
+            return None, 0.0
+        confidence = float(1.0 / np.exp(log_posterior - log_posterior[best]).sum())
+        return self._confident_prediction(state, best, confidence)
+    
+    @timed("score_question")
+    def rank_posterior_question(self, state: AnswerState) -> Optional[int]:
+        """
+        Id of the question with the highest expected information gain about
+        the posterior, times its weight. Only the most probable entities
+        are scored.
+        """
+        snapshot = state.snapshot
+        unanswered = np.ones(snapshot.num_questions, dtype=bool)
+        unanswered[state.answered] = False
+        # Nothing to tell apart, as in rank_next_question
+        if not unanswered.any() or not snapshot.num_entities:
+            return None
+        
+        log_posterior = np.where(snapshot.live, state.log_posterior, -np.inf)
+        top = np.flatnonzero(log_posterior >= log_posterior.max() + np.log(POSTERIOR_MIN_RATIO))
+        if len(top) > POSTERIOR_MAX_ROWS:
+            top = top[np.argpartition(log_posterior[top], -POSTERIOR_MAX_ROWS)[-POSTERIOR_MAX_ROWS:]]
+        if not len(top):
+            return int(np.argmax(np.where(unanswered, snapshot.weights, -np.inf)))
+        posterior = np.exp(log_posterior[top] - log_posterior[top].max())
+        posterior /= posterior.sum()
+        
+        candidates = unanswered & ~snapshot.relevance.excluded(state.qids, state.values)
+        if not candidates.any():
+            candidates = unanswered
+        gains = bayes.information_gain(posterior, snapshot.probabilities[top]) * snapshot.weights
+        return int(np.argmax(np.where(candidates, gains, -np.inf)))
+    
     def update_from_feedback(self, entity: str, answers: Dict[str, int], correct: bool):
         """
         Update the model based on user feedback
         """
-        if correct:
-            # Add or update entity
-            self.entities[entity] = answers
-            
-            # Slightly increase weights of questions that were asked
-            for question in answers:
-                if question in self.question_weights:
-                    self.question_weights[question] *= 1.05  # 5% increase
-        else:
-            # If prediction was wrong, slightly decrease weights of questions that were asked
-            for question in answers:
-                if question in self.question_weights:
-                    self.question_weights[question] *= 0.95  # 5% decrease
+        self.update_from_feedback_batch([(entity, answers, correct)])
+    
+    def update_from_feedback_batch(self, items: List[Tuple[str, Dict[str, int], bool]]):
+        """
+        Apply several (entity, answers, correct) feedback items as one update:
+        a single vectorized weight adjustment, one renormalization and one
+        journal write for the whole batch.
+        """
+        if not items:
+            return
+        payload = {"items": [
+            {"entity": entity, "answers": answers, "correct": correct} for entity, answers, correct in items
+        ]}
+        if not self.is_writer:
+            # The writer applies it; this process sees the result through refresh()
+            self.store.post("feedback_batch", payload)
+            return
+        with self._write_lock:
+            self._apply_feedback_batch(items)
+            self._journal("feedback_batch", payload)
+            self._compact_if_needed()
+            self._publish()
+    
+    @timed("feedback")
+    def _apply_feedback_batch(self, items: List[Tuple[str, Dict[str, int], bool]]):
+        asked = []
+        factors = []
+        for entity, answers, correct in items:
+            qids, _ = self.kb.encode(answers)
+            if correct:
+                # Add or update entity
+                self.kb.set_entity(entity, answers)
+            # Questions that were asked gain 5% on a correct guess and lose 5% on a wrong one
+            asked.append(qids)
+            factors.append(np.full(len(qids), 1.05 if correct else 0.95))
+        
+        self.kb.scale_weights(np.concatenate(asked), np.concatenate(factors))
         
         # Normalize weights to prevent extreme values
-        max_weight = max(self.question_weights.values())
+        weights = self.kb.weights
+        max_weight = weights.max()
         if max_weight > 10.0:
-            for q in self.question_weights:
-                self.question_weights[q] /= max_weight / 5.0
+            weights /= max_weight / 5.0
+    
+    def apply_retraining(self, payload: dict):
+        """
+        Install the output of an offline retraining job (see retrain.py) as
+        a new model version: {"weights": {question: weight}, "answers":
+        {entity: {question: 0 or 1}}}. Answers only fill questions the
+        entity still has no answer for when the change is applied, so
+        changes made while the job ran are kept.
+        """
+        if not self.is_writer:
+            self.store.post("retrain", payload)
+            return
+        with self._write_lock:
+            self._apply_retraining(payload)
+            self._journal("retrain", payload)
+            self._compact_if_needed()
+            self._publish()
+    
+    @timed("retrain")
+    def _apply_retraining(self, payload: dict):
+        weights = self.kb.weights.copy()
+        for question, weight in payload.get("weights", {}).items():
+            qid = self.kb.question_id(question)
+            if qid is not None:
+                weights[qid] = weight
+        self.kb.set_weights(weights)
+        for entity, answers in payload.get("answers", {}).items():
+            self.kb.fill_entity(entity, answers)
+    
+    def apply_imputation(self, answers: Dict[str, Dict[str, Tuple[int, float]]]):
+        """
+        Fill entities' unknown answers with imputed {entity: {question:
+        (answer, confidence)}} (see imputation.py) as a new model version.
+        Cells answered in the meantime are left alone.
+        """
+        payload = {"answers": answers}
+        if not self.is_writer:
+            self.store.post("impute", payload)
+            return
+        with self._write_lock:
+            self._apply_imputation(answers)
+            self._journal("impute", payload)
+            self._compact_if_needed()
+            self._publish()
+    
+    @timed("impute")
+    def _apply_imputation(self, answers: Dict[str, Dict[str, Tuple[int, float]]]):
+        self.kb.fill_entities({entity: {q: answer for q, (answer, _) in imputed.items()} for entity, imputed in answers.items()},
+                              {entity: {q: confidence for q, (_, confidence) in imputed.items()} for entity, imputed in answers.items()})
+    
+    def import_catalogue(self, chunks: Iterable[dict], replace: bool = False) -> Dict[str, int]:
+        """
+        Apply catalogue chunks (see catalogue.py), streamed in groups of
+        IMPORT_GROUP chunks so memory stays bounded however large the
+        import. Each group is journaled in one transaction and applied only
+        once that commits, so the model never holds a change the journal
+        lacks. The whole import is published as one new version. Imported
+        answers are merged into an existing entity's unless `replace` is
+        set. A read-only process posts the groups to the writer's inbox, all
+        in one transaction. Returns how many chunks, question records and
+        entity records were taken.
+        """
+        summary = {"chunks": 0, "questions": 0, "entities": 0}
         
-        # Save updated model
-        self.save()
-    
-    def add_question(self, question: str):
-        """Add a new question to the system"""
-        if question not in self.questions:
-            self.questions.append(question)
-            self.question_weights[question] = 1.0
-            self.save() 
\ No newline at end of file
+        def groups():
+            group = []
+            for chunk in chunks:
+                summary["chunks"] += 1
+                summary["questions"] += len(chunk["questions"])
+                summary["entities"] += len(chunk["entities"])
+                group.append({"questions": chunk["questions"], "entities": chunk["entities"], "replace": replace})
+                if len(group) >= IMPORT_GROUP:
+                    yield group
+                    group = []
+            if group:
+                yield group
+        
+        if not self.is_writer:
+            self.store.post_many("import", ({"chunks": group} for group in groups()))
+            return summary
+        
+        with self._write_lock:
+            for group in groups():
+                if self.store is not None:
+                    self._seq, _ = self.store.append_many("import", group)
+                    # A chunk holds many entities; weigh it by them so a large import soon gets checkpointed
+                    self._pending += sum(len(payload["entities"]) + len(payload["questions"]) for payload in group)
+                for payload in group:
+                    self._apply_import(payload)
+            self._compact_if_needed()
+            self._publish()
+            self._checkpoint_if_due()
+        return summary
+    
+    @timed("import")
+    def _apply_import(self, payload: dict):
+        # An import posted by a read-only process holds a group of chunks
+        for chunk in payload.get("chunks", [payload]):
+            self._apply_import_chunk(chunk)
+    
+    def _apply_import_chunk(self, chunk: dict):
+        kb = self.kb
+        weighted = {}
+        for question, weight in chunk["questions"].items():
+            qid = kb.add_question(question, 1.0 if weight is None else weight)
+            if weight is not None:
+                weighted[qid] = weight
+        if weighted:
+            # add_question keeps an existing question's weight, so set the imported ones explicitly
+            weights = kb.weights.copy()
+            weights[list(weighted)] = list(weighted.values())
+            kb.set_weights(weights)
+        # Answers may name new questions, or known ones spelled differently
+        canonical = {}
+        for answers in chunk["entities"].values():
+            for question in answers:
+                if question not in canonical:
+                    canonical[question] = kb.questions[kb.add_question(question)]
+        kb.update_entities({entity: {canonical[q]: answer for q, answer in answers.items()}
+                            for entity, answers in chunk["entities"].items()}, chunk["replace"])
+    
+    @property
+    def question_index(self) -> QuestionIndex:
+        """Near-duplicate index over the current questions, rebuilt when they change"""
+        questions = self.snapshot.questions
+        index = self._question_index
+        if index is None or index.questions is not questions:
+            index = self._question_index = QuestionIndex(questions)
+        return index
+    
+    def add_question(self, question: str, merge_similar: bool = True) -> Dict[str, object]:
+        """
+        Add a new question to the system unless it duplicates one. Returns
+        the outcome as "status" ("added", "exists", or "merged" when
+        `merge_similar` resolved it to a near-duplicate), the "question" it
+        resolved to and the "similar" existing questions with their
+        similarity.
+        """
+        if not normalize_question(question):
+            raise ValueError("Question is empty")
+        existing = self.snapshot.find_question(question)
+        if existing is not None:
+            return {"status": "exists", "question": existing, "similar": []}
+        similar = self.question_index.similar(question)
+        if merge_similar and similar and similar[0][1] >= MERGE_SIMILARITY:
+            return {"status": "merged", "question": similar[0][0], "similar": similar}
+        result = {"status": "added", "question": question, "similar": similar}
+        if not self.is_writer:
+            self.store.post("add_question", {"question": question})
+            return result
+        with self._write_lock:
+            qid = self.kb.add_question(question)
+            # Another request may have added it since the check above
+            if qid < self.snapshot.num_questions:
+                return {"status": "exists", "question": self.kb.questions[qid], "similar": similar}
+            self._journal("add_question", {"question": question})
+            self._publish()
+        return result
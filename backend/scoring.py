@@ -0,0 +1,67 @@
+import numpy as np
+from typing import Callable, Dict, Optional
+
+def binary_entropy(p: np.ndarray) -> np.ndarray:
+    """Entropy in bits of a yes/no answer with P(yes) = p, elementwise"""
+    p = np.clip(p, 0.0, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -(p * np.log2(p) + (1.0 - p) * np.log2(1.0 - p))
+    return np.nan_to_num(h, nan=0.0)
+
+def answer_mass(rows: np.ndarray, prior: Optional[np.ndarray] = None):
+    """
+    Probability mass of candidates answering yes and no to every question.
+
+    `rows` is the (candidates, questions) block of the answer matrix and
+    `prior` an optional per-candidate weight (uniform when omitted). Both
+    sums are a single matrix-vector product over the whole block.
+    """
+    n = rows.shape[0]
+    if n == 0:
+        zeros = np.zeros(rows.shape[1])
+        return zeros, zeros
+    if prior is None:
+        # Uniform prior: plain column counts avoid materializing a float matrix
+        yes = np.count_nonzero(rows == 1, axis=0) / n
+        no = np.count_nonzero(rows == 0, axis=0) / n
+        return yes, no
+    prior = (prior / prior.sum()).astype(np.float32)
+    yes = prior @ (rows == 1).astype(np.float32)
+    no = prior @ (rows == 0).astype(np.float32)
+    return yes.astype(np.float64), no.astype(np.float64)
+
+def expected_information_gain(yes: np.ndarray, no: np.ndarray) -> np.ndarray:
+    """
+    Expected Shannon information gain, in bits, of asking each question.
+
+    The gain is the mutual information between the answer and the entity:
+    H(answer) - E[H(answer | entity)]. Candidates with a known answer
+    contribute no conditional entropy. Candidates with an unknown answer are
+    assumed to say yes at the rate of the known candidates, so questions
+    nobody has answered score zero instead of looking like perfect splits.
+    """
+    known = yes + no
+    with np.errstate(divide="ignore", invalid="ignore"):
+        yes_rate = np.where(known > 0, yes / known, 0.5)
+    unknown = np.clip(1.0 - known, 0.0, 1.0)
+    p_yes = yes + unknown * yes_rate
+    return binary_entropy(p_yes) - unknown * binary_entropy(yes_rate)
+
+def split_balance(yes: np.ndarray, no: np.ndarray) -> np.ndarray:
+    """Legacy heuristic: the share of candidates on the smaller side of the split"""
+    return np.minimum(yes, no)
+
+# Question scorers take the yes/no mass from answer_mass and return one score per question
+QUESTION_SCORERS: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "entropy": expected_information_gain,
+    "balance": split_balance,
+}
+
+def soft_answer_likelihood(column: np.ndarray, answer: float) -> np.ndarray:
+    """
+    Likelihood of a soft answer (the player's P(yes), e.g. 0.75 for
+    "probably") for each entity, given that entity's stored answer.
+    Entities without an answer get 0.5 so they are neither favoured nor
+    ruled out.
+    """
+    return np.where(column == 1, answer, np.where(column == 0, 1.0 - answer, 0.5))
@@ -0,0 +1,185 @@
+import threading
+import time
+import uuid
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from knowledge_base import ModelSnapshot, UNKNOWN
+from scoring import soft_answer_likelihood
+import bayes
+
+class AnswerState:
+    """
+    Per-game view of the model for a sequence of answers.
+
+    Keeps the surviving candidates as sorted row ids plus per-row
+    match/total counters, all updated from the snapshot's posting index:
+    a new answer costs one membership test per survivor and one pass over
+    that question's yes/no postings instead of a rescan of every row.
+    Counters are int16 since a game never gets near 32k answers.
+
+    Answers of exactly 0 or 1 are hard and filter candidates. Anything in
+    between is a soft answer (the player's P(yes)); soft answers never rule
+    an entity out but reweight a lazily allocated per-row prior.
+
+    For Bayesian scoring the state can also keep a per-row log-posterior
+    (see bayes.py), switched on with track_posterior and then updated with
+    one vectorized add per answer.
+
+    The state is bound to the ModelSnapshot it was last synced with. Since
+    rows are append-only within an epoch, moving to a newer snapshot only
+    scores the appended rows; tombstoned rows are masked out with `live`.
+    """
+
+    def __init__(self, snapshot: ModelSnapshot):
+        self.answers: Dict[str, float] = {}
+        self.qids = np.empty(0, dtype=np.intp)
+        self.values = np.empty(0, dtype=np.int8)
+        self.soft_qids = np.empty(0, dtype=np.intp)
+        self.soft_values = np.empty(0, dtype=np.float64)
+        self.log_posterior: Optional[np.ndarray] = None
+        self._reset(snapshot)
+
+    @property
+    def answered(self) -> np.ndarray:
+        """Ids of every answered question, hard or soft"""
+        return np.concatenate([self.qids, self.soft_qids])
+
+    @property
+    def live_candidates(self) -> np.ndarray:
+        """Row ids of the candidates that are still live in the bound snapshot"""
+        return self.survivors[self.snapshot.live[self.survivors]]
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.total)
+
+    def _reset(self, snapshot: ModelSnapshot):
+        self.snapshot = snapshot
+        self.survivors = np.empty(0, dtype=np.int64)
+        self.match = np.zeros(0, dtype=np.int16)
+        self.total = np.zeros(0, dtype=np.int16)
+        self.prior: Optional[np.ndarray] = np.ones(0) if len(self.soft_qids) else None
+        if self.log_posterior is not None:
+            self.log_posterior = np.zeros(0)
+        self._score_new_rows(snapshot)
+
+    def sync(self, snapshot: ModelSnapshot):
+        """Bind to a newer snapshot, scoring only rows appended since the last sync"""
+        if snapshot.epoch != self.snapshot.epoch:
+            self._reset(snapshot)
+        elif snapshot.version > self.snapshot.version:
+            self.snapshot = snapshot
+            self._score_new_rows(snapshot)
+
+    def _score_new_rows(self, snapshot: ModelSnapshot):
+        start = self.num_rows
+        grow = snapshot.num_rows - start
+        if grow <= 0:
+            return
+        rows = snapshot.matrix[start:]
+        sub = rows[:, self.qids]
+        known = sub != UNKNOWN
+        agrees = sub == self.values
+        self.survivors = np.concatenate([self.survivors, start + np.flatnonzero(~(known & ~agrees).any(axis=1))])
+        self.match = np.concatenate([self.match, agrees.sum(axis=1, dtype=np.int16)])
+        self.total = np.concatenate([self.total, known.sum(axis=1, dtype=np.int16)])
+        if self.prior is not None:
+            prior = np.ones(grow)
+            for qid, answer in zip(self.soft_qids, self.soft_values):
+                prior *= soft_answer_likelihood(rows[:, qid], answer)
+            self.prior = np.concatenate([self.prior, prior])
+        if self.log_posterior is not None:
+            self.log_posterior = np.concatenate([self.log_posterior, self._log_posterior(snapshot.probabilities[start:])])
+
+    def _log_posterior(self, codes: np.ndarray) -> np.ndarray:
+        """Unnormalized log-posterior of a block of rows under every answer so far (uniform prior)"""
+        log_posterior = np.zeros(len(codes))
+        for qid, value in zip(self.qids, self.values):
+            log_posterior += bayes.log_likelihood(codes[:, qid], float(value))
+        for qid, answer in zip(self.soft_qids, self.soft_values):
+            log_posterior += bayes.log_likelihood(codes[:, qid], answer)
+        return log_posterior
+
+    def track_posterior(self):
+        """Start keeping the Bayesian log-posterior (a no-op when already tracked)"""
+        if self.log_posterior is None:
+            self.log_posterior = self._log_posterior(self.snapshot.probabilities[:self.num_rows])
+
+    def apply(self, question: str, answer: float):
+        """Fold a single new answer into the counters"""
+        self.answers[question] = answer
+        qid = self.snapshot.question_id(question)
+        if qid is None:
+            return
+        postings = self.snapshot.postings
+        n = self.num_rows
+        yes = postings.yes[qid].to_array(n)
+        no = postings.no[qid].to_array(n)
+        if self.log_posterior is not None:
+            observed = answer if 0 < answer < 1 else float(answer == 1)
+            self.log_posterior += bayes.log_likelihood(self.snapshot.probabilities[:n, qid], observed)
+        if 0 < answer < 1:
+            self.soft_qids = np.append(self.soft_qids, qid)
+            self.soft_values = np.append(self.soft_values, answer)
+            if self.prior is None:
+                self.prior = np.ones(n)
+            # Same factors as soft_answer_likelihood; halving first keeps them exact
+            self.prior *= 0.5
+            self.prior[yes] *= 2 * answer
+            self.prior[no] *= 2 * (1.0 - answer)
+            return
+        value = 1 if answer == 1 else 0
+        self.qids = np.append(self.qids, qid)
+        self.values = np.append(self.values, np.int8(value))
+
+        self.total[yes] += 1
+        self.total[no] += 1
+        self.match[yes if value == 1 else no] += 1
+        # Only rows that gave the opposite answer are ruled out
+        self.survivors = self.survivors[~postings.postings(qid, 1 - value).contains(self.survivors)]
+
+    def extends(self, answers: Dict[str, float]) -> bool:
+        """Whether `answers` is this state's answers plus zero or more new ones"""
+        return all(q in answers and answers[q] == a for q, a in self.answers.items())
+
+class SessionStore:
+    """Bounded LRU of in-progress games with an idle timeout"""
+
+    def __init__(self, max_sessions: int = 1024, ttl_seconds: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def take(self, session_id: Optional[str]) -> Optional[AnswerState]:
+        """
+        Check a session's state out of the store. Until it is put back, a
+        concurrent request for the same session starts from a fresh state
+        instead of mutating this one.
+        """
+        if session_id is None:
+            return None
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return None
+        state, last_used = entry
+        if time.monotonic() - last_used > self.ttl_seconds:
+            return None
+        return state
+
+    def put(self, session_id: Optional[str], state: AnswerState) -> str:
+        """Store `state` under `session_id` (a fresh id when None) and return the id"""
+        if session_id is None:
+            session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = (state, time.monotonic())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id
@@ -0,0 +1,125 @@
+"""
+Row layout and parallel scoring by top-level category.
+
+Every entity belongs to one shard: the first category of the relevance
+graph whose gate question ("Is it an animal?", "Is it a person?", ...) it
+answers yes, or a last shard for entities that answer none of them yes.
+Compaction and snapshot writes group rows by shard, so within an epoch
+each shard is one contiguous range of rows followed by an unordered
+tail of rows appended since.
+
+Answers already route a game to its shards: the posting-index filter in
+AnswerState drops every row that contradicts them, so after "Is it an
+animal?" = yes the candidates are the animal shard plus entities that
+never answered it. ShardIndex cuts such a candidate set at the shard
+boundaries; a shard that survives whole is read as a slice of the matrix
+instead of being gathered row by row, and large candidate sets are
+scored block by block on a thread pool, since NumPy's comparison and
+reduction kernels release the GIL.
+"""
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+
+from scoring import answer_mass
+
+# Candidate sets below this many cells are scored in one piece
+PARALLEL_MIN_CELLS = 1 << 20
+# Largest block of rows one pool task scores
+BLOCK_ROWS = 16384
+SCORING_THREADS = int(os.environ.get("SCORING_THREADS", min(4, os.cpu_count() or 1)))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _pool() -> Optional[ThreadPoolExecutor]:
+    global _executor
+    if _executor is None and SCORING_THREADS > 1:
+        _executor = ThreadPoolExecutor(SCORING_THREADS, thread_name_prefix="scoring")
+    return _executor
+
+def shard_keys(gate_answers: np.ndarray) -> np.ndarray:
+    """Shard of each row of a (rows, gates) answer block: the first gate answered yes, or the number of gates"""
+    if not gate_answers.shape[1]:
+        # argmax cannot run over no gates; every row is then in the lone shard 0
+        return np.zeros(len(gate_answers), dtype=np.int16)
+    yes = gate_answers == 1
+    return np.where(yes.any(axis=1), yes.argmax(axis=1), gate_answers.shape[1]).astype(np.int16)
+
+def group_rows(matrix: np.ndarray, rows: np.ndarray, gates: np.ndarray) -> np.ndarray:
+    """`rows` reordered shard by shard, keeping their order within a shard"""
+    return grouped(matrix, rows, gates)[0]
+
+def grouped(matrix: np.ndarray, rows: np.ndarray, gates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """group_rows and the ShardIndex bounds of the reordered rows laid out from row 0"""
+    if not len(gates):
+        return rows, np.array([0, len(rows)], dtype=np.int64)
+    keys = shard_keys(matrix[np.ix_(rows, gates)])
+    order = np.argsort(keys, kind="stable")
+    return rows[order], np.searchsorted(keys[order], np.arange(len(gates) + 2)).astype(np.int64)
+
+class ShardIndex:
+    """
+    Shard boundaries of one epoch's rows: shard k holds rows
+    bounds[k]:bounds[k + 1], and rows from bounds[-1] on are the tail.
+    Rows are append-only within an epoch, so snapshots of the same epoch
+    and gates share one index.
+    """
+
+    def __init__(self, gates: np.ndarray, bounds: np.ndarray):
+        self.gates = gates
+        self.bounds = bounds
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, gates: np.ndarray) -> "ShardIndex":
+        """Index the longest prefix of `matrix` whose rows are grouped by shard"""
+        keys = shard_keys(matrix[:, gates])
+        # Rows appended since the last compaction break the order and start the tail
+        breaks = np.flatnonzero(np.diff(keys) < 0)
+        grouped = int(breaks[0]) + 1 if len(breaks) else len(keys)
+        bounds = np.searchsorted(keys[:grouped], np.arange(len(gates) + 2)).astype(np.int64)
+        return cls(gates, bounds)
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """Rows per shard, tombstones included; the tail is not counted"""
+        return np.diff(self.bounds)
+
+    def blocks(self, rows: np.ndarray) -> List[Tuple[Union[slice, np.ndarray], int, int]]:
+        """
+        Sorted row ids cut at the shard boundaries and every BLOCK_ROWS, as
+        (matrix index, start, stop) with rows[start:stop] the block's rows.
+        The index is a slice when those rows are one contiguous range.
+        """
+        cuts = np.unique(np.concatenate([
+            [0, len(rows)], np.searchsorted(rows, self.bounds), np.arange(0, len(rows), BLOCK_ROWS),
+        ]))
+        blocks = []
+        for start, stop in zip(cuts[:-1].tolist(), cuts[1:].tolist()):
+            first, last = int(rows[start]), int(rows[stop - 1])
+            index = slice(first, last + 1) if last - first == stop - start - 1 else rows[start:stop]
+            blocks.append((index, start, stop))
+        return blocks
+
+    def answer_mass(self, matrix: np.ndarray, rows: np.ndarray,
+                    prior: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """scoring.answer_mass of matrix[rows] for sorted `rows`, summed over shard blocks in parallel"""
+        if len(rows) * matrix.shape[1] < PARALLEL_MIN_CELLS:
+            return answer_mass(matrix[rows], prior)
+        weights = None if prior is None else (prior / prior.sum()).astype(np.float32)
+
+        def partial(block):
+            index, start, stop = block
+            answers = matrix[index]
+            if weights is None:
+                return np.count_nonzero(answers == 1, axis=0), np.count_nonzero(answers == 0, axis=0)
+            return weights[start:stop] @ (answers == 1).astype(np.float32), weights[start:stop] @ (answers == 0).astype(np.float32)
+
+        pool = _pool()
+        blocks = self.blocks(rows)
+        parts = list(pool.map(partial, blocks) if pool is not None else map(partial, blocks))
+        yes = np.sum([part[0] for part in parts], axis=0)
+        no = np.sum([part[1] for part in parts], axis=0)
+        if weights is None:
+            return yes / len(rows), no / len(rows)
+        return yes.astype(np.float64), no.astype(np.float64)
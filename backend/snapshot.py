@@ -0,0 +1,174 @@
+"""
+Binary snapshot format for the knowledge base.
+
+Layout (little endian)::
+
+    header      magic "AKKB", format version, entity/question counts,
+                row/column capacity, then (offset, length) for each section
+    matrix      int8 [row capacity x column capacity], page aligned
+    probabilities
+                uint8 [row capacity x column capacity], page aligned
+                (learned answer probabilities, see bayes.py; added in
+                version 2, derived from the matrix for version 1 files)
+    weights     float64 [questions]
+    questions   int64 offsets [questions + 1] + UTF-8 blob
+    entities    int64 offsets [entities + 1] + UTF-8 blob
+    answer_counts
+                int64 [2 x questions], live yes and no answers per question
+    shards      int64 gate question ids [gates] + bounds [gates + 2]
+                (see shards.py; empty when written without a shard index)
+    postings    int64 directory [containers x 5] + uint16 containers
+                (see PostingIndex.to_arrays)
+
+The last three sections were added in version 3. They hold what would
+otherwise be rebuilt from every row at load. Files from older versions
+build them on first use.
+
+Every section is opened with np.memmap, so loading costs the same no
+matter how big the catalogue is and worker processes opening the same
+file share one page-cache copy. The matrix is mapped copy-on-write and
+written with spare UNKNOWN rows and columns, so new entities and
+questions land in private pages instead of forcing a full copy.
+"""
+import os
+import struct
+import numpy as np
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from knowledge_base import KnowledgeBase, ModelSnapshot, StringTable, UNKNOWN
+from postings import CHUNK_SIZE, PostingIndex
+from shards import ShardIndex, grouped
+
+MAGIC = b"AKKB"
+FORMAT_VERSION = 3
+SECTIONS = ("matrix", "probabilities", "weights", "question_offsets", "question_blob", "entity_offsets", "entity_blob",
+            "answer_counts", "shard_gates", "shard_bounds", "posting_directory", "posting_data")
+# Section lists of older format versions that can still be opened
+LEGACY_SECTIONS = {1: SECTIONS[:1] + SECTIONS[2:7], 2: SECTIONS[:7]}
+PREFIX = struct.Struct("<4sI")
+PAGE = 4096
+
+def _header(sections: Tuple[str, ...]) -> struct.Struct:
+    return struct.Struct("<4sIQQQQ" + "QQ" * len(sections))
+
+HEADER = _header(SECTIONS)
+
+def _spare(n: int, minimum: int) -> int:
+    return n + max(minimum, n // 8)
+
+def _string_table(strings: Sequence[str]) -> Tuple[np.ndarray, bytes]:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+def write_snapshot(path, snapshot: ModelSnapshot, chunk_rows: int = CHUNK_SIZE):
+    """
+    Write the live rows of `snapshot` to `path`, renumbered densely and
+    grouped by shard when the snapshot has a shard index (the caller
+    handles temp files and renames)
+    """
+    rows = snapshot.live_rows()
+    shards = getattr(snapshot, "shards", None)
+    gates, bounds = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if shards is not None:
+        gates = np.asarray(shards.gates, dtype=np.int64)
+        rows, bounds = grouped(snapshot.matrix, rows, gates)
+    num_entities, num_questions = len(rows), snapshot.num_questions
+    rows_cap = _spare(num_entities, 1024)
+    cols_cap = _spare(num_questions, 16)
+    question_offsets, question_blob = _string_table(snapshot.questions)
+    entity_offsets, entity_blob = _string_table([snapshot.entity_names[row] for row in rows])
+    # Rebuilt for the renumbered rows while the matrix is written, so opening the file needs no pass over it
+    postings = PostingIndex(num_questions)
+    answer_counts = np.zeros((2, num_questions), dtype=np.int64)
+
+    def place(position: int, sizes) -> List[Tuple[int, int]]:
+        layout = []
+        for length, align in sizes:
+            position = (position + align - 1) // align * align
+            layout.append((position, length))
+            position += length
+        return layout
+
+    matrices = place((HEADER.size + PAGE - 1) // PAGE * PAGE, [(rows_cap * cols_cap, PAGE)] * 2)
+    with open(path, "wb") as f:
+        for (offset, _), source, fill in zip(matrices, (snapshot.matrix, snapshot.probabilities), (UNKNOWN, 0)):
+            f.seek(offset)
+            for start in range(0, rows_cap, chunk_rows):
+                stop = min(start + chunk_rows, rows_cap)
+                block = np.full((stop - start, cols_cap), fill, dtype=source.dtype)
+                if start < num_entities:
+                    answers = source[rows[start:stop]]
+                    block[:len(answers), :num_questions] = answers
+                    if source is snapshot.matrix:
+                        postings.add_rows(start, answers)
+                        answer_counts[0] += np.count_nonzero(answers == 1, axis=0)
+                        answer_counts[1] += np.count_nonzero(answers == 0, axis=0)
+                f.write(block.tobytes())
+
+        posting_directory, posting_data = postings.to_arrays()
+        arrays = (
+            np.ascontiguousarray(snapshot.weights, dtype="<f8").tobytes(),
+            question_offsets.astype("<i8").tobytes(),
+            question_blob,
+            entity_offsets.astype("<i8").tobytes(),
+            entity_blob,
+            answer_counts.astype("<i8").tobytes(),
+            gates.astype("<i8").tobytes(),
+            bounds.astype("<i8").tobytes(),
+            posting_directory.astype("<i8").tobytes(),
+            posting_data.astype("<u2").tobytes(),
+        )
+        layout = matrices + place(matrices[-1][0] + matrices[-1][1], [(len(data), 8) for data in arrays])
+        for (offset, _), data in zip(layout[2:], arrays):
+            f.seek(offset)
+            f.write(data)
+        # The header goes last: its section table is only known once the postings are built
+        fields = [value for section in layout for value in section]
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, num_entities, num_questions, rows_cap, cols_cap, *fields))
+        f.flush()
+        os.fsync(f.fileno())
+
+def open_snapshot(path) -> KnowledgeBase:
+    """Map a snapshot file without reading the matrix or entity names into memory"""
+    path = Path(path)
+    with open(path, "rb") as f:
+        magic, version = PREFIX.unpack(f.read(PREFIX.size))
+        names = SECTIONS if version == FORMAT_VERSION else LEGACY_SECTIONS.get(version)
+        if magic != MAGIC or names is None:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} knowledge base snapshot")
+        f.seek(0)
+        header = _header(names).unpack(f.read(_header(names).size))
+    num_entities, num_questions, rows_cap, cols_cap = header[2:6]
+    sections = dict(zip(names, zip(header[6::2], header[7::2])))
+
+    def section(name, dtype, mode="r"):
+        offset, length = sections[name]
+        count = length // np.dtype(dtype).itemsize
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(count,))
+
+    matrix = section("matrix", np.int8, mode="c").reshape(rows_cap, cols_cap)
+    probabilities = None
+    if "probabilities" in sections:
+        probabilities = section("probabilities", np.uint8, mode="c").reshape(rows_cap, cols_cap)
+    question_table = StringTable(offsets=section("question_offsets", "<i8"), blob=section("question_blob", np.uint8))
+    entity_names = StringTable(offsets=section("entity_offsets", "<i8"), blob=section("entity_blob", np.uint8))
+    kb = KnowledgeBase.from_arrays(list(question_table), section("weights", "<f8"), entity_names, matrix, probabilities)
+    if "posting_data" in sections:
+        # Version 3 files carry the row indexes; older ones have them built on first use
+        counts = np.zeros((2, cols_cap), dtype=np.int64)
+        counts[:, :num_questions] = section("answer_counts", "<i8").reshape(2, num_questions)
+        kb.restore_indexes(
+            PostingIndex.from_arrays(num_questions, section("posting_directory", "<i8").reshape(-1, 5),
+                                     section("posting_data", "<u2", mode="c")),
+            counts,
+        )
+        bounds = section("shard_bounds", "<i8")
+        if len(bounds):
+            kb.shards = ShardIndex(np.array(section("shard_gates", "<i8"), dtype=np.intp), np.array(bounds))
+    return kb
@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, every process acts as the writer
+    fcntl = None
+
+from knowledge_base import KnowledgeBase, ModelSnapshot
+from snapshot import open_snapshot, write_snapshot
+
+class ModelStore:
+    """
+    Crash-safe persistence for the knowledge base.
+
+    Every change is appended as a small JSON delta to an SQLite journal in
+    WAL mode, so a write costs the same no matter how large the model is.
+    Periodically the full model is written to a memory-mappable snapshot
+    file (temp file + atomic rename, see snapshot.py) and the journal
+    entries it covers are dropped. Loading maps the latest snapshot and
+    replays the journal entries after it.
+
+    Several processes can share one store. The one holding the writer lock
+    (see acquire_writer) owns the journal and snapshots; the others only
+    read them and hand their changes over through the inbox table, which
+    the writer drains. Consuming inbox entries happens in the same
+    transaction as journaling them, so none is lost or applied twice.
+    """
+
+    def __init__(self, directory="model_store"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.directory / "journal.db", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS inbox (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._db.commit()
+        self._writer_lock_file = None
+
+    def acquire_writer(self) -> bool:
+        """
+        Try to become the store's single writer without blocking. The lock
+        is held until close() or process exit, so a crashed writer frees it.
+        """
+        if self._writer_lock_file is not None:
+            return True
+        if fcntl is None:
+            return True
+        f = open(self.directory / "writer.lock", "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._writer_lock_file = f
+        return True
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def snapshot_seq(self) -> int:
+        """Journal sequence number covered by the latest snapshot"""
+        with self._lock:
+            return int(self._meta("snapshot_seq") or 0)
+
+    @property
+    def last_seq(self) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT MAX(seq) FROM events").fetchone()
+            return max(row[0] or 0, int(self._meta("snapshot_seq") or 0))
+
+    def append(self, kind: str, payload: Dict[str, Any], consumed: Optional[int] = None) -> int:
+        """
+        Durably record one change and return its sequence number. `consumed`
+        removes inbox entries up to that id in the same transaction.
+        """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO events (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload))
+            )
+            if consumed is not None:
+                self._db.execute("DELETE FROM inbox WHERE id <= ?", (consumed,))
+            return cursor.lastrowid
+
+    def append_many(self, kind: str, payloads: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Record a stream of changes in one transaction, so either all of them
+        are durable or none is. Returns (last sequence number, count); the
+        sequence number is 0 when the stream was empty.
+        """
+        seq = count = 0
+        with self._lock, self._db:
+            for payload in payloads:
+                seq = self._db.execute(
+                    "INSERT INTO events (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload))
+                ).lastrowid
+                count += 1
+        return seq, count
+
+    def post(self, kind: str, payload: Dict[str, Any]):
+        """Hand a change to the writer process (used by read-only processes)"""
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO inbox (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload)))
+
+    def post_many(self, kind: str, payloads: Iterable[Dict[str, Any]]) -> int:
+        """Hand a stream of changes to the writer in one transaction; returns how many were posted"""
+        count = 0
+        with self._lock, self._db:
+            for payload in payloads:
+                self._db.execute("INSERT INTO inbox (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload)))
+                count += 1
+        return count
+
+    def inbox(self, limit: int = 256) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Oldest changes posted by other processes that the writer has not journaled yet"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, payload FROM inbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(entry_id, kind, json.loads(payload)) for entry_id, kind, payload in rows]
+
+    def events_since(self, seq: int) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, kind, payload FROM events WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        for event_seq, kind, payload in rows:
+            yield event_seq, kind, json.loads(payload)
+
+    def changes_since(self, seq: int) -> Tuple[int, List[Tuple[int, str, Dict[str, Any]]]]:
+        """
+        (snapshot_seq, journal entries after `seq`) read in one transaction, so
+        a concurrent checkpoint cannot drop entries between the two reads.
+        When `seq` is behind snapshot_seq the entries it needs may be gone, so
+        none are returned and the caller must reload the snapshot instead.
+        """
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            snapshot_seq = int(self._meta("snapshot_seq") or 0)
+            if seq < snapshot_seq:
+                return snapshot_seq, []
+            rows = self._db.execute(
+                "SELECT seq, kind, payload FROM events WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        return snapshot_seq, [(event_seq, kind, json.loads(payload)) for event_seq, kind, payload in rows]
+
+    def load_snapshot(self) -> Tuple[Optional[KnowledgeBase], int]:
+        """The latest snapshot (None for a new store) and the journal sequence number it covers"""
+        while True:
+            with self._lock:
+                name = self._meta("snapshot")
+                seq = int(self._meta("snapshot_seq") or 0)
+            if name is None:
+                return None, seq
+            if name.endswith(".npz"):
+                # Stores written before the binary format; rewritten at the next checkpoint
+                with np.load(self.directory / name, allow_pickle=False) as data:
+                    return KnowledgeBase.from_arrays(
+                        data["questions"].tolist(), data["weights"], data["entity_names"].tolist(), data["matrix"]
+                    ), seq
+            try:
+                return open_snapshot(self.directory / name), seq
+            except FileNotFoundError:
+                # The writer replaced the snapshot between the two reads; pick up the new one
+                continue
+
+    def write_snapshot(self, snapshot: ModelSnapshot, seq: int) -> bool:
+        """
+        Persist `snapshot`, which must reflect every journal entry up to and
+        including `seq`, then compact the journal. Returns False, writing
+        nothing, when the stored snapshot already covers `seq`.
+        """
+        with self._lock:
+            if not self._newer(seq):
+                return False
+        name = f"snapshot-{seq:012d}.kb"
+        tmp_path = self.directory / (name + ".tmp")
+        write_snapshot(tmp_path, snapshot)
+
+        with self._lock, self._db:
+            # Checked again in the transaction: the journal up to the stored seq may be gone already
+            if not self._newer(seq):
+                tmp_path.unlink(missing_ok=True)
+                return False
+            os.replace(tmp_path, self.directory / name)
+            previous = self._meta("snapshot")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('snapshot', ?)", (name,))
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('snapshot_seq', ?)", (str(seq),))
+            self._db.execute("DELETE FROM events WHERE seq <= ?", (seq,))
+        if previous and previous != name:
+            (self.directory / previous).unlink(missing_ok=True)
+        return True
+
+    def _newer(self, seq: int) -> bool:
+        """Whether `seq` is past the stored snapshot's, always true for a new store (call with the lock held)"""
+        return self._meta("snapshot") is None or seq > int(self._meta("snapshot_seq") or 0)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        if self._writer_lock_file is not None:
+            self._writer_lock_file.close()
+            self._writer_lock_file = None
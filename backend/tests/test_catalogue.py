@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+import pytest
+
+from catalogue import import_file
+from knowledge_base import KnowledgeBase
+from rl_model import AkinatorRL
+
+QUESTIONS = ["Is it an animal?", "Can it fly?"]
+
+@pytest.fixture
+def model():
+    kb = KnowledgeBase.from_arrays(QUESTIONS, np.array([7.5, 3.0]), ["dog", "bird"],
+                                   np.array([[1, 0], [1, 1]], dtype=np.int8))
+    return AkinatorRL(kb=kb, opening_depth=0)
+
+def write_ndjson(path, *records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return path
+
+def test_csv_import_keeps_learned_weights(model, tmp_path):
+    path = tmp_path / "cat.csv"
+    path.write_text("entity,Is it an animal?,Can it fly?,Does it swim?\nduck,1,1,1\n")
+    import_file(model, path)
+    weights = model.snapshot.weights_dict()
+    assert (weights["Is it an animal?"], weights["Can it fly?"], weights["Does it swim?"]) == (7.5, 3.0, 1.0)
+
+def test_parquet_import_keeps_learned_weights(model, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    parquet = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "cat.parquet"
+    parquet.write_table(pa.table({"entity": ["duck"], "Can it fly?": pa.array([1], pa.int8())}), path)
+    import_file(model, path)
+    assert model.snapshot.weights_dict()["Can it fly?"] == 3.0
+
+def test_ndjson_question_record_sets_weight(model, tmp_path):
+    path = write_ndjson(tmp_path / "cat.ndjson", {"question": "Can it fly?", "weight": 1.25}, {"question": "Is it an animal?"})
+    import_file(model, path)
+    weights = model.snapshot.weights_dict()
+    assert (weights["Can it fly?"], weights["Is it an animal?"]) == (1.25, 7.5)
+
+@pytest.mark.parametrize("weight", ["NaN", "Infinity", "-Infinity", "0", "-2", "true", "\"3\""])
+def test_ndjson_rejects_invalid_weight(model, tmp_path, weight):
+    path = tmp_path / "cat.ndjson"
+    path.write_text('{"entity": "duck", "answers": {"Can it fly?": 1}}\n'
+                    '{"question": "Can it fly?", "weight": ' + weight + '}\n')
+    version = model.snapshot.version
+    with pytest.raises(ValueError, match="^line 2: "):
+        import_file(model, path)
+    assert model.snapshot.version == version
+    assert model.snapshot.weights_dict()["Can it fly?"] == 3.0
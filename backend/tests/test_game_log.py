@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow")
+from game_log import GameLog, part_files, read_part
+
+def test_failed_flush_keeps_the_games(tmp_path, monkeypatch):
+    log = GameLog(tmp_path, flush_rows=1000)
+    log.record("duck", {"Can it fly?": 1, "Does it swim?": 1}, correct=True)
+
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        log.flush()
+    assert len(log) == 2 and log.stats["errors"] == 1
+    assert list(tmp_path.iterdir()) == []
+
+    log.record("dog", {"Can it fly?": 0}, correct=False)
+    monkeypatch.undo()
+    parts = [log.flush()]
+    assert part_files(tmp_path) == parts and len(log) == 0
+    assert list(read_part(parts[0])["entity"]) == ["duck", "duck", "dog"]
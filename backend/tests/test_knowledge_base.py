@@ -0,0 +1,45 @@
+import pickle
+
+import numpy as np
+
+from knowledge_base import KnowledgeBase
+from rl_model import AkinatorRL
+
+def test_answers_to_a_variant_spelling_are_kept():
+    kb = KnowledgeBase(["Is it a mammal?", "Can it fly?"])
+    row = kb.set_entity("whale", {"is it a MAMMAL": 1, "Can it fly ?": 0, "Is it purple?": 1})
+    assert kb.publish().to_dict(np.array([row])) == {"whale": {"Is it a mammal?": 1, "Can it fly?": 0}}
+
+def test_legacy_pickles_with_variant_spellings_seed_the_store(tmp_path):
+    questions = ["Is it an animal?", "Is it a mammal?", "Is it a Mammal"]
+    with open(tmp_path / "questions.pkl", "wb") as f:
+        pickle.dump((questions, {question: 1.0 for question in questions}), f)
+    with open(tmp_path / "entities.pkl", "wb") as f:
+        pickle.dump({"whale": {"Is it an animal?": 1, "is it a MAMMAL": 1},
+                     "shark": {"Is it an animal?": 1, "Is it a Mammal": 0}}, f)
+    model = AkinatorRL(questions_file=tmp_path / "questions.pkl", entities_file=tmp_path / "entities.pkl",
+                       store_dir=tmp_path / "model_store", opening_depth=0)
+    try:
+        assert model.questions == ["Is it an animal?", "Is it a mammal?"]
+        assert model.snapshot.to_dict() == {
+            "whale": {"Is it an animal?": 1, "Is it a mammal?": 1},
+            "shark": {"Is it an animal?": 1, "Is it a mammal?": 0},
+        }
+    finally:
+        model.store.close()
+
+def test_information_gain_reads_the_published_snapshot():
+    kb = KnowledgeBase.from_arrays(["Is it an animal?", "Can it fly?"], np.array([1.0, 2.0]), ["duck", "dog"],
+                                   np.array([[1, 1], [1, 0]], dtype=np.int8))
+    model = AkinatorRL(kb=kb, opening_depth=0)
+    assert model.calculate_information_gain("Can it fly?", ["duck", "dog", "ghost"]) > 0
+    # The update re-adds dog under a new row; the next snapshot maps the name there
+    model.update_from_feedback("dog", {"Can it fly?": 1}, True)
+    assert model.snapshot.entity_ids == {"duck": 0, "dog": 2}
+    assert model.calculate_information_gain("Can it fly?", ["duck", "dog", "ghost"]) == 0
+
+def test_model_without_category_gates_builds():
+    kb = KnowledgeBase.from_arrays(["Can it fly?", "Is it big?"], np.array([1.0, 1.0]), ["duck", "dog"],
+                                   np.array([[1, 0], [0, 1]], dtype=np.int8))
+    model = AkinatorRL(kb=kb, opening_depth=0)
+    assert model.get_next_question({"Can it fly?": 0}) == "Is it big?"
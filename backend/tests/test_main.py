@@ -0,0 +1,33 @@
+import importlib
+import sys
+
+import pytest
+
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # main opens its store and game log on import; keep both out of the source tree
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MODEL_STORE", str(tmp_path / "model_store"))
+    sys.modules.pop("main", None)
+    main = importlib.import_module("main")
+    with TestClient(main.app) as client:
+        # /predict answers 503 until the model has loaded, whatever the body
+        assert main.rl_model.ready.wait(30)
+        yield client
+    sys.modules.pop("main", None)
+
+@pytest.mark.parametrize("answer", ["NaN", "Infinity", "-Infinity", "-0.5", "1.5"])
+def test_invalid_answers_are_rejected_everywhere(client, answer):
+    headers = {"Content-Type": "application/json"}
+    bodies = {
+        "/predict": '{"answers": {"Can it fly?": %s}}' % answer,
+        "/predict/batch": '{"states": [{"Can it fly?": %s}]}' % answer,
+        "/feedback": '{"entity": "duck", "correct": true, "answers": {"Can it fly?": %s}}' % answer,
+    }
+    for path, body in bodies.items():
+        response = client.post(path, content=body, headers=headers)
+        assert response.status_code == 422, path
+        assert response.json()["detail"][0]["loc"][-1] == "Can it fly?"
@@ -17,9 +17,35 @@ export default function AdminPage() {
   const fetchData = async () => {
     setLoading(true);
     try {
-      const response = await axios.get("http://127.0.0.1:8000/admin/data");
-      setQuestions(response.data.questions);
-      setEntities(response.data.entities);
+      // Entities come a page at a time, keyed by row; follow `next` until there is none.
+      // A Map keeps adding a page cheap. A 409 means the catalogue was compacted, so start over.
+      let after: number | null = null;
+      let epoch: number | null = null;
+      let loaded = new Map<string, Record<string, number>>();
+      while (true) {
+        const response = await axios.get<{
+          questions: string[];
+          entities: Record<string, Record<string, number>>;
+          epoch: number;
+          next: number | null;
+        }>("http://127.0.0.1:8000/admin/data", {
+          params: after === null ? { limit: 1000 } : { after, epoch, limit: 1000 },
+          validateStatus: (status) => status === 200 || status === 409,
+        });
+        if (response.status === 409) {
+          after = null;
+          loaded = new Map();
+          continue;
+        }
+        setQuestions(response.data.questions);
+        for (const [entity, answers] of Object.entries(response.data.entities)) {
+          loaded.set(entity, answers);
+        }
+        if (response.data.next === null) break;
+        epoch = response.data.epoch;
+        after = response.data.next;
+      }
+      setEntities(Object.fromEntries(loaded));
     } catch (error) {
       console.error("Error fetching data:", error);
     } finally {
@@ -31,10 +57,15 @@ export default function AdminPage() {
     if (!newQuestion.trim()) return;
     
     try {
-      await axios.post("http://127.0.0.1:8000/add-question", null, {
+      const response = await axios.post("http://127.0.0.1:8000/add-question", null, {
         params: { question: newQuestion }
       });
-      setMessage(`Question "${newQuestion}" added successfully!`);
+      const { status, question } = response.data;
+      if (status === "added") {
+        setMessage(`Question "${question}" added successfully!`);
+      } else {
+        setMessage(`"${newQuestion}" is already asked as "${question}".`);
+      }
       setNewQuestion("");
       fetchData();
       
@@ -5,7 +5,7 @@ import Image from "next/image";
 
 export default function Home() {
   const [answers, setAnswers] = useState<Record<string, number>>({});
-  const [question, setQuestion] = useState<string>("Is it an animal?");
+  const [question, setQuestion] = useState<string>("");
   const [result, setResult] = useState<string>("");
   const [confidence, setConfidence] = useState<number>(0);
   const [isLoading, setIsLoading] = useState<boolean>(false);
@@ -14,6 +14,7 @@ export default function Home() {
   const [gameCount, setGameCount] = useState<number>(0);
   const [showIntro, setShowIntro] = useState<boolean>(true);
   const [debugInfo, setDebugInfo] = useState<any>(null);
+  const [sessionId, setSessionId] = useState<string | null>(null);
 
   const handleAnswer = async (answer: boolean) => {
     setIsLoading(true);
@@ -21,7 +22,11 @@ export default function Home() {
     setAnswers(newAnswers);
 
     try {
-      const response = await axios.post("http://127.0.0.1:8000/predict", { answers: newAnswers });
+      const response = await axios.post("http://127.0.0.1:8000/predict", {
+        answers: newAnswers,
+        session_id: sessionId
+      });
+      setSessionId(response.data.session_id || null);
       
       if (response.data.prediction) {
         setResult(response.data.prediction);
@@ -64,18 +69,35 @@ export default function Home() {
     }
   };
 
+  // The backend picks the opening question, so games follow its precomputed opening book
+  const fetchFirstQuestion = async () => {
+    setIsLoading(true);
+    try {
+      const response = await axios.post("http://127.0.0.1:8000/predict", { answers: {} });
+      setSessionId(response.data.session_id || null);
+      setQuestion(response.data.next_question || "");
+    } catch (error) {
+      console.error("Error fetching the first question:", error);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   const resetGame = () => {
     setAnswers({});
-    setQuestion("Is it an animal?");
+    setSessionId(null);
+    setQuestion("");
     setResult("");
     setConfidence(0);
     setFeedback("");
     setUserEntity("");
     setGameCount(prev => prev + 1);
+    fetchFirstQuestion();
   };
 
   const startGame = () => {
     setShowIntro(false);
+    fetchFirstQuestion();
   };
 
   const toggleDebug = async () => {